@@ -0,0 +1,195 @@
+"""
+Adaptive Batcher
+
+Sizes request batches (Graph API id lookups and insights pages, Supabase
+selects and upserts) from what the requests actually cost, instead of fixed
+batch sizes:
+- payload bytes: the average item size is tracked, and a batch is kept under
+  the byte budget of its request (response size, URL length, request body);
+- latency: the batch grows while requests finish within the target latency
+  and shrinks when they are slow;
+- errors: a timeout or a "reduce the amount of data" error halves the batch,
+  and the caller retries the same items in smaller batches.
+
+Batchers are shared per purpose within the process (get_batcher), so what one
+sync learns about a request type is used by the next.
+"""
+
+import json
+import math
+import threading
+from typing import Dict, Any, Optional, Sequence
+
+import httpx
+import requests
+
+# Messages of errors that mean "the request was too big", not "the data is bad"
+OVERSIZED_ERROR_MESSAGES = (
+    'reduce the amount of data',
+    'statement timeout',
+    'request entity too large',
+    'uri too long',
+    'url too long'
+)
+
+# HTTP statuses for a request that was too large or took too long
+OVERSIZED_HTTP_STATUSES = {'408', '413', '414', '504'}
+
+# Postgres: statement timeout / query canceled
+OVERSIZED_SQLSTATES = {'57014'}
+
+
+def is_oversized_error(error: BaseException) -> bool:
+    """
+    Returns True if the error means the batch was too large or too slow, so
+    retrying it in smaller batches can succeed.
+    """
+    # Read timeouts only: a connect timeout says nothing about the batch
+    if isinstance(error, (requests.ReadTimeout, httpx.ReadTimeout)):
+        return True
+
+    code = str(getattr(error, 'code', '') or '')
+    if code in OVERSIZED_SQLSTATES or code in OVERSIZED_HTTP_STATUSES:
+        return True
+
+    # FacebookRequestError: HTTP status and the API error message
+    http_status = getattr(error, 'http_status', None)
+    if callable(http_status) and str(http_status()) in OVERSIZED_HTTP_STATUSES:
+        return True
+    api_message = getattr(error, 'api_error_message', None)
+    message = str(api_message() if callable(api_message) else '') + ' ' + str(error)
+    message = message.lower()
+    return any(text in message for text in OVERSIZED_ERROR_MESSAGES)
+
+
+def estimate_bytes(items: Sequence[Any], sample: int = 3) -> int:
+    """
+    Estimates the JSON size of a list of items from a few of them.
+    """
+    if not items:
+        return 0
+    step = max(1, len(items) // sample)
+    picked = items[::step][:sample]
+    sampled = sum(len(json.dumps(item, default=str)) for item in picked)
+    return int(sampled / len(picked) * len(items))
+
+
+class AdaptiveBatcher:
+    """
+    Batch size controller for one kind of request. Thread-safe.
+
+    The size grows by `growth` after a request faster than target_latency_seconds,
+    shrinks by `shrink` after one slower than twice the target, is halved on an
+    oversized error, and never exceeds what fits in max_payload_bytes at the
+    observed average item size.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        initial_size: int,
+        min_size: int = 1,
+        max_size: int = 1000,
+        target_latency_seconds: float = 1.0,
+        max_payload_bytes: Optional[int] = None,
+        growth: float = 1.25,
+        shrink: float = 0.7,
+        bytes_smoothing: float = 0.3
+    ):
+        self.name = name
+        self.min_size = min_size
+        self.max_size = max_size
+        self.target_latency_seconds = target_latency_seconds
+        self.max_payload_bytes = max_payload_bytes
+        self.growth = growth
+        self.shrink = shrink
+        self.bytes_smoothing = bytes_smoothing
+
+        self._lock = threading.Lock()
+        self._size = float(min(max(initial_size, min_size), max_size))
+        self._item_bytes: Optional[float] = None
+        self._stats = {'batches': 0, 'items': 0, 'seconds': 0.0, 'oversized_errors': 0}
+
+    @property
+    def size(self) -> int:
+        """
+        Size of the next batch.
+        """
+        with self._lock:
+            return self._capped_size()
+
+    def _capped_size(self) -> int:
+        size = int(self._size)
+        if self.max_payload_bytes and self._item_bytes:
+            size = min(size, int(self.max_payload_bytes / self._item_bytes))
+        return max(self.min_size, min(size, self.max_size))
+
+    def record(self, items: int, seconds: float, payload_bytes: Optional[int] = None) -> None:
+        """
+        Feeds back a successful request of `items` items.
+        """
+        if items <= 0:
+            return
+        with self._lock:
+            self._stats['batches'] += 1
+            self._stats['items'] += items
+            self._stats['seconds'] += seconds
+
+            if payload_bytes:
+                per_item = payload_bytes / items
+                if self._item_bytes is None:
+                    self._item_bytes = per_item
+                else:
+                    self._item_bytes += self.bytes_smoothing * (per_item - self._item_bytes)
+
+            # Only full-size batches say something about the current size
+            # (the last, partial batch of a list is not a signal to grow)
+            if seconds <= self.target_latency_seconds:
+                size = self._capped_size()
+                if items >= size:
+                    self._size = min(self.max_size, max(size * self.growth, size + 1))
+            elif seconds > 2 * self.target_latency_seconds:
+                self._size = max(self.min_size, min(self._size, items) * self.shrink)
+
+    def record_oversized(self, items: int) -> bool:
+        """
+        Feeds back an oversized error (timeout, "reduce the amount of data") for
+        a batch of `items` items. Returns True if the batch can be retried
+        smaller, False if it already was at the minimum size.
+        """
+        with self._lock:
+            self._stats['oversized_errors'] += 1
+            if items <= self.min_size:
+                return False
+            self._size = max(self.min_size, math.floor(min(self._size, items) / 2))
+            return True
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            stats: Dict[str, Any] = dict(self._stats)
+            stats['size'] = self._capped_size()
+            stats['avg_item_bytes'] = round(self._item_bytes) if self._item_bytes else None
+        stats['seconds'] = round(stats['seconds'], 3)
+        return stats
+
+
+_batchers: Dict[str, AdaptiveBatcher] = {}
+_batchers_lock = threading.Lock()
+
+
+def get_batcher(name: str, **defaults: Any) -> AdaptiveBatcher:
+    """
+    Returns the process-wide batcher `name`, created with `defaults` on first use.
+    """
+    with _batchers_lock:
+        batcher = _batchers.get(name)
+        if batcher is None:
+            batcher = _batchers[name] = AdaptiveBatcher(name, **defaults)
+        return batcher
+
+
+def get_batcher_stats() -> Dict[str, Dict[str, Any]]:
+    with _batchers_lock:
+        batchers = list(_batchers.values())
+    return {b.name: b.stats() for b in batchers}
+
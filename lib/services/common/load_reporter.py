@@ -0,0 +1,290 @@
+"""
+Load Reporter
+
+Tracks how busy this worker instance is, for readiness checks and autoscaling:
+- in-flight syncs and syncs queued for a slot (MAX_CONCURRENT_SYNCS);
+- Meta throttle state, from the usage headers of Graph API responses
+  (X-App-Usage, X-Ad-Account-Usage, X-Business-Use-Case-Usage) and from
+  rate-limit errors seen by the fetcher;
+- recent durations of each sync stage.
+
+The instance reports not-ready when its sync load (in-flight + queued syncs
+over capacity) reaches READY_LOAD_THRESHOLD, or while Meta is throttling the
+app, so the load balancer sends new syncs to other instances. Liveness
+(/health) is not affected.
+
+Only app-wide usage (X-App-Usage) and app-level rate-limit errors affect
+readiness: every instance shares the same app quota, while ad account, user and
+business use case limits only concern the accounts involved, and another
+instance would be throttled on them just the same. Those are reported in /load
+only.
+
+A usage report counts until the time to regain access it announces; a high
+usage without one counts for META_USAGE_VALIDITY_SECONDS, so an instance that
+stopped calling Meta because it was not ready does not stay not-ready on its
+last report.
+
+Configuration (environment variables):
+    MAX_CONCURRENT_SYNCS          syncs run at once, others wait (default: 0 = no limit)
+    READY_SYNC_CAPACITY           syncs counted as full load when there is no limit (default: 8)
+    READY_LOAD_THRESHOLD          load (0-1+) at which the instance is not ready (default: 1.0)
+    READY_META_USAGE_THRESHOLD    Meta usage % at which the instance is not ready (default: 90)
+    META_USAGE_VALIDITY_SECONDS   how long a usage report without regain time counts (default: 60)
+    META_USAGE_WINDOW_SECONDS     how long usage reports are kept for /load (default: 300)
+"""
+
+import json
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from typing import Deque, Dict, List, Any, Iterator, Tuple
+
+# Durations kept per stage for the recent latency percentiles
+STAGE_SAMPLES = 200
+
+# Usage key of X-App-Usage, the only usage shared by every instance
+APP_USAGE_KEY = 'app'
+
+
+def _percentile(ordered: List[float], p: float) -> float:
+    k = (len(ordered) - 1) * p / 100.0
+    lower = int(k)
+    upper = min(lower + 1, len(ordered) - 1)
+    return ordered[lower] + (ordered[upper] - ordered[lower]) * (k - lower)
+
+
+def parse_meta_usage(headers: Dict[str, str], path: str = '') -> List[Tuple[str, float, float]]:
+    """
+    Extracts (key, usage %, seconds until access is regained) from Graph API usage headers.
+
+    Usage is the highest of the reported percentages (call count, CPU time,
+    total time, account utilisation); a non-zero time to regain access means
+    calls are currently being rejected.
+    """
+    usages: List[Tuple[str, float, float]] = []
+    for name in ('x-app-usage', 'x-ad-account-usage', 'x-business-use-case-usage'):
+        raw = headers.get(name)
+        if not raw:
+            continue
+        try:
+            usages.extend(_parse_usage_header(name, json.loads(raw), path))
+        except (ValueError, TypeError, AttributeError):
+            # Malformed header: ignore it rather than fail the request hook
+            continue
+    return usages
+
+
+def _parse_usage_header(name: str, value: Any, path: str) -> List[Tuple[str, float, float]]:
+    usages: List[Tuple[str, float, float]] = []
+    if name == 'x-business-use-case-usage' and isinstance(value, dict):
+        for business_id, entries in value.items():
+            for entry in entries if isinstance(entries, list) else []:
+                pct = max(float(entry.get(k) or 0) for k in ('call_count', 'total_cputime', 'total_time'))
+                regain = float(entry.get('estimated_time_to_regain_access') or 0) * 60
+                usages.append((f"buc:{business_id}:{entry.get('type')}", pct, regain))
+    elif name == 'x-ad-account-usage' and isinstance(value, dict):
+        parts = path.strip('/').split('/')
+        account = parts[1] if len(parts) > 1 else ''
+        pct = float(value.get('acc_id_util_pct') or 0)
+        regain = float(value.get('reset_time_duration') or 0) if pct >= 100 else 0.0
+        usages.append((f"account:{account}", pct, regain))
+    elif isinstance(value, dict):
+        pct = max(float(value.get(k) or 0) for k in ('call_count', 'total_cputime', 'total_time'))
+        usages.append((APP_USAGE_KEY, pct, 0.0))
+    return usages
+
+
+class LoadReporter:
+    """
+    Load counters of this instance. Thread-safe.
+    """
+
+    def __init__(
+        self,
+        max_concurrent_syncs: int = 0,
+        sync_capacity: int = 8,
+        load_threshold: float = 1.0,
+        meta_usage_threshold: float = 90.0,
+        usage_validity_seconds: float = 60.0,
+        usage_window_seconds: float = 300.0
+    ):
+        self.max_concurrent_syncs = max_concurrent_syncs
+        self.capacity = max_concurrent_syncs or sync_capacity
+        self.load_threshold = load_threshold
+        self.meta_usage_threshold = meta_usage_threshold
+        self.usage_validity_seconds = usage_validity_seconds
+        self.usage_window_seconds = usage_window_seconds
+
+        self._lock = threading.Lock()
+        self._slots = threading.Semaphore(max_concurrent_syncs) if max_concurrent_syncs > 0 else None
+        self._in_flight = 0
+        self._queued = 0
+        # key -> (usage %, throttled until (monotonic), reported at (monotonic))
+        self._meta_usage: Dict[str, Tuple[float, float, float]] = {}
+        self._rate_limited_until = 0.0
+        self._rate_limit_errors = 0
+        self._account_rate_limit_errors = 0
+        self._stages: Dict[str, Deque[float]] = {}
+
+    @classmethod
+    def from_env(cls) -> 'LoadReporter':
+        return cls(
+            max_concurrent_syncs=int(os.environ.get('MAX_CONCURRENT_SYNCS', 0)),
+            sync_capacity=int(os.environ.get('READY_SYNC_CAPACITY', 8)),
+            load_threshold=float(os.environ.get('READY_LOAD_THRESHOLD', 1.0)),
+            meta_usage_threshold=float(os.environ.get('READY_META_USAGE_THRESHOLD', 90)),
+            usage_validity_seconds=float(os.environ.get('META_USAGE_VALIDITY_SECONDS', 60)),
+            usage_window_seconds=float(os.environ.get('META_USAGE_WINDOW_SECONDS', 300))
+        )
+
+    # ---------------------------------------------------------
+    # Syncs
+    # ---------------------------------------------------------
+
+    @contextmanager
+    def sync_slot(self) -> Iterator[None]:
+        """
+        Counts a sync as in flight for the duration of the block, waiting for a
+        free slot first when MAX_CONCURRENT_SYNCS is set.
+        """
+        if self._slots is not None:
+            with self._lock:
+                self._queued += 1
+            try:
+                self._slots.acquire()
+            finally:
+                with self._lock:
+                    self._queued -= 1
+        with self._lock:
+            self._in_flight += 1
+        try:
+            yield
+        finally:
+            with self._lock:
+                self._in_flight -= 1
+            if self._slots is not None:
+                self._slots.release()
+
+    def record_stage(self, stage: str, seconds: float) -> None:
+        with self._lock:
+            samples = self._stages.get(stage)
+            if samples is None:
+                samples = self._stages[stage] = deque(maxlen=STAGE_SAMPLES)
+            samples.append(seconds)
+
+    # ---------------------------------------------------------
+    # Meta throttling
+    # ---------------------------------------------------------
+
+    def record_meta_response(self, record: Dict[str, Any]) -> None:
+        """
+        Request listener for http_transport: keeps the usage reported by Meta.
+        """
+        usages = parse_meta_usage(record.get('usage_headers') or {}, record.get('path') or '')
+        if not usages:
+            return
+        now = time.monotonic()
+        with self._lock:
+            for key, pct, regain_seconds in usages:
+                self._meta_usage[key] = (pct, now + regain_seconds, now)
+            # Bound the map: forget reports older than the window (and no longer throttled)
+            if len(self._meta_usage) > 1000:
+                cutoff = now - self.usage_window_seconds
+                self._meta_usage = {
+                    k: v for k, v in self._meta_usage.items() if v[2] >= cutoff or v[1] > now
+                }
+
+    def record_rate_limit(self, wait_seconds: float, app_wide: bool = True) -> None:
+        """
+        Called when Meta rejected a call for rate limiting (the caller backs off for wait_seconds).
+        Only app-wide limits throttle the instance; per-account, per-user and
+        business use case limits are counted for /load.
+        """
+        with self._lock:
+            if not app_wide:
+                self._account_rate_limit_errors += 1
+                return
+            self._rate_limit_errors += 1
+            self._rate_limited_until = max(self._rate_limited_until, time.monotonic() + wait_seconds)
+
+    def _meta_state(self, now: float) -> Dict[str, Any]:
+        cutoff = now - self.usage_window_seconds
+        recent = {k: v for k, v in self._meta_usage.items() if v[2] >= cutoff or v[1] > now}
+
+        # App-wide usage: a report counts until access is regained, or for the validity period
+        app_usage = 0.0
+        app = self._meta_usage.get(APP_USAGE_KEY)
+        if app is not None and (app[1] > now or now - app[2] < self.usage_validity_seconds):
+            app_usage = app[0]
+        throttled_until = max(self._rate_limited_until, app[1] if app is not None else 0.0)
+        regain_seconds = max(0.0, throttled_until - now)
+
+        # Per-account usage (ad account, business use case): reported, not used for readiness
+        accounts = {
+            key: {
+                'usage_pct': round(pct, 1),
+                'regain_access_seconds': round(max(0.0, until - now), 1)
+            }
+            for key, (pct, until, _) in recent.items()
+            if key != APP_USAGE_KEY and (until > now or pct >= self.meta_usage_threshold)
+        }
+
+        return {
+            'throttled': regain_seconds > 0 or app_usage >= self.meta_usage_threshold,
+            'max_usage_pct': round(app_usage, 1),
+            'regain_access_seconds': round(regain_seconds, 1),
+            'rate_limit_errors': self._rate_limit_errors,
+            'account_rate_limit_errors': self._account_rate_limit_errors,
+            'usage_reports': len(recent),
+            'account_usage': accounts
+        }
+
+    # ---------------------------------------------------------
+    # Reporting
+    # ---------------------------------------------------------
+
+    def snapshot(self) -> Dict[str, Any]:
+        """
+        Returns the load report, including 'ready' and the reasons it is not.
+        """
+        now = time.monotonic()
+        with self._lock:
+            in_flight, queued = self._in_flight, self._queued
+            meta = self._meta_state(now)
+            stages = {name: sorted(samples) for name, samples in self._stages.items() if samples}
+
+        load = (in_flight + queued) / self.capacity if self.capacity else 0.0
+        reasons = []
+        if load >= self.load_threshold:
+            reasons.append(f"sync load {load:.2f} >= {self.load_threshold}")
+        if meta['throttled']:
+            reasons.append(
+                f"Meta app throttling (usage {meta['max_usage_pct']}%, "
+                f"regain access in {meta['regain_access_seconds']}s)"
+            )
+
+        return {
+            'ready': not reasons,
+            'reasons': reasons,
+            'in_flight_syncs': in_flight,
+            'queued_syncs': queued,
+            'max_concurrent_syncs': self.max_concurrent_syncs or None,
+            'capacity': self.capacity,
+            'load': round(load, 3),
+            'meta': meta,
+            'stages': {
+                name: {
+                    'count': len(ordered),
+                    'p50_ms': round(_percentile(ordered, 50) * 1000, 1),
+                    'p95_ms': round(_percentile(ordered, 95) * 1000, 1),
+                    'max_ms': round(ordered[-1] * 1000, 1)
+                }
+                for name, ordered in stages.items()
+            }
+        }
+
+
+# Process-wide reporter used by the worker
+load_reporter = LoadReporter.from_env()
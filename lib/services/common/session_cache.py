@@ -0,0 +1,96 @@
+"""
+Session Cache
+
+Remembers which users.id a Supabase session token resolved to, so endpoints
+that check the session on every request (the leaderboard) do not pay two round
+trips (auth.get_user and the users lookup) each time.
+
+- Entries expire after SESSION_CACHE_TTL_SECONDS, or when the token itself
+  expires (its 'exp' claim), whichever comes first; a revoked session is
+  therefore still accepted for at most the TTL.
+- Memory is bounded by SESSION_CACHE_MAX_ENTRIES; the least recently used
+  tokens are evicted first.
+- Tokens are kept as SHA-256 digests, never in clear.
+- Only successful lookups are cached: an invalid token is checked every time.
+"""
+
+import base64
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional, Tuple
+
+
+def _token_expiry(token: str) -> Optional[float]:
+    """
+    Returns the 'exp' claim (epoch seconds) of a JWT, without verifying it, or None.
+    """
+    try:
+        payload = token.split('.')[1]
+        claims = json.loads(base64.urlsafe_b64decode(payload + '=' * (-len(payload) % 4)))
+        return float(claims['exp'])
+    except (IndexError, ValueError, KeyError, TypeError):
+        return None
+
+
+class SessionCache:
+    """
+    Process-wide, thread-safe token -> user ID cache with a TTL and LRU eviction.
+    """
+
+    def __init__(self, max_entries: int = 10_000, ttl_seconds: float = 60.0):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        # digest -> (user ID, expires at (monotonic))
+        self._entries: 'OrderedDict[str, Tuple[int, float]]' = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _key(token: str) -> str:
+        return hashlib.sha256(token.encode('utf-8')).hexdigest()
+
+    def get(self, token: str) -> Optional[int]:
+        """
+        Returns the cached user ID of a token, or None on a miss.
+        """
+        key = self._key(token)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if time.monotonic() >= entry[1]:
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return entry[0]
+
+    def put(self, token: str, user_id: int) -> None:
+        """
+        Caches the user ID a token resolved to.
+        """
+        ttl = self.ttl_seconds
+        exp = _token_expiry(token)
+        if exp is not None:
+            ttl = min(ttl, exp - time.time())
+        if ttl <= 0:
+            return
+
+        key = self._key(token)
+        with self._lock:
+            self._entries[key] = (user_id, time.monotonic() + ttl)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+
+session_cache = SessionCache(
+    max_entries=int(os.environ.get('SESSION_CACHE_MAX_ENTRIES', 10_000)),
+    ttl_seconds=float(os.environ.get('SESSION_CACHE_TTL_SECONDS', 60))
+)
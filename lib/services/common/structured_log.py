@@ -0,0 +1,255 @@
+"""
+Structured Logging
+
+JSON logging for the sync worker, kept off the hot path:
+- records are put on an in-memory queue by the calling thread and serialized
+  and written to stdout by a background listener thread (QueueHandler /
+  QueueListener), so a sync never blocks on a stdout write;
+- disabled levels cost one level check: no record, no formatting;
+- per-batch events can be sampled (1 in LOG_BATCH_SAMPLE_EVERY is kept);
+- every record carries the correlation ids bound with log_context()
+  (sync_id, job_id, user_id, ad_account_id) by the code it was logged from.
+
+One JSON object per line, with 'severity' and 'message' keys as Cloud Logging
+expects, then the event fields.
+
+Configuration (environment variables):
+    LOG_LEVEL               DEBUG, INFO, WARNING or ERROR (default: INFO)
+    LOG_FORMAT              json or text (default: json)
+    LOG_BATCH_SAMPLE_EVERY  keep 1 in N sampled events (default: 10, 1 = keep all)
+    LOG_QUEUE_SIZE          records buffered before new ones are dropped (default: 10000)
+
+Usage:
+    log = get_logger(__name__)
+    with log_context(job_id=job_id, user_id=user_id):
+        log.debug('batch_upserted', sample=True, rows=len(batch))
+"""
+
+import atexit
+import contextvars
+import itertools
+import json
+import logging
+import os
+import queue
+import sys
+import threading
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener
+from typing import Dict, Any, Optional, Iterator
+
+# Correlation ids of the current sync (copied into every record)
+_context: contextvars.ContextVar[Dict[str, Any]] = contextvars.ContextVar('log_context', default={})
+
+ROOT_LOGGER = 'flux'
+
+_setup_lock = threading.Lock()
+_listener: Optional['_Listener'] = None
+_sample_every = 10
+_dropped = 0
+
+
+@contextmanager
+def log_context(**ids: Any) -> Iterator[Dict[str, Any]]:
+    """
+    Adds correlation ids to every record logged inside the block (nested blocks add to them).
+    """
+    merged = {**_context.get(), **{k: v for k, v in ids.items() if v is not None}}
+    token = _context.set(merged)
+    try:
+        yield merged
+    finally:
+        _context.reset(token)
+
+
+class _ContextQueueHandler(QueueHandler):
+    """
+    Captures, in the logging thread, what the listener cannot read later:
+    the correlation ids and the exception traceback.
+    """
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        record.context = _context.get()
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        global _dropped
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            # Never block a sync on logging; the count is reported once the queue drains
+            _dropped += 1
+
+
+class _Listener(QueueListener):
+
+    def enqueue_sentinel(self) -> None:
+        # Wait for room: with a full queue, put_nowait would lose the stop signal
+        self.queue.put(self._sentinel)
+
+
+class JsonFormatter(logging.Formatter):
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry: Dict[str, Any] = {
+            'time': datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec='milliseconds'),
+            'severity': record.levelname,
+            'message': record.msg,
+            'logger': record.name
+        }
+        entry.update(getattr(record, 'context', None) or {})
+        entry.update(getattr(record, 'fields', None) or {})
+        if record.exc_text:
+            entry['exception'] = record.exc_text
+        return json.dumps(entry, default=str)
+
+
+class TextFormatter(logging.Formatter):
+    """
+    One readable line per record, for local runs.
+    """
+
+    def format(self, record: logging.LogRecord) -> str:
+        fields = {**(getattr(record, 'context', None) or {}), **(getattr(record, 'fields', None) or {})}
+        line = f"{record.levelname:<7} {record.msg}"
+        if fields:
+            line += ' ' + ' '.join(f"{k}={v}" for k, v in fields.items())
+        if record.exc_text:
+            line += '\n' + record.exc_text
+        return line
+
+
+class _DropReporter(logging.Handler):
+    """
+    Writes a warning line when records were dropped because the queue was full.
+    """
+
+    def __init__(self, target: logging.Handler):
+        super().__init__()
+        self.target = target
+
+    def emit(self, record: logging.LogRecord) -> None:
+        global _dropped
+        self.target.handle(record)
+        if _dropped:
+            dropped, _dropped = _dropped, 0
+            notice = logging.LogRecord(ROOT_LOGGER, logging.WARNING, __file__, 0, 'log_records_dropped', None, None)
+            notice.fields = {'dropped': dropped}
+            self.target.handle(notice)
+
+
+def configure_logging(
+    level: Optional[str] = None,
+    fmt: Optional[str] = None,
+    sample_every: Optional[int] = None,
+    queue_size: Optional[int] = None,
+    stream=None
+) -> None:
+    """
+    (Re)configures the 'flux' logger hierarchy. Called lazily with the
+    environment configuration; call it explicitly to override the settings.
+    """
+    global _listener, _sample_every
+    level = (level or os.environ.get('LOG_LEVEL', 'INFO')).upper()
+    fmt = fmt or os.environ.get('LOG_FORMAT', 'json')
+    sample_every = sample_every or int(os.environ.get('LOG_BATCH_SAMPLE_EVERY', 10))
+    queue_size = queue_size or int(os.environ.get('LOG_QUEUE_SIZE', 10000))
+
+    with _setup_lock:
+        if _listener is not None:
+            _listener.stop()
+
+        stream_handler = logging.StreamHandler(stream or sys.stdout)
+        stream_handler.setFormatter(TextFormatter() if fmt == 'text' else JsonFormatter())
+
+        log_queue: queue.Queue = queue.Queue(maxsize=queue_size)
+        listener = _Listener(log_queue, _DropReporter(stream_handler))
+        listener.start()
+
+        root = logging.getLogger(ROOT_LOGGER)
+        for handler in list(root.handlers):
+            root.removeHandler(handler)
+        root.addHandler(_ContextQueueHandler(log_queue))
+        root.setLevel(level)
+        root.propagate = False
+
+        _listener = listener
+        _sample_every = max(1, sample_every)
+
+
+def flush_logging() -> None:
+    """
+    Writes out every queued record (the listener is restarted afterwards).
+    """
+    with _setup_lock:
+        if _listener is not None:
+            _listener.stop()
+            _listener.start()
+
+
+def _shutdown() -> None:
+    with _setup_lock:
+        if _listener is not None:
+            _listener.stop()
+
+
+atexit.register(_shutdown)
+
+
+class StructuredLogger:
+    """
+    Logs events (a short snake_case name) with keyword fields.
+    """
+
+    def __init__(self, name: str):
+        self._logger = logging.getLogger(f"{ROOT_LOGGER}.{name}")
+        self._sample_counters: Dict[str, itertools.count] = {}
+
+    def is_enabled_for(self, level: int) -> bool:
+        return self._logger.isEnabledFor(level)
+
+    def _log(self, level: int, event: str, sample: bool, exc_info: Any, fields: Dict[str, Any]) -> None:
+        if not self._logger.isEnabledFor(level):
+            return
+        if sample and _sample_every > 1:
+            counter = self._sample_counters.get(event)
+            if counter is None:
+                counter = self._sample_counters.setdefault(event, itertools.count())
+            n = next(counter)
+            if n % _sample_every:
+                return
+            fields['sampled_1_in'] = _sample_every
+        record = self._logger.makeRecord(self._logger.name, level, '', 0, event, None, exc_info)
+        record.fields = fields
+        self._logger.handle(record)
+
+    def debug(self, event: str, sample: bool = False, **fields: Any) -> None:
+        self._log(logging.DEBUG, event, sample, None, fields)
+
+    def info(self, event: str, sample: bool = False, **fields: Any) -> None:
+        self._log(logging.INFO, event, sample, None, fields)
+
+    def warning(self, event: str, sample: bool = False, **fields: Any) -> None:
+        self._log(logging.WARNING, event, sample, None, fields)
+
+    def error(self, event: str, **fields: Any) -> None:
+        self._log(logging.ERROR, event, False, None, fields)
+
+    def exception(self, event: str, **fields: Any) -> None:
+        """
+        Logs at ERROR with the traceback of the exception being handled.
+        """
+        self._log(logging.ERROR, event, False, sys.exc_info(), fields)
+
+
+def get_logger(name: str) -> StructuredLogger:
+    if _listener is None:
+        with _setup_lock:
+            needs_setup = _listener is None
+        if needs_setup:
+            configure_logging()
+    return StructuredLogger(name)
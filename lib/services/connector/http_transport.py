@@ -0,0 +1,215 @@
+"""
+Meta Graph API HTTP Transport
+
+Shared, configurable HTTP layer for the facebook_business SDK:
+- one process-wide connection pool (urllib3, one keep-alive pool per host)
+  mounted into every API session, so TLS handshakes are paid once per socket
+  instead of once per sync;
+- explicit pool sizes, connect/read timeouts and compressed responses;
+- a hook to record latency, bytes and rate-limit usage of every Graph API request.
+
+Configuration (environment variables):
+    META_HTTP_POOL_CONNECTIONS  number of per-host pools kept (default: 10)
+    META_HTTP_POOL_MAXSIZE      keep-alive sockets per host (default: 32)
+    META_HTTP_MAX_RETRIES       retries on connection errors only (default: 2)
+    META_HTTP_CONNECT_TIMEOUT   seconds (default: 5)
+    META_HTTP_READ_TIMEOUT      seconds (default: 120)
+    META_GRAPH_URL              Graph API base URL (default: SDK default)
+"""
+
+import os
+import threading
+from typing import Dict, List, Any, Optional, Callable
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from facebook_business.api import FacebookAdsApi
+from facebook_business.session import FacebookSession
+
+from lib.services.common.structured_log import get_logger
+
+log = get_logger(__name__)
+
+
+class TransportConfig:
+    """
+    Settings of the shared Graph API transport.
+    """
+
+    def __init__(
+        self,
+        pool_connections: int = 10,
+        pool_maxsize: int = 32,
+        max_retries: int = 2,
+        connect_timeout: float = 5.0,
+        read_timeout: float = 120.0,
+        graph_url: Optional[str] = None
+    ):
+        self.pool_connections = pool_connections
+        self.pool_maxsize = pool_maxsize
+        self.max_retries = max_retries
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self.graph_url = graph_url
+
+    @classmethod
+    def from_env(cls) -> 'TransportConfig':
+        return cls(
+            pool_connections=int(os.environ.get('META_HTTP_POOL_CONNECTIONS', 10)),
+            pool_maxsize=int(os.environ.get('META_HTTP_POOL_MAXSIZE', 32)),
+            max_retries=int(os.environ.get('META_HTTP_MAX_RETRIES', 2)),
+            connect_timeout=float(os.environ.get('META_HTTP_CONNECT_TIMEOUT', 5)),
+            read_timeout=float(os.environ.get('META_HTTP_READ_TIMEOUT', 120)),
+            graph_url=os.environ.get('META_GRAPH_URL') or None
+        )
+
+
+# Signature of request listeners: called with one record per completed request
+RequestListener = Callable[[Dict[str, Any]], None]
+
+# Headers in which Meta reports rate-limit usage
+USAGE_HEADERS = ('x-app-usage', 'x-ad-account-usage', 'x-business-use-case-usage')
+
+_lock = threading.Lock()
+_config: Optional[TransportConfig] = None
+_adapter: Optional[HTTPAdapter] = None
+_listeners: List[RequestListener] = []
+_totals = {'requests': 0, 'bytes': 0, 'latency_seconds': 0.0}
+
+
+def configure_transport(config: Optional[TransportConfig] = None) -> None:
+    """
+    (Re)creates the shared connection pool. Called lazily with the environment
+    configuration; call it explicitly to override the settings.
+    """
+    global _config, _adapter
+    config = config or TransportConfig.from_env()
+    # Only connection setup is retried: Graph API calls are not all idempotent
+    retry = Retry(total=config.max_retries, connect=config.max_retries, read=0, status=0, redirect=0)
+    adapter = HTTPAdapter(
+        pool_connections=config.pool_connections,
+        pool_maxsize=config.pool_maxsize,
+        max_retries=retry,
+        pool_block=False
+    )
+    with _lock:
+        old_adapter = _adapter
+        _config, _adapter = config, adapter
+    if old_adapter is not None:
+        old_adapter.close()
+
+
+def _shared_adapter() -> HTTPAdapter:
+    if _adapter is None:
+        with _lock:
+            needs_setup = _adapter is None
+        if needs_setup:
+            configure_transport()
+    return _adapter
+
+
+def add_request_listener(listener: RequestListener) -> None:
+    """
+    Registers a callback receiving, for every Graph API response:
+    'host', 'path', 'method', 'status', 'latency_seconds', 'bytes'
+    (body size on the wire, i.e. compressed when the response was; see
+    _wire_bytes) and 'usage_headers' (Meta's rate-limit usage headers,
+    lower-cased names).
+    """
+    with _lock:
+        _listeners.append(listener)
+
+
+def remove_request_listener(listener: RequestListener) -> None:
+    with _lock:
+        if listener in _listeners:
+            _listeners.remove(listener)
+
+
+def _wire_bytes(response: requests.Response) -> int:
+    """
+    Body size as received: Content-Length, else what urllib3 read from the
+    socket. urllib3 does not count chunked bodies; for those (no
+    Content-Length) the decompressed size is the only one known.
+    """
+    content_length = response.headers.get('Content-Length')
+    if content_length and content_length.isdigit():
+        return int(content_length)
+    # Response hooks run before requests reads the body: read it first
+    body = response.content
+    tell = getattr(response.raw, 'tell', None)
+    read = tell() if tell is not None else 0
+    return read or len(body)
+
+
+def _record_response(response: requests.Response, *args, **kwargs) -> None:
+    url = urlsplit(response.url)
+    record = {
+        'host': url.netloc,
+        'path': url.path,
+        'method': response.request.method if response.request else None,
+        'status': response.status_code,
+        'latency_seconds': response.elapsed.total_seconds(),
+        'bytes': _wire_bytes(response),
+        'usage_headers': {name: response.headers[name] for name in USAGE_HEADERS if name in response.headers}
+    }
+
+    with _lock:
+        _totals['requests'] += 1
+        _totals['bytes'] += record['bytes']
+        _totals['latency_seconds'] += record['latency_seconds']
+        listeners = list(_listeners)
+
+    for listener in listeners:
+        try:
+            listener(record)
+        except Exception as e:
+            log.warning('transport_listener_failed', error=str(e))
+
+
+def get_transport_stats() -> Dict[str, Any]:
+    """
+    Returns request totals and connection pool usage since the pool was created.
+    'connections_opened' counts new sockets (each one a TCP + TLS handshake);
+    comparing it with 'requests' shows how much keep-alive reuse there is.
+    """
+    adapter = _shared_adapter()
+    connections_opened = 0
+    pools = adapter.poolmanager.pools
+    for key in list(pools.keys()):
+        pool = pools.get(key)
+        if pool is not None:
+            connections_opened += pool.num_connections
+
+    with _lock:
+        stats: Dict[str, Any] = dict(_totals)
+    stats['connections_opened'] = connections_opened
+    stats['host_pools'] = len(pools)
+    return stats
+
+
+def build_api(access_token: str) -> FacebookAdsApi:
+    """
+    Creates a Graph API client for one access token on top of the shared pool.
+
+    The SDK keeps the token in its session's default query parameters, so each
+    client gets its own requests.Session (cheap) while the sockets come from the
+    shared, thread-safe adapter.
+    """
+    adapter = _shared_adapter()
+    config = _config
+
+    session = FacebookSession(
+        access_token=access_token,
+        timeout=(config.connect_timeout, config.read_timeout)
+    )
+    session.requests.mount('https://', adapter)
+    session.requests.mount('http://', adapter)
+    session.requests.headers['Accept-Encoding'] = 'gzip, deflate'
+    session.requests.hooks['response'].append(_record_response)
+    if config.graph_url:
+        session.GRAPH = config.graph_url.rstrip('/')
+
+    return FacebookAdsApi(session)
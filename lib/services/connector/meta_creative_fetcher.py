@@ -5,34 +5,84 @@ Fetches ad-level performance data and creative assets from Meta Ads API.
 Returns data structured for dim_creatives and fact_creative_daily tables.
 """
 
+import os
 import time
 import json
 import requests
 import sys
-from typing import Dict, List, Any, Optional
-from facebook_business.api import FacebookAdsApi
-from facebook_business.adobjects.adaccount import AdAccount
+from typing import Dict, List, Any, Optional, Callable
 from facebook_business.adobjects.ad import Ad
 from facebook_business.adobjects.adcreative import AdCreative
 from facebook_business.exceptions import FacebookRequestError
 
-# Force unbuffered output for real-time logging
-sys.stdout.reconfigure(line_buffering=True) if hasattr(sys.stdout, 'reconfigure') else None
+# Add project root to path for imports
+project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..', '..'))
+if project_root not in sys.path:
+    sys.path.insert(0, project_root)
+
+from lib.services.connector.http_transport import build_api
+from lib.services.common.structured_log import get_logger
+from lib.services.common.load_reporter import load_reporter
+from lib.services.common.adaptive_batcher import get_batcher, is_oversized_error, estimate_bytes
+
+log = get_logger(__name__)
+
+# Insights pages fetched between two checkpoints of the paging cursor
+CHECKPOINT_EVERY_PAGES = 5
+
+# Ad / creative lookup batches between two checkpoints of the maps
+CHECKPOINT_EVERY_BATCHES = 10
+
+# Meta error code of the app-wide request limit, shared by every instance;
+# other rate-limit errors (17, 613, 80000-series) concern one user or account
+APP_RATE_LIMIT_ERROR_CODE = 4
+
+# Batch sizes adapt to response size and latency (see adaptive_batcher).
+# Graph API accepts at most 50 ids per lookup.
+insights_batcher = get_batcher(
+    'meta_insights_page', initial_size=100, min_size=10, max_size=500,
+    target_latency_seconds=5.0, max_payload_bytes=2_000_000
+)
+ad_batcher = get_batcher(
+    'meta_ad_lookup', initial_size=50, min_size=5, max_size=50,
+    target_latency_seconds=2.0
+)
+creative_batcher = get_batcher(
+    'meta_creative_lookup', initial_size=50, min_size=1, max_size=50,
+    target_latency_seconds=3.0, max_payload_bytes=1_500_000
+)
 
 
 def fetch_creative_performance(
     ad_account_id: str,
     access_token: str,
-    date_preset: str = 'last_3d'
+    date_preset: str = 'last_3d',
+    resume_state: Optional[Dict[str, Any]] = None,
+    on_checkpoint: Optional[Callable[[Dict[str, Any]], None]] = None,
+    on_insights_page: Optional[Callable[[int, List[Dict[str, Any]]], None]] = None
 ) -> Dict[str, List[Dict[str, Any]]]:
     """
     Fetches performance at the Ad level, maps Ads to Creatives, 
     and then fetches Creative thumbnails.
     
+    Progress is kept in a resumable state dict:
+    - 'insights_pages', 'insights_after', 'insights_complete': Step 1 paging
+    - 'ad_id_to_creative_id', 'ads_complete': Step 2 mapping
+    - 'creatives_map', 'creatives_complete': Step 3 creative details
+    The insights rows themselves are not part of the checkpointed state: each
+    page is handed to on_insights_page once, and a resumed fetch expects the
+    rows of its 'insights_pages' pages back in resume_state['insights_rows'].
+    Passing a previously checkpointed state skips the work it already covers.
+    
     Args:
         ad_account_id: Meta Ad Account ID (e.g., 'act_123456789')
         access_token: Meta API access token
         date_preset: Date preset for insights (default: 'last_3d')
+        resume_state: State from an earlier, interrupted fetch (optional)
+        on_checkpoint: Called with the current state whenever progress
+            should be persisted (optional)
+        on_insights_page: Called with (page number, rows) for every fetched
+            insights page, before the cursor past it is checkpointed (optional)
     
     Returns:
         Dictionary with two keys:
@@ -44,41 +94,98 @@ def fetch_creative_performance(
         Exception: For other errors
     """
     try:
-        # Initialize API
-        FacebookAdsApi.init(access_token=access_token)
+        # Initialize an API session for this sync only, on the shared pooled transport.
+        # It is passed explicitly to every call instead of becoming the process-wide
+        # default, so syncs with different tokens can run concurrently.
+        api = build_api(access_token)
         
         # Ensure ad_account_id has 'act_' prefix
         if not ad_account_id.startswith('act_'):
             ad_account_id = f'act_{ad_account_id}'
         
-        account = AdAccount(ad_account_id)
+        state: Dict[str, Any] = dict(resume_state or {})
+        
+        def checkpoint():
+            if on_checkpoint:
+                on_checkpoint({k: v for k, v in state.items() if k != 'insights_rows'})
 
         # ---------------------------------------------------------
         # STEP 1: Get Performance (Level = Ad)
         # Note: We CANNOT ask for 'creative_id' here. We get 'ad_id'.
+        # Pages are requested one by one so the 'after' cursor can be
+        # checkpointed and a restarted job continues where it stopped.
         # ---------------------------------------------------------
-        print(f"🔍 Step 1: Fetching ad insights...")
-        
-        insight_params = {
-            'level': 'ad',
-            'date_preset': date_preset,
-            'time_increment': 1,
-            'limit': 100  # Reduced to avoid API limits
-        }
+        insights_data = state.setdefault('insights_rows', [])
         
-        insight_fields = [
-            'ad_id', 'ad_name', 'adset_id', 'adset_name', 
-            'campaign_id', 'campaign_name',
-            'spend', 'impressions', 'clicks', 
-            'outbound_clicks', 'actions', 'action_values',
-            'date_start', 'date_stop'
-        ]
-
-        insights = account.get_insights(fields=insight_fields, params=insight_params)
-        
-        # Convert to list to avoid cursor timeout and allow processing
-        insights_data = [dict(x) for x in insights]
-        print(f"   ✅ Found {len(insights_data)} performance rows.")
+        if state.get('insights_complete'):
+            log.debug('insights_resumed', rows=len(insights_data))
+        else:
+            log.debug('insights_fetch_started')
+            
+            insight_fields = [
+                'ad_id', 'ad_name', 'adset_id', 'adset_name', 
+                'campaign_id', 'campaign_name',
+                'spend', 'impressions', 'clicks', 
+                'outbound_clicks', 'actions', 'action_values',
+                'date_start', 'date_stop'
+            ]
+            
+            insight_params = {
+                'level': 'ad',
+                'date_preset': date_preset,
+                'time_increment': 1,
+                'fields': ','.join(insight_fields)
+            }
+            
+            if state.get('insights_after'):
+                insight_params['after'] = state['insights_after']
+                log.debug('insights_resumed_after_cursor', rows=len(insights_data))
+            
+            page_number = int(state.get('insights_pages') or 0)
+            pages_since_checkpoint = 0
+            while True:
+                # Page size adapts; a page Meta finds too large is requested again, smaller
+                insight_params['limit'] = insights_batcher.size
+                started = time.perf_counter()
+                try:
+                    raw_response = api.call(
+                        'GET',
+                        (ad_account_id, 'insights'),
+                        params=insight_params
+                    )
+                except Exception as e:
+                    if is_oversized_error(e) and insights_batcher.record_oversized(insight_params['limit']):
+                        log.debug('insights_page_shrunk', limit=insights_batcher.size, error=str(e))
+                        continue
+                    raise
+                response = raw_response.json()
+                
+                page = [dict(x) for x in response.get('data', [])]
+                insights_batcher.record(len(page), time.perf_counter() - started, len(raw_response.body()))
+                insights_data.extend(page)
+                if on_insights_page:
+                    on_insights_page(page_number, page)
+                page_number += 1
+                log.debug('insights_page_fetched', sample=True, rows=len(page), total_rows=len(insights_data))
+                
+                paging = response.get('paging', {})
+                after = paging.get('cursors', {}).get('after')
+                # 'after' is present even on the last page; 'next' is not
+                if not after or 'next' not in paging:
+                    break
+                
+                insight_params['after'] = after
+                state['insights_after'] = after
+                state['insights_pages'] = page_number
+                pages_since_checkpoint += 1
+                if pages_since_checkpoint >= CHECKPOINT_EVERY_PAGES:
+                    checkpoint()
+                    pages_since_checkpoint = 0
+            
+            state['insights_pages'] = page_number
+            state['insights_complete'] = True
+            checkpoint()
+            log.debug('insights_fetched', rows=len(insights_data))
 
         if not insights_data:
             return {'creatives': [], 'performance': []}
@@ -87,25 +194,36 @@ def fetch_creative_performance(
         # STEP 2: Map Ad IDs -> Creative IDs
         # We need to fetch the 'Ad' objects to find out which creative they use.
         # ---------------------------------------------------------
-        print(f"🔗 Step 2: Mapping Ads to Creatives...")
+        log.debug('ad_mapping_started')
         
         # Extract unique Ad IDs from the insights
         unique_ad_ids = list(set([row['ad_id'] for row in insights_data if 'ad_id' in row]))
         
         # Batch fetch Ads to get their creative_id
         # chunking is safer for large accounts
-        ad_id_to_creative_id = {}
+        ad_id_to_creative_id = state.setdefault('ad_id_to_creative_id', {})
         
-        # Simple chunker (50 ids per request is safe for Graph API)
-        chunk_size = 50
-        for i in range(0, len(unique_ad_ids), chunk_size):
-            chunk = unique_ad_ids[i:i + chunk_size]
-            print(f"   Processing ad batch {i // chunk_size + 1} ({len(chunk)} ads)...")
+        # Ads already mapped by an interrupted run are not fetched again
+        if state.get('ads_complete'):
+            unique_ad_ids = []
+        else:
+            unique_ad_ids = [a for a in unique_ad_ids if a not in ad_id_to_creative_id]
+        
+        # Chunks are sized by ad_batcher; a chunk that fails as too large is retried smaller
+        i, batch_number = 0, 0
+        while i < len(unique_ad_ids):
+            chunk = unique_ad_ids[i:i + ad_batcher.size]
+            i += len(chunk)
+            batch_number += 1
+            log.debug('ad_batch_started', sample=True, batch=batch_number, ads=len(chunk))
+            started = time.perf_counter()
             try:
                 ads = Ad.get_by_ids(
                     ids=chunk,
-                    fields=['creative']
+                    fields=['creative'],
+                    api=api
                 )
+                ad_batcher.record(len(chunk), time.perf_counter() - started, estimate_bytes(ads))
                 # Map them: ad_id -> creative_id
                 for ad in ads:
                     ad_dict = dict(ad)
@@ -119,12 +237,16 @@ def fetch_creative_performance(
                             ad_id_to_creative_id[ad_id] = creative_obj.get('id')
             except FacebookRequestError as e:
                 error_code = e.api_error_code() if hasattr(e, 'api_error_code') else None
-                if 'rate limit' in str(e).lower() or error_code == 4:
-                    print(f"   ⏳ Rate limit hit. Waiting 60 seconds...")
+                if is_oversized_error(e) and ad_batcher.record_oversized(len(chunk)):
+                    i -= len(chunk)
+                    continue
+                if 'rate limit' in str(e).lower() or error_code == APP_RATE_LIMIT_ERROR_CODE:
+                    log.warning('meta_rate_limited', step='ads', wait_seconds=60, error_code=error_code)
+                    load_reporter.record_rate_limit(60, app_wide=error_code == APP_RATE_LIMIT_ERROR_CODE)
                     time.sleep(60)
                     # Retry the batch
                     try:
-                        ads = Ad.get_by_ids(ids=chunk, fields=['creative'])
+                        ads = Ad.get_by_ids(ids=chunk, fields=['creative'], api=api)
                         for ad in ads:
                             ad_dict = dict(ad)
                             ad_id = ad_dict.get('id')
@@ -132,36 +254,58 @@ def fetch_creative_performance(
                                 creative_obj = ad_dict['creative']
                                 if isinstance(creative_obj, dict) and 'id' in creative_obj:
                                     ad_id_to_creative_id[ad_id] = creative_obj['id']
-                    except Exception:
-                        print(f"   ⚠️ Failed to retry batch after rate limit")
+                                elif hasattr(creative_obj, 'get') and creative_obj.get('id'):
+                                    ad_id_to_creative_id[ad_id] = creative_obj.get('id')
+                    except Exception as retry_error:
+                        log.warning('ad_batch_retry_failed', ads=len(chunk), error=str(retry_error))
                         continue
                 else:
-                    print(f"   ⚠️ Error fetching ad batch: {e}")
+                    log.warning('ad_batch_failed', ads=len(chunk), error_code=error_code, error=str(e))
                     continue
             except Exception as e:
-                print(f"   ⚠️ Unexpected error fetching ad batch: {e}")
+                if is_oversized_error(e) and ad_batcher.record_oversized(len(chunk)):
+                    i -= len(chunk)
+                    continue
+                log.warning('ad_batch_failed', ads=len(chunk), error=str(e))
                 continue
+            finally:
+                if batch_number % CHECKPOINT_EVERY_BATCHES == 0:
+                    checkpoint()
 
-        print(f"   ✅ Mapped {len(ad_id_to_creative_id)} ads to creatives")
+        state['ads_complete'] = True
+        checkpoint()
+        log.debug('ads_mapped', ads=len(ad_id_to_creative_id))
 
         # ---------------------------------------------------------
         # STEP 3: Get Creative Assets (Thumbnails)
         # Now we have the creative IDs, let's get the images.
         # ---------------------------------------------------------
         unique_creative_ids = list(set(ad_id_to_creative_id.values()))
-        print(f"🎨 Step 3: Fetching {len(unique_creative_ids)} unique creatives...")
+        log.debug('creative_fetch_started', creatives=len(unique_creative_ids))
         
         # Fetch creative details
-        creatives_map = {}  # Store details by ID for easy lookup
+        creatives_map = state.setdefault('creatives_map', {})  # Store details by ID for easy lookup
+        
+        if state.get('creatives_complete'):
+            unique_creative_ids = []
+        else:
+            unique_creative_ids = [c for c in unique_creative_ids if c not in creatives_map]
         
-        for i in range(0, len(unique_creative_ids), chunk_size):
-            chunk = unique_creative_ids[i:i + chunk_size]
-            print(f"   Processing creative batch {i // chunk_size + 1} ({len(chunk)} creatives)...")
+        # Creatives can be wide (object_story_spec): creative_batcher keeps responses under its byte budget
+        i, batch_number = 0, 0
+        while i < len(unique_creative_ids):
+            chunk = unique_creative_ids[i:i + creative_batcher.size]
+            i += len(chunk)
+            batch_number += 1
+            log.debug('creative_batch_started', sample=True, batch=batch_number, creatives=len(chunk))
+            started = time.perf_counter()
             try:
                 creative_objects = AdCreative.get_by_ids(
                     ids=chunk,
-                    fields=['name', 'thumbnail_url', 'image_url', 'object_story_spec', 'body', 'title', 'call_to_action_type']
+                    fields=['name', 'thumbnail_url', 'image_url', 'object_story_spec', 'body', 'title', 'call_to_action_type'],
+                    api=api
                 )
+                creative_batcher.record(len(chunk), time.perf_counter() - started, estimate_bytes(creative_objects))
                 
                 for c in creative_objects:
                     c_data = dict(c)
@@ -192,14 +336,19 @@ def fetch_creative_performance(
                     }
             except FacebookRequestError as e:
                 error_code = e.api_error_code() if hasattr(e, 'api_error_code') else None
-                if 'rate limit' in str(e).lower() or error_code == 4:
-                    print(f"   ⏳ Rate limit hit. Waiting 60 seconds...")
+                if is_oversized_error(e) and creative_batcher.record_oversized(len(chunk)):
+                    i -= len(chunk)
+                    continue
+                if 'rate limit' in str(e).lower() or error_code == APP_RATE_LIMIT_ERROR_CODE:
+                    log.warning('meta_rate_limited', step='creatives', wait_seconds=60, error_code=error_code)
+                    load_reporter.record_rate_limit(60, app_wide=error_code == APP_RATE_LIMIT_ERROR_CODE)
                     time.sleep(60)
                     # Retry the batch
                     try:
                         creative_objects = AdCreative.get_by_ids(
                             ids=chunk,
-                            fields=['name', 'thumbnail_url', 'image_url', 'object_story_spec', 'body', 'title', 'call_to_action_type']
+                            fields=['name', 'thumbnail_url', 'image_url', 'object_story_spec', 'body', 'title', 'call_to_action_type'],
+                            api=api
                         )
                         for c in creative_objects:
                             c_data = dict(c)
@@ -220,21 +369,30 @@ def fetch_creative_performance(
                                 'call_to_action_type': c_data.get('call_to_action_type') or '',
                                 'platform': 'meta'
                             }
-                    except Exception:
-                        print(f"   ⚠️ Failed to retry creative batch after rate limit")
+                    except Exception as retry_error:
+                        log.warning('creative_batch_retry_failed', creatives=len(chunk), error=str(retry_error))
                         continue
                 else:
-                    print(f"   ⚠️ Error fetching creative batch: {e}")
+                    log.warning('creative_batch_failed', creatives=len(chunk), error_code=error_code, error=str(e))
                     continue
             except Exception as e:
-                print(f"   ⚠️ Unexpected error fetching creative batch: {e}")
+                if is_oversized_error(e) and creative_batcher.record_oversized(len(chunk)):
+                    i -= len(chunk)
+                    continue
+                log.warning('creative_batch_failed', creatives=len(chunk), error=str(e))
                 continue
+            finally:
+                if batch_number % CHECKPOINT_EVERY_BATCHES == 0:
+                    checkpoint()
+
+        state['creatives_complete'] = True
+        checkpoint()
 
         # ---------------------------------------------------------
         # STEP 4: Merge Everything
         # Combine Insights + Creative ID + Creative Details
         # ---------------------------------------------------------
-        print("🔗 Step 4: Merging data...")
+        log.debug('merge_started')
         final_performance = []
         final_creatives = list(creatives_map.values())
 
@@ -318,7 +476,7 @@ def fetch_creative_performance(
                 }
                 final_performance.append(performance_row)
 
-        print(f"✅ Sync Complete: {len(final_creatives)} Creatives, {len(final_performance)} Daily Rows.")
+        log.info('meta_fetch_completed', creatives=len(final_creatives), performance_rows=len(final_performance))
         
         return {
             'creatives': final_creatives,
@@ -327,14 +485,10 @@ def fetch_creative_performance(
 
     except FacebookRequestError as e:
         error_code = e.api_error_code() if hasattr(e, 'api_error_code') else None
-        error_msg = str(e)
-        print(f"❌ Facebook API Error: {error_msg}")
-        print(f"Error Code: {error_code}")
+        log.error('meta_api_error', error_code=error_code, error=str(e))
         raise
     except Exception as e:
-        print(f"❌ Error in Meta Fetcher: {str(e)}")
-        import traceback
-        traceback.print_exc()
+        log.exception('meta_fetch_failed', error=str(e))
         # Raise it so the caller knows it failed
         raise
 
@@ -0,0 +1,311 @@
+"""
+Sync Coordination
+
+Coordinates sync_meta_creative_data across several worker instances:
+- Membership: every instance heartbeats into sync_instances; instances that
+  stop heartbeating drop out after SYNC_INSTANCE_TTL_SECONDS.
+- Sharding: ad accounts are assigned to live instances with a consistent-hash
+  ring, so when an instance joins or leaves only its share of accounts moves.
+- Leases: before syncing, an instance takes the account's lease in sync_leases
+  (expiring, renewed by heartbeats). A held lease means the account is already
+  being synced, here or elsewhere, so each account has one sync at a time.
+  Each acquisition has its own holder token, so one sync can never renew or
+  release the lease of another.
+
+All state lives in Postgres (through Supabase RPC), so the same setup works with
+a local Supabase/Postgres and several local worker processes.
+
+Enabled with SYNC_COORDINATION_ENABLED=true. Other settings:
+    SYNC_INSTANCE_ID           stable instance name (default: host-pid-random)
+    SYNC_INSTANCE_URL          URL other instances can forward syncs to (optional)
+    SYNC_LEASE_TTL_SECONDS     lease lifetime without renewal (default: 120)
+    SYNC_INSTANCE_TTL_SECONDS  membership lifetime without heartbeat (default: 60)
+"""
+
+import atexit
+import bisect
+import hashlib
+import os
+import socket
+import threading
+import uuid
+from contextlib import contextmanager
+from typing import Dict, List, Optional, Iterator
+from supabase import Client
+
+from lib.services.common.structured_log import get_logger
+
+log = get_logger(__name__)
+
+
+def _account_key(ad_account_id: str) -> str:
+    # '123' and 'act_123' are the same account
+    return ad_account_id if ad_account_id.startswith('act_') else f'act_{ad_account_id}'
+
+
+class LeaseUnavailableError(Exception):
+    """
+    The account's lease is held by another sync (on this or another instance).
+    """
+
+
+class LeaseLostError(Exception):
+    """
+    The lease expired or was taken over while the sync was running.
+    """
+
+
+class ConsistentHashRing:
+    """
+    Maps keys to nodes; each node owns `vnodes` points on the ring.
+    """
+
+    def __init__(self, nodes: List[str], vnodes: int = 64):
+        self.nodes = sorted(set(nodes))
+        self._points: List[int] = []
+        self._owners: List[str] = []
+        ring = sorted(
+            (self._hash(f"{node}#{i}"), node)
+            for node in self.nodes
+            for i in range(vnodes)
+        )
+        for point, node in ring:
+            self._points.append(point)
+            self._owners.append(node)
+
+    @staticmethod
+    def _hash(value: str) -> int:
+        return int.from_bytes(hashlib.sha1(value.encode('utf-8')).digest()[:8], 'big')
+
+    def owner(self, key: str) -> Optional[str]:
+        if not self._points:
+            return None
+        i = bisect.bisect(self._points, self._hash(key)) % len(self._points)
+        return self._owners[i]
+
+
+class SyncLease:
+    """
+    A held account lease. Renewed by the coordinator's heartbeat thread.
+    """
+
+    def __init__(self, ad_account_id: str, job_id: Optional[str], holder: str):
+        self.ad_account_id = ad_account_id
+        self.job_id = job_id
+        # Token of this acquisition, stored as sync_leases.holder
+        self.holder = holder
+        # False while only reserved locally (the heartbeat renews acquired leases only)
+        self.acquired = False
+        self.lost = threading.Event()
+
+    def ensure_held(self) -> None:
+        """
+        Raises LeaseLostError if the lease could not be renewed; call before writing.
+        """
+        if self.lost.is_set():
+            raise LeaseLostError(f"Lost the sync lease for {self.ad_account_id}")
+
+
+class SyncCoordinator:
+    """
+    Membership, sharding and leases for one worker instance.
+    """
+
+    def __init__(
+        self,
+        supabase: Client,
+        instance_id: Optional[str] = None,
+        instance_url: Optional[str] = None,
+        lease_ttl_seconds: int = 120,
+        instance_ttl_seconds: int = 60
+    ):
+        self.supabase = supabase
+        self.instance_id = instance_id or f"{socket.gethostname()}-{os.getpid()}-{uuid.uuid4().hex[:6]}"
+        self.instance_url = instance_url
+        self.lease_ttl_seconds = lease_ttl_seconds
+        self.instance_ttl_seconds = instance_ttl_seconds
+        # Heartbeat well within both TTLs so one missed beat does not drop anything
+        self.heartbeat_interval = min(lease_ttl_seconds, instance_ttl_seconds) / 4.0
+
+        self._lock = threading.Lock()
+        self._leases: Dict[str, SyncLease] = {}
+        self._ring = ConsistentHashRing([self.instance_id])
+        self._urls: Dict[str, Optional[str]] = {self.instance_id: instance_url}
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    # ---------------------------------------------------------
+    # Membership
+    # ---------------------------------------------------------
+
+    def start(self) -> None:
+        """
+        Joins the membership and starts the heartbeat thread.
+        """
+        self.heartbeat()
+        self._thread = threading.Thread(target=self._heartbeat_loop, name='sync-coordinator', daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        """
+        Leaves the membership and frees this instance's leases.
+        """
+        self._stop.set()
+        if self._thread:
+            self._thread.join(timeout=self.heartbeat_interval)
+        try:
+            self.supabase.rpc('leave_sync_instance', {'p_instance_id': self.instance_id}).execute()
+        except Exception as e:
+            log.warning('sync_membership_leave_failed', instance_id=self.instance_id, error=str(e))
+
+    def heartbeat(self) -> None:
+        """
+        Refreshes membership (rebuilding the ring when it changed) and renews held leases.
+        """
+        response = self.supabase.rpc('heartbeat_sync_instance', {
+            'p_instance_id': self.instance_id,
+            'p_instance_url': self.instance_url,
+            'p_ttl_seconds': self.instance_ttl_seconds
+        }).execute()
+        members = {row['instance_id']: row.get('instance_url') for row in (response.data or [])}
+        members.setdefault(self.instance_id, self.instance_url)
+
+        with self._lock:
+            if sorted(members) != self._ring.nodes:
+                log.info('sync_membership_changed', instance_id=self.instance_id, instances=len(members))
+                self._ring = ConsistentHashRing(list(members))
+            self._urls = members
+            leases = [lease for lease in self._leases.values() if lease.acquired]
+
+        for lease in leases:
+            self._renew(lease)
+
+    def _heartbeat_loop(self) -> None:
+        while not self._stop.wait(self.heartbeat_interval):
+            try:
+                self.heartbeat()
+            except Exception as e:
+                log.warning('sync_heartbeat_failed', instance_id=self.instance_id, error=str(e))
+
+    # ---------------------------------------------------------
+    # Sharding
+    # ---------------------------------------------------------
+
+    def owner_of(self, ad_account_id: str) -> str:
+        """
+        Returns the instance an account is assigned to.
+        """
+        with self._lock:
+            return self._ring.owner(_account_key(ad_account_id)) or self.instance_id
+
+    def owner_url(self, ad_account_id: str) -> Optional[str]:
+        """
+        Returns the URL of the account's owner, or None if it is this instance
+        or the owner is not reachable directly.
+        """
+        owner = self.owner_of(ad_account_id)
+        if owner == self.instance_id:
+            return None
+        with self._lock:
+            return self._urls.get(owner)
+
+    # ---------------------------------------------------------
+    # Leases
+    # ---------------------------------------------------------
+
+    @contextmanager
+    def lease(self, ad_account_id: str, job_id: Optional[str] = None) -> Iterator[SyncLease]:
+        """
+        Holds the account's lease for the duration of the block.
+
+        Raises:
+            LeaseUnavailableError: If another sync (here or on another instance) holds the lease
+        """
+        ad_account_id = _account_key(ad_account_id)
+        lease = SyncLease(ad_account_id, job_id, f"{self.instance_id}/{uuid.uuid4().hex}")
+
+        # Reserve the account locally first: a second sync of it on this instance is
+        # refused without a round trip, and cannot overwrite the first one's entry
+        with self._lock:
+            if ad_account_id in self._leases:
+                raise LeaseUnavailableError(f"Account {ad_account_id} is already being synced on this instance")
+            self._leases[ad_account_id] = lease
+        acquired = False
+        try:
+            response = self.supabase.rpc('acquire_sync_lease', {
+                'p_ad_account_id': ad_account_id,
+                'p_holder': lease.holder,
+                'p_instance_id': self.instance_id,
+                'p_job_id': job_id,
+                'p_ttl_seconds': self.lease_ttl_seconds
+            }).execute()
+            acquired = response.data is True
+        finally:
+            with self._lock:
+                if acquired:
+                    lease.acquired = True
+                else:
+                    self._leases.pop(ad_account_id, None)
+        if not acquired:
+            raise LeaseUnavailableError(f"Account {ad_account_id} is being synced by another instance")
+
+        try:
+            yield lease
+        finally:
+            with self._lock:
+                self._leases.pop(ad_account_id, None)
+            try:
+                self.supabase.rpc('release_sync_lease', {
+                    'p_ad_account_id': ad_account_id,
+                    'p_holder': lease.holder
+                }).execute()
+            except Exception as e:
+                # The lease expires on its own
+                log.warning('sync_lease_release_failed', ad_account_id=ad_account_id, error=str(e))
+
+    def _renew(self, lease: SyncLease) -> None:
+        try:
+            response = self.supabase.rpc('renew_sync_lease', {
+                'p_ad_account_id': lease.ad_account_id,
+                'p_holder': lease.holder,
+                'p_ttl_seconds': self.lease_ttl_seconds
+            }).execute()
+        except Exception as e:
+            # Not lost yet: the lease is valid until it expires
+            log.warning('sync_lease_renew_failed', ad_account_id=lease.ad_account_id, error=str(e))
+            return
+        if response.data is not True:
+            log.error('sync_lease_lost', ad_account_id=lease.ad_account_id, job_id=lease.job_id)
+            lease.lost.set()
+
+
+_coordinator: Optional[SyncCoordinator] = None
+_coordinator_lock = threading.Lock()
+
+
+def get_coordinator(supabase: Optional[Client] = None) -> Optional[SyncCoordinator]:
+    """
+    Returns the process-wide coordinator (started on first use), or None when
+    SYNC_COORDINATION_ENABLED is not set.
+    """
+    global _coordinator
+    if os.environ.get('SYNC_COORDINATION_ENABLED', '').lower() not in ('1', 'true', 'yes'):
+        return None
+    with _coordinator_lock:
+        if _coordinator is None:
+            if supabase is None:
+                # Imported here to avoid a circular import with the sync service
+                from lib.services.sync.meta_sync_service import get_supabase_client
+                supabase = get_supabase_client()
+            coordinator = SyncCoordinator(
+                supabase,
+                instance_id=os.environ.get('SYNC_INSTANCE_ID') or None,
+                instance_url=os.environ.get('SYNC_INSTANCE_URL') or None,
+                lease_ttl_seconds=int(os.environ.get('SYNC_LEASE_TTL_SECONDS', 120)),
+                instance_ttl_seconds=int(os.environ.get('SYNC_INSTANCE_TTL_SECONDS', 60))
+            )
+            coordinator.start()
+            # Free leases right away on a clean exit instead of waiting for them to expire
+            atexit.register(coordinator.stop)
+            _coordinator = coordinator
+        return _coordinator
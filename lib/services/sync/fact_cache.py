@@ -0,0 +1,306 @@
+"""
+Creative Leaderboard Cache
+
+Keeps each user's recent fact_creative_daily rows in memory, column by column,
+to answer creative leaderboards (spend, revenue, ROAS per creative over a date
+range) without a SQL aggregation per dashboard load.
+
+- The cache holds, per user, every fact row dated on or after a window start
+  (FACT_CACHE_WINDOW_DAYS days before the user was loaded).
+- sync_meta_creative_data merges the rows it upserts into cached users and
+  invalidates a user whose write failed midway.
+- Other instances write too (syncs run on the account's owner instance), so a
+  cached user is reloaded once it is older than FACT_CACHE_MAX_AGE_SECONDS.
+- Memory is bounded by FACT_CACHE_MAX_ROWS; the least recently used users are
+  evicted first. Memoized leaderboards are capped per user.
+- A miss (user not cached, or a range starting before the window) falls back to
+  the database.
+"""
+
+import os
+import threading
+import time
+from array import array
+from collections import OrderedDict
+from datetime import date, datetime, timedelta
+from typing import Dict, List, Any, Optional, Tuple
+from supabase import Client
+
+# Memoized leaderboards kept per user (distinct date ranges and limits)
+MAX_RESULTS_PER_USER = 32
+
+
+def _day(value: Any) -> int:
+    """
+    Converts a 'YYYY-MM-DD' string (or date) to its proleptic ordinal.
+    """
+    if isinstance(value, date):
+        return value.toordinal()
+    return datetime.strptime(str(value)[:10], '%Y-%m-%d').date().toordinal()
+
+
+class _UserFacts:
+    """
+    Columnar fact rows of one user.
+    """
+
+    def __init__(self, window_start: int):
+        self.window_start = window_start
+        self.loaded_at = time.monotonic()
+        self.creative_ids: List[str] = []
+        self.creative_index: Dict[str, int] = {}
+        self.row_index: Dict[Tuple[str, int], int] = {}
+        self.creative = array('i')
+        self.day = array('i')
+        self.spend = array('d')
+        self.revenue = array('d')
+        self.impressions = array('q')
+        self.clicks = array('q')
+        # Memoized leaderboards (oldest first), dropped on every write
+        self.results: Dict[Tuple[int, int, int], List[Dict[str, Any]]] = {}
+
+    def __len__(self) -> int:
+        return len(self.day)
+
+    def upsert(self, row: Dict[str, Any]) -> bool:
+        """
+        Inserts or replaces a row keyed by (ad_id, date). Returns True if it was new.
+        """
+        day = _day(row['date'])
+        if day < self.window_start:
+            return False
+
+        creative_id = str(row['creative_id'])
+        c = self.creative_index.get(creative_id)
+        if c is None:
+            c = len(self.creative_ids)
+            self.creative_ids.append(creative_id)
+            self.creative_index[creative_id] = c
+
+        values = (
+            c, day,
+            float(row.get('spend') or 0), float(row.get('revenue') or 0),
+            int(row.get('impressions') or 0), int(row.get('clicks') or 0)
+        )
+        columns = (self.creative, self.day, self.spend, self.revenue, self.impressions, self.clicks)
+
+        key = (str(row['ad_id']), day)
+        i = self.row_index.get(key)
+        if i is None:
+            self.row_index[key] = len(self.day)
+            for column, value in zip(columns, values):
+                column.append(value)
+            return True
+
+        for column, value in zip(columns, values):
+            column[i] = value
+        return False
+
+    def leaderboard(self, start: int, end: int, limit: int) -> List[Dict[str, Any]]:
+        key = (start, end, limit)
+        cached = self.results.get(key)
+        if cached is not None:
+            return cached
+
+        totals: Dict[int, List[float]] = {}
+        creative, day = self.creative, self.day
+        spend, revenue, impressions, clicks = self.spend, self.revenue, self.impressions, self.clicks
+        for i in range(len(day)):
+            if start <= day[i] <= end:
+                t = totals.get(creative[i])
+                if t is None:
+                    t = totals[creative[i]] = [0.0, 0.0, 0, 0]
+                t[0] += spend[i]
+                t[1] += revenue[i]
+                t[2] += impressions[i]
+                t[3] += clicks[i]
+
+        result = _rank(
+            ((self.creative_ids[c], t[0], t[1], t[2], t[3]) for c, t in totals.items()),
+            limit
+        )
+        if len(self.results) >= MAX_RESULTS_PER_USER:
+            del self.results[next(iter(self.results))]
+        self.results[key] = result
+        return result
+
+
+def _rank(totals, limit: int) -> List[Dict[str, Any]]:
+    """
+    Sorts (creative_id, spend, revenue, impressions, clicks) totals by spend.
+    """
+    ranked = sorted(totals, key=lambda t: t[1], reverse=True)
+    if limit:
+        ranked = ranked[:limit]
+    return [
+        {
+            'creative_id': creative_id,
+            'total_spend': round(spend, 2),
+            'total_revenue': round(revenue, 2),
+            'total_impressions': impressions,
+            'total_clicks': clicks,
+            'roas': round(revenue / spend, 4) if spend > 0 else None
+        }
+        for creative_id, spend, revenue, impressions, clicks in ranked
+    ]
+
+
+class FactCache:
+    """
+    Process-wide, thread-safe leaderboard cache with LRU eviction by row count.
+    """
+
+    def __init__(self, max_rows: int = 500_000, window_days: int = 90, max_age_seconds: float = 300.0):
+        self.max_rows = max_rows
+        self.window_days = window_days
+        self.max_age_seconds = max_age_seconds
+        self._users: 'OrderedDict[int, _UserFacts]' = OrderedDict()
+        self._rows = 0
+        # Bumped on every write or invalidation of a user, cached or not, so a
+        # load that raced with a sync is discarded instead of caching stale rows
+        self._generations: Dict[int, int] = {}
+        self._lock = threading.Lock()
+
+    def window_start(self) -> date:
+        return date.today() - timedelta(days=self.window_days)
+
+    def generation(self, user_id: int) -> int:
+        """
+        Returns the write generation of a user; take it before reading rows to load().
+        """
+        with self._lock:
+            return self._generations.get(user_id, 0)
+
+    def load(self, user_id: int, rows: List[Dict[str, Any]], window_start: date, generation: int) -> bool:
+        """
+        Replaces the cached rows of a user with a full load from the database.
+        
+        Returns False (and caches nothing) if the user was written to since
+        `generation` was taken.
+        """
+        facts = _UserFacts(window_start.toordinal())
+        for row in rows:
+            facts.upsert(row)
+
+        with self._lock:
+            if self._generations.get(user_id, 0) != generation:
+                return False
+            self._drop(user_id)
+            self._users[user_id] = facts
+            self._rows += len(facts)
+            self._evict()
+            return True
+
+    def apply_rows(self, user_id: int, rows: List[Dict[str, Any]]) -> None:
+        """
+        Merges freshly written rows into a cached user. Uncached users are left
+        alone: a partial entry would answer leaderboards with missing rows.
+        """
+        with self._lock:
+            self._generations[user_id] = self._generations.get(user_id, 0) + 1
+            facts = self._users.get(user_id)
+            if facts is None:
+                return
+            for row in rows:
+                if facts.upsert(row):
+                    self._rows += 1
+            facts.results.clear()
+            self._evict()
+
+    def invalidate(self, user_id: int) -> None:
+        with self._lock:
+            self._generations[user_id] = self._generations.get(user_id, 0) + 1
+            self._drop(user_id)
+
+    def leaderboard(self, user_id: int, start: date, end: date, limit: int = 0) -> Optional[List[Dict[str, Any]]]:
+        """
+        Returns the creative leaderboard for a date range (inclusive), or None on a miss.
+        """
+        with self._lock:
+            facts = self._users.get(user_id)
+            if facts is None or start.toordinal() < facts.window_start:
+                return None
+            if time.monotonic() - facts.loaded_at > self.max_age_seconds:
+                # May miss rows synced by other instances: reload it
+                self._drop(user_id)
+                return None
+            self._users.move_to_end(user_id)
+            return facts.leaderboard(start.toordinal(), end.toordinal(), limit)
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {'users': len(self._users), 'rows': self._rows, 'max_rows': self.max_rows}
+
+    def _drop(self, user_id: int) -> None:
+        facts = self._users.pop(user_id, None)
+        if facts is not None:
+            self._rows -= len(facts)
+
+    def _evict(self) -> None:
+        # Keep at least the most recently used user, even if it alone exceeds the budget
+        while self._rows > self.max_rows and len(self._users) > 1:
+            _, facts = self._users.popitem(last=False)
+            self._rows -= len(facts)
+
+
+fact_cache = FactCache(
+    max_rows=int(os.environ.get('FACT_CACHE_MAX_ROWS', 500_000)),
+    window_days=int(os.environ.get('FACT_CACHE_WINDOW_DAYS', 90)),
+    max_age_seconds=float(os.environ.get('FACT_CACHE_MAX_AGE_SECONDS', 300))
+)
+
+
+def _select_facts(supabase: Client, user_id: int, start: date, end: Optional[date] = None) -> List[Dict[str, Any]]:
+    """
+    Reads a user's fact rows from start (and up to end, if given), page by page.
+    """
+    rows: List[Dict[str, Any]] = []
+    page_size = 1000
+    offset = 0
+    while True:
+        query = supabase.table('fact_creative_daily').select(
+            'creative_id, ad_id, date, spend, revenue, impressions, clicks'
+        ).eq('user_id', user_id).gte('date', start.isoformat())
+        if end is not None:
+            query = query.lte('date', end.isoformat())
+        response = query.order('date').order('ad_id').range(offset, offset + page_size - 1).execute()
+        page = response.data or []
+        rows.extend(page)
+        if len(page) < page_size:
+            return rows
+        offset += page_size
+
+
+def get_creative_leaderboard(
+    supabase: Client,
+    user_id: int,
+    start: date,
+    end: date,
+    limit: int = 0
+) -> Tuple[List[Dict[str, Any]], str]:
+    """
+    Returns the creative leaderboard for a user and date range, and where it came
+    from ('cache', 'database' after loading the user into the cache, or 'database'
+    for ranges older than the cache window).
+    """
+    result = fact_cache.leaderboard(user_id, start, end, limit)
+    if result is not None:
+        return result, 'cache'
+
+    window_start = fact_cache.window_start()
+    if start >= window_start:
+        generation = fact_cache.generation(user_id)
+        fact_cache.load(user_id, _select_facts(supabase, user_id, window_start), window_start, generation)
+        result = fact_cache.leaderboard(user_id, start, end, limit)
+        if result is not None:
+            return result, 'database'
+
+    # Range older than the cache window, or the load lost a race with a sync: aggregate directly
+    totals: Dict[str, List[float]] = {}
+    for row in _select_facts(supabase, user_id, start, end):
+        t = totals.setdefault(str(row['creative_id']), [0.0, 0.0, 0, 0])
+        t[0] += float(row.get('spend') or 0)
+        t[1] += float(row.get('revenue') or 0)
+        t[2] += int(row.get('impressions') or 0)
+        t[3] += int(row.get('clicks') or 0)
+    return _rank(((c, *t) for c, t in totals.items()), limit), 'database'
@@ -8,7 +8,9 @@ Syncs Meta creative performance data to Supabase tables:
 
 import os
 import sys
-from typing import Dict, List, Any, Optional
+import time
+import uuid
+from typing import Dict, List, Any, Optional, Set
 from supabase import create_client, Client
 from datetime import datetime
 
@@ -18,6 +20,15 @@ if project_root not in sys.path:
     sys.path.insert(0, project_root)
 
 from lib.services.connector.meta_creative_fetcher import fetch_creative_performance
+from lib.services.sync.sync_checkpoint import SyncCheckpoint, default_job_id
+from lib.services.sync.fact_cache import fact_cache
+from lib.services.sync.resilient_upsert import resilient_upsert, is_missing_partition_error
+from lib.services.sync.coordination import SyncLease, get_coordinator
+from lib.services.common.structured_log import get_logger, log_context
+from lib.services.common.load_reporter import load_reporter
+from lib.services.common.adaptive_batcher import get_batcher, is_oversized_error, estimate_bytes
+
+log = get_logger(__name__)
 
 
 def get_supabase_client() -> Client:
@@ -49,59 +60,186 @@ def get_supabase_client() -> Client:
     return create_client(supabase_url, supabase_key)
 
 
+# Partitions already known to exist in this process (keyed by 'YYYY-MM'); a month is
+# forgotten again when a write finds its partition gone (dropped by the retention policy)
+_known_fact_partitions: Set[str] = set()
+
+# Batch sizes adapt to payload size and latency (see adaptive_batcher).
+# The id lookup is a GET: its ids travel in the URL, which is kept under ~6 KB.
+id_select_batcher = get_batcher(
+    'supabase_id_select', initial_size=100, min_size=10, max_size=500,
+    target_latency_seconds=1.0, max_payload_bytes=6_000
+)
+fact_upsert_batcher = get_batcher(
+    'supabase_fact_upsert', initial_size=100, min_size=10, max_size=1000,
+    target_latency_seconds=1.0, max_payload_bytes=1_000_000
+)
+
+
+def partition_month(date_str: str) -> str:
+    """
+    Returns the fact_creative_daily partition key ('YYYY-MM') for a 'YYYY-MM-DD' date.
+    """
+    return date_str[:7]
+
+
+def group_rows_by_partition(rows: List[Dict[str, Any]]) -> Dict[str, List[Dict[str, Any]]]:
+    """
+    Groups fact rows by the monthly partition they belong to, oldest month first.
+    """
+    groups: Dict[str, List[Dict[str, Any]]] = {}
+    for row in rows:
+        groups.setdefault(partition_month(row['date']), []).append(row)
+    return dict(sorted(groups.items()))
+
+
+def ensure_fact_partitions(supabase: Client, dates: List[str]) -> None:
+    """
+    Pre-creates the monthly fact_creative_daily partitions covering the given dates.
+    
+    Calls the ensure_fact_creative_daily_partitions() database function once for the
+    whole date span and remembers the months it covered, so repeated syncs in the
+    same process do not pay for the round trip again.
+    
+    Args:
+        supabase: Supabase client
+        dates: Dates ('YYYY-MM-DD') of the rows about to be written
+    """
+    months = {partition_month(d) for d in dates if d}
+    if not months or months <= _known_fact_partitions:
+        return
+    
+    missing = sorted(months - _known_fact_partitions)
+    supabase.rpc('ensure_fact_creative_daily_partitions', {
+        'p_start': f"{missing[0]}-01",
+        'p_end': f"{missing[-1]}-01"
+    }).execute()
+    
+    # The function creates every month in the span, not just the ones we saw
+    start = datetime.strptime(missing[0], '%Y-%m')
+    end = datetime.strptime(missing[-1], '%Y-%m')
+    year, month = start.year, start.month
+    while (year, month) <= (end.year, end.month):
+        _known_fact_partitions.add(f"{year:04d}-{month:02d}")
+        year, month = (year + 1, 1) if month == 12 else (year, month + 1)
+
+
+def recreate_fact_partition(supabase: Client, month: str) -> None:
+    """
+    Forgets that a month's partition exists and creates it again, after a write
+    found it missing (e.g. dropped by maintain_fact_creative_daily_partitions()
+    since this process created or saw it).
+    """
+    _known_fact_partitions.discard(month)
+    ensure_fact_partitions(supabase, [f"{month}-01"])
+
+
 def sync_meta_creative_data(
     user_id: int,
     ad_account_id: str,
     access_token: str,
-    date_preset: str = 'last_3d'
+    date_preset: str = 'last_3d',
+    job_id: Optional[str] = None
 ) -> str:
     """
     Syncs Meta creative performance data to Supabase.
     
+    Progress is checkpointed per job in sync_checkpoints: the insights paging
+    cursor (the pages themselves go to sync_checkpoint_pages), the resolved
+    ad/creative maps, the creative UUID mapping and the number of
+    committed fact rows. Running the same job again after a crash resumes from
+    the last checkpoint; replayed upserts are idempotent thanks to the
+    (ad_id, date, user_id) conflict key.
+    
     Args:
         user_id: User ID (for future RLS policies)
         ad_account_id: Meta Ad Account ID (e.g., 'act_123456789')
         access_token: Meta API access token
         date_preset: Date preset for insights (default: 'last_3d')
+        job_id: Identifier of the sync job to checkpoint / resume
+            (default: derived from user, account, preset and UTC date)
     
     Returns:
         Summary string describing what was synced
         
     Raises:
+        LeaseUnavailableError: If coordination is enabled and another
+            instance is already syncing this account
         Exception: If sync fails
     """
-    print(f"🔄 Starting Meta Creative Sync for user {user_id}...")
+    job_id = job_id or default_job_id(user_id, ad_account_id, date_preset)
+    
+    # Every log record of this sync carries its ids (sync_id is unique per attempt)
+    with log_context(sync_id=uuid.uuid4().hex[:12], job_id=job_id, user_id=user_id, ad_account_id=ad_account_id):
+        # With several worker instances, hold the account's lease for the whole sync
+        coordinator = get_coordinator()
+        if coordinator is None:
+            return _run_sync(user_id, ad_account_id, access_token, date_preset, job_id)
+        
+        with coordinator.lease(ad_account_id, job_id) as lease:
+            return _run_sync(user_id, ad_account_id, access_token, date_preset, job_id, lease)
+
+
+def _run_sync(
+    user_id: int,
+    ad_account_id: str,
+    access_token: str,
+    date_preset: str,
+    job_id: str,
+    lease: Optional[SyncLease] = None
+) -> str:
+    """
+    Body of sync_meta_creative_data; `lease` (when coordinated) is checked before each write.
+    """
+    log.info('sync_started', date_preset=date_preset)
+    # Stage durations feed the load report (see load_reporter)
+    sync_started = time.perf_counter()
     
     # Initialize Supabase client
     supabase = get_supabase_client()
     
+    # Load the checkpoint of this job (empty when starting fresh)
+    checkpoint = SyncCheckpoint(supabase, job_id, user_id, ad_account_id)
+    resume_state = checkpoint.load()
+    if resume_state:
+        log.info('sync_resumed', stage=checkpoint.stage)
+    
     # ============================================
     # STEP 1: Fetch Data from Meta API
     # ============================================
-    print("📥 Step 1: Fetching data from Meta API...")
+    log.debug('fetch_started')
+    stage_started = time.perf_counter()
     
     try:
         data = fetch_creative_performance(
             ad_account_id=ad_account_id,
             access_token=access_token,
-            date_preset=date_preset
+            date_preset=date_preset,
+            resume_state=resume_state.get('fetch'),
+            on_checkpoint=lambda fetch_state: checkpoint.save(stage='fetching', fetch=fetch_state),
+            on_insights_page=checkpoint.save_page
         )
     except Exception as e:
-        print(f"❌ Failed to fetch data from Meta API: {e}")
+        log.error('fetch_failed', error=str(e))
         raise
     
     creatives = data.get('creatives', [])
     performance = data.get('performance', [])
     
     if not creatives and not performance:
+        checkpoint.clear()
         return "No data to sync"
     
-    print(f"   ✅ Fetched {len(creatives)} creatives and {len(performance)} performance rows")
+    load_reporter.record_stage('fetch', time.perf_counter() - stage_started)
+    log.debug('fetch_completed', creatives=len(creatives), performance_rows=len(performance))
     
     # ============================================
     # PHASE 1: Sync Dimension (Creatives)
     # ============================================
-    print("📊 Phase 1: Syncing creatives to dim_creatives...")
+    log.debug('creatives_sync_started')
+    stage_started = time.perf_counter()
+    if lease:
+        lease.ensure_held()
     
     # Prepare creatives for upsert
     creatives_to_upsert = []
@@ -117,60 +255,79 @@ def sync_meta_creative_data(
         }
         creatives_to_upsert.append(creative_row)
     
-    if creatives_to_upsert:
-        try:
-            # Upsert creatives using platform_id as conflict key
-            # Supabase upsert requires specifying the conflict column
-            # Since platform_id has a UNIQUE constraint, we can use it for conflict resolution
-            result = supabase.table('dim_creatives').upsert(
-                creatives_to_upsert,
-                on_conflict='platform_id'
-            ).execute()
-            
-            print(f"   ✅ Upserted {len(creatives_to_upsert)} creatives")
-        except Exception as e:
-            # If on_conflict parameter doesn't work, try without it (Supabase should auto-detect)
-            try:
-                result = supabase.table('dim_creatives').upsert(
-                    creatives_to_upsert
-                ).execute()
-                print(f"   ✅ Upserted {len(creatives_to_upsert)} creatives (without explicit on_conflict)")
-            except Exception as e2:
-                print(f"   ❌ Failed to upsert creatives: {e2}")
-                raise
+    # Rows the database rejected (see resilient_upsert)
+    dead_lettered_count = 0
     
-    # Retrieve mapping: platform_id -> internal UUID
-    print("   🔍 Retrieving creative ID mapping...")
-    platform_id_to_uuid: Dict[str, str] = {}
+    # The dimension upsert and UUID mapping are skipped when an earlier run of this job completed them
+    platform_id_to_uuid: Dict[str, str] = resume_state.get('platform_id_to_uuid') or {}
     
-    try:
-        # Fetch all creatives we just upserted to get their UUIDs
-        platform_ids = [str(c.get('id', '')) for c in creatives if c.get('id')]
-        
-        if platform_ids:
-            # Query in batches to avoid URL length issues
-            batch_size = 100
-            for i in range(0, len(platform_ids), batch_size):
-                batch = platform_ids[i:i + batch_size]
-                # Query by platform_id using .in_() filter
-                # Supabase Python client uses: .in_('column_name', [values])
-                response = supabase.table('dim_creatives').select('id, platform_id').in_(
-                    'platform_id', batch
-                ).execute()
+    if platform_id_to_uuid:
+        log.debug('creative_mapping_resumed', creatives=len(platform_id_to_uuid))
+    else:
+        if creatives_to_upsert:
+            try:
+                # Upsert creatives using platform_id as conflict key
+                # Since platform_id has a UNIQUE constraint, we can use it for conflict resolution
+                # Rejected rows are dead-lettered; their facts are skipped below (no UUID mapping)
+                result = resilient_upsert(
+                    supabase,
+                    'dim_creatives',
+                    creatives_to_upsert,
+                    on_conflict='platform_id',
+                    job_id=checkpoint.job_id
+                )
+                dead_lettered_count += len(result['dead_lettered'])
                 
-                if response.data:
-                    for row in response.data:
-                        platform_id_to_uuid[row['platform_id']] = row['id']
+                log.debug('creatives_upserted', rows=len(result['committed']))
+            except Exception as e:
+                log.error('creatives_upsert_failed', error=str(e))
+                raise
         
-        print(f"   ✅ Mapped {len(platform_id_to_uuid)} creatives to UUIDs")
-    except Exception as e:
-        print(f"   ❌ Failed to retrieve creative mapping: {e}")
-        raise
+        # Retrieve mapping: platform_id -> internal UUID
+        log.debug('creative_mapping_started')
+        
+        try:
+            # Fetch all creatives we just upserted to get their UUIDs
+            platform_ids = [str(c.get('id', '')) for c in creatives if c.get('id')]
+        
+            if platform_ids:
+                # Query in batches to avoid URL length issues
+                i = 0
+                while i < len(platform_ids):
+                    batch = platform_ids[i:i + id_select_batcher.size]
+                    started = time.perf_counter()
+                    # Query by platform_id using .in_() filter
+                    # Supabase Python client uses: .in_('column_name', [values])
+                    try:
+                        response = supabase.table('dim_creatives').select('id, platform_id').in_(
+                            'platform_id', batch
+                        ).execute()
+                    except Exception as e:
+                        if is_oversized_error(e) and id_select_batcher.record_oversized(len(batch)):
+                            continue
+                        raise
+                    id_select_batcher.record(
+                        len(batch), time.perf_counter() - started, sum(len(pid) + 1 for pid in batch)
+                    )
+                    i += len(batch)
+        
+                    if response.data:
+                        for row in response.data:
+                            platform_id_to_uuid[row['platform_id']] = row['id']
+        
+            log.debug('creative_mapping_completed', creatives=len(platform_id_to_uuid))
+        except Exception as e:
+            log.error('creative_mapping_failed', error=str(e))
+            raise
+        
+        checkpoint.save(stage='creatives_synced', platform_id_to_uuid=platform_id_to_uuid)
+    load_reporter.record_stage('creatives', time.perf_counter() - stage_started)
     
     # ============================================
     # PHASE 2: Sync Facts (Performance)
     # ============================================
-    print("📈 Phase 2: Syncing performance to fact_creative_daily...")
+    log.debug('facts_sync_started')
+    stage_started = time.perf_counter()
     
     # Prepare performance rows for upsert
     performance_to_upsert = []
@@ -216,38 +373,110 @@ def sync_meta_creative_data(
         performance_to_upsert.append(performance_row)
     
     if skipped_count > 0:
-        print(f"   ⚠️ Skipped {skipped_count} performance rows (missing creative mapping)")
+        log.warning('facts_skipped', rows=skipped_count, reason='missing creative mapping')
     
+    # Facts the database accepted, for the export (dead-lettered rows are left out)
+    performance_committed: List[Dict[str, Any]] = []
     if performance_to_upsert:
         try:
+            # fact_creative_daily is range-partitioned by month: make sure every
+            # partition we are about to write into exists before the first upsert
+            ensure_fact_partitions(supabase, [row['date'] for row in performance_to_upsert])
+            
             # Upsert performance data using (ad_id, date, user_id) as conflict key
-            # Supabase handles unique constraints automatically
-            # We need to upsert in batches to handle the unique constraint properly
-            batch_size = 100
+            # Batches never span partitions, so each statement only touches the
+            # indexes of a single month
+            # Rows committed by an earlier run of this job are not sent again:
+            # the row order is deterministic for a given checkpointed fetch, and
+            # progress is counted in rows, so it holds whatever the batch sizes
             total_upserted = 0
+            committed = int(checkpoint.progress.get('facts_committed', 0))
+            facts_rejected = 0
+            if committed:
+                log.debug('facts_resumed', rows=committed)
+                # Which of those rows the database accepted is not known here
+                fact_cache.invalidate(user_id)
             
-            for i in range(0, len(performance_to_upsert), batch_size):
-                batch = performance_to_upsert[i:i + batch_size]
-                
-                # Upsert performance data using (ad_id, date, user_id) as conflict key
-                # Try with explicit on_conflict first
-                try:
-                    result = supabase.table('fact_creative_daily').upsert(
-                        batch,
-                        on_conflict='ad_id,date,user_id'
-                    ).execute()
-                except Exception:
-                    # Fallback: Supabase should auto-detect unique constraint
-                    result = supabase.table('fact_creative_daily').upsert(
-                        batch
-                    ).execute()
-                
-                total_upserted += len(batch)
+            for month, month_rows in group_rows_by_partition(performance_to_upsert).items():
+                partition_recreated = False
+                i = min(len(month_rows), max(0, committed - total_upserted))
+                total_upserted += i
+                # Committed by the earlier run (as far as is known here)
+                performance_committed.extend(month_rows[:i])
+                while i < len(month_rows):
+                    batch = month_rows[i:i + fact_upsert_batcher.size]
+                    
+                    # Stop writing if another instance took over this account
+                    if lease:
+                        lease.ensure_held()
+                    
+                    # Bad rows are isolated and dead-lettered, the rest of the batch is committed;
+                    # a batch that times out is retried in smaller batches
+                    started = time.perf_counter()
+                    try:
+                        result = resilient_upsert(
+                            supabase,
+                            'fact_creative_daily',
+                            batch,
+                            on_conflict='ad_id,date,user_id',
+                            job_id=checkpoint.job_id,
+                            # At the minimum size, timeouts are retried as usual
+                            raise_oversized=len(batch) > fact_upsert_batcher.min_size
+                        )
+                    except Exception as e:
+                        if is_oversized_error(e) and fact_upsert_batcher.record_oversized(len(batch)):
+                            continue
+                        if is_missing_partition_error(e) and not partition_recreated:
+                            log.warning('fact_partition_missing', month=month)
+                            recreate_fact_partition(supabase, month)
+                            partition_recreated = True
+                            continue
+                        raise
+                    facts_rejected += len(result['dead_lettered'])
+                    # Bisected batches took several requests: their latency says nothing about the size
+                    if not result['dead_lettered']:
+                        fact_upsert_batcher.record(len(batch), time.perf_counter() - started, estimate_bytes(batch))
+                    
+                    i += len(batch)
+                    total_upserted += len(batch)
+                    log.debug('facts_batch_upserted', sample=True, month=month, rows=len(batch),
+                              rejected=len(result['dead_lettered']), total_rows=total_upserted)
+                    checkpoint.save_progress(facts_committed=total_upserted)
+                    # Keep cached leaderboards in step with what was just committed
+                    fact_cache.apply_rows(user_id, result['committed'])
+                    performance_committed.extend(result['committed'])
             
-            print(f"   ✅ Upserted {total_upserted} performance rows")
+            dead_lettered_count += facts_rejected
+            log.debug('facts_upserted', rows=total_upserted - facts_rejected)
         except Exception as e:
-            print(f"   ❌ Failed to upsert performance data: {e}")
+            log.error('facts_upsert_failed', error=str(e))
+            # The outcome of the failed batch is unknown: reload this user on the next read
+            fact_cache.invalidate(user_id)
             raise
+    load_reporter.record_stage('facts', time.perf_counter() - stage_started)
+    
+    # ============================================
+    # PHASE 3: Export (Parquet, optional)
+    # ============================================
+    if os.environ.get('PARQUET_EXPORT_DIR'):
+        log.debug('parquet_export_started')
+        stage_started = time.perf_counter()
+        try:
+            # Imported lazily so workers without exports do not need pyarrow
+            from lib.services.sync.parquet_export import get_parquet_exporter
+            # Only rows the database accepted: creatives that were mapped to a UUID, committed facts
+            written = get_parquet_exporter().export(
+                user_id,
+                [c for c in creatives_to_upsert if c['platform_id'] in platform_id_to_uuid],
+                performance_committed,
+                job_id=checkpoint.job_id
+            )
+            log.debug('parquet_export_completed', creative_files=written['dim_creatives'],
+                      daily_files=written['fact_creative_daily'])
+            load_reporter.record_stage('export', time.perf_counter() - stage_started)
+        except Exception as e:
+            # The export is a secondary sink: the database is already up to date
+            log.warning('parquet_export_failed', error=str(e))
     
     # ============================================
     # Return Summary
@@ -255,7 +484,16 @@ def sync_meta_creative_data(
     summary = f"Synced {len(creatives_to_upsert)} creatives and {len(performance_to_upsert)} daily rows"
     if skipped_count > 0:
         summary += f" (skipped {skipped_count} rows)"
+    if dead_lettered_count > 0:
+        summary += f" ({dead_lettered_count} rejected rows dead-lettered)"
+    
+    # The job is done: nothing left to resume
+    checkpoint.clear()
     
-    print(f"✅ Sync Complete: {summary}")
+    duration = time.perf_counter() - sync_started
+    load_reporter.record_stage('total', duration)
+    log.info('sync_completed', creatives=len(creatives_to_upsert), daily_rows=len(performance_to_upsert),
+             skipped_rows=skipped_count, dead_lettered_rows=dead_lettered_count,
+             duration_seconds=round(duration, 3))
     return summary
 
@@ -0,0 +1,238 @@
+"""
+Parquet Export Sink
+
+Writes the transformed rows of a sync (the same rows upserted into dim_creatives
+and fact_creative_daily) as compressed, Hive-partitioned Parquet files, so
+warehouse and notebook users can read them without going through PostgREST:
+
+    <root>/dim_creatives/user_id=<id>/part-<timestamp>-<job>.parquet
+    <root>/fact_creative_daily/user_id=<id>/date=<YYYY-MM-DD>/part-<timestamp>-<job>.parquet
+
+The partition keys (user_id, and date for daily rows) are stored in the
+directory names only, not as columns of the files, so Hive-partitioned readers
+(pyarrow.dataset, Spark, DuckDB) see a single, consistent type for them.
+
+Exports are append-only: every sync adds new part files and never rewrites old
+ones. Readers that need one row per key keep the row with the latest updated_at.
+In-process consumers can subscribe to the Arrow record batches directly; they
+receive the full batches (partition keys included), without copies.
+"""
+
+import os
+import re
+import uuid
+from datetime import datetime, date, timezone
+from decimal import Decimal
+from typing import Dict, List, Any, Optional, Callable
+
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+
+# Column order and types are part of the export contract: add columns at the end only
+CREATIVES_SCHEMA = pa.schema([
+    ('platform_id', pa.string()),
+    ('platform', pa.string()),
+    ('name', pa.string()),
+    ('thumbnail_url', pa.string()),
+    ('body_copy', pa.string()),
+    ('headline', pa.string()),
+    ('user_id', pa.int32()),
+    ('updated_at', pa.timestamp('us', tz='UTC')),
+])
+
+PERFORMANCE_SCHEMA = pa.schema([
+    ('creative_id', pa.string()),
+    ('user_id', pa.int32()),
+    ('ad_id', pa.string()),
+    ('ad_name', pa.string()),
+    ('adset_id', pa.string()),
+    ('adset_name', pa.string()),
+    ('campaign_id', pa.string()),
+    ('campaign_name', pa.string()),
+    ('date', pa.date32()),
+    ('spend', pa.decimal128(15, 2)),
+    ('impressions', pa.int64()),
+    ('clicks', pa.int64()),
+    ('link_clicks', pa.int64()),
+    ('purchases', pa.int64()),
+    ('revenue', pa.decimal128(15, 2)),
+    ('currency', pa.string()),
+    ('updated_at', pa.timestamp('us', tz='UTC')),
+])
+
+# Columns stored as partition directories instead of in the files
+CREATIVES_PARTITION_COLUMNS = ['user_id']
+PERFORMANCE_PARTITION_COLUMNS = ['user_id', 'date']
+
+# Signature of in-process consumers: (table name, record batch)
+BatchConsumer = Callable[[str, pa.RecordBatch], None]
+
+
+def _to_timestamp(value: Any) -> Optional[datetime]:
+    if not value:
+        return None
+    if isinstance(value, datetime):
+        ts = value
+    else:
+        ts = datetime.fromisoformat(str(value))
+    # Sync rows carry naive UTC timestamps
+    return ts if ts.tzinfo else ts.replace(tzinfo=timezone.utc)
+
+
+def _to_date(value: Any) -> date:
+    if isinstance(value, date):
+        return value
+    return datetime.strptime(str(value)[:10], '%Y-%m-%d').date()
+
+
+def _to_decimal(value: Any) -> Decimal:
+    return Decimal(str(round(float(value or 0), 2)))
+
+
+class ParquetExporter:
+    """
+    Export sink for synced creatives and daily performance rows.
+    """
+
+    def __init__(self, root_dir: str, compression: str = 'zstd'):
+        self.root_dir = root_dir
+        self.compression = compression
+        self.consumers: List[BatchConsumer] = []
+
+    def add_consumer(self, consumer: BatchConsumer) -> None:
+        """
+        Registers an in-process consumer of the exported record batches.
+        """
+        self.consumers.append(consumer)
+
+    def creatives_batch(self, user_id: int, creatives: List[Dict[str, Any]]) -> pa.RecordBatch:
+        """
+        Builds a record batch from dim_creatives rows.
+        """
+        return pa.RecordBatch.from_pylist([
+            {
+                'platform_id': c.get('platform_id'),
+                'platform': c.get('platform'),
+                'name': c.get('name'),
+                'thumbnail_url': c.get('thumbnail_url'),
+                'body_copy': c.get('body_copy'),
+                'headline': c.get('headline'),
+                'user_id': user_id,
+                'updated_at': _to_timestamp(c.get('updated_at')),
+            }
+            for c in creatives
+        ], schema=CREATIVES_SCHEMA)
+
+    def performance_batch(self, rows: List[Dict[str, Any]]) -> pa.RecordBatch:
+        """
+        Builds a record batch from fact_creative_daily rows.
+        """
+        return pa.RecordBatch.from_pylist([
+            {
+                'creative_id': r.get('creative_id'),
+                'user_id': r.get('user_id'),
+                'ad_id': r.get('ad_id'),
+                'ad_name': r.get('ad_name'),
+                'adset_id': r.get('adset_id'),
+                'adset_name': r.get('adset_name'),
+                'campaign_id': r.get('campaign_id'),
+                'campaign_name': r.get('campaign_name'),
+                'date': _to_date(r.get('date')),
+                'spend': _to_decimal(r.get('spend')),
+                'impressions': int(r.get('impressions') or 0),
+                'clicks': int(r.get('clicks') or 0),
+                'link_clicks': int(r.get('link_clicks') or 0),
+                'purchases': int(r.get('purchases') or 0),
+                'revenue': _to_decimal(r.get('revenue')),
+                'currency': r.get('currency'),
+                'updated_at': _to_timestamp(r.get('updated_at')),
+            }
+            for r in rows
+        ], schema=PERFORMANCE_SCHEMA)
+
+    def export(
+        self,
+        user_id: int,
+        creatives: List[Dict[str, Any]],
+        performance: List[Dict[str, Any]],
+        job_id: Optional[str] = None
+    ) -> Dict[str, int]:
+        """
+        Appends one sync's rows to the export.
+
+        Args:
+            user_id: User the rows belong to
+            creatives: dim_creatives rows as upserted by the sync
+            performance: fact_creative_daily rows as upserted by the sync
+            job_id: Sync job ID, recorded in the part file names (optional)
+
+        Returns:
+            Number of part files written per table
+        """
+        part_name = self._part_name(job_id)
+        written = {'dim_creatives': 0, 'fact_creative_daily': 0}
+
+        if creatives:
+            batch = self.creatives_batch(user_id, creatives)
+            self._publish('dim_creatives', batch)
+            self._write(batch, CREATIVES_PARTITION_COLUMNS, ['dim_creatives', f'user_id={user_id}'], part_name)
+            written['dim_creatives'] += 1
+
+        # One file per (user, date) partition
+        rows_by_date: Dict[str, List[Dict[str, Any]]] = {}
+        for row in performance:
+            rows_by_date.setdefault(str(row.get('date'))[:10], []).append(row)
+
+        for date_str, rows in sorted(rows_by_date.items()):
+            batch = self.performance_batch(rows)
+            self._publish('fact_creative_daily', batch)
+            self._write(
+                batch, PERFORMANCE_PARTITION_COLUMNS,
+                ['fact_creative_daily', f'user_id={user_id}', f'date={date_str}'], part_name
+            )
+            written['fact_creative_daily'] += 1
+
+        return written
+
+    def _part_name(self, job_id: Optional[str]) -> str:
+        timestamp = datetime.utcnow().strftime('%Y%m%dT%H%M%S%f')
+        suffix = re.sub(r'[^A-Za-z0-9_-]', '_', job_id) if job_id else uuid.uuid4().hex[:12]
+        return f"part-{timestamp}-{suffix}.parquet"
+
+    def _publish(self, table: str, batch: pa.RecordBatch) -> None:
+        for consumer in self.consumers:
+            consumer(table, batch)
+
+    def _write(self, batch: pa.RecordBatch, partition_columns: List[str], partition: List[str], part_name: str) -> None:
+        directory = os.path.join(self.root_dir, *partition)
+        os.makedirs(directory, exist_ok=True)
+        path = os.path.join(directory, part_name)
+
+        # The partition columns are in the path; dropping them does not copy the other columns
+        table = pa.Table.from_batches([batch]).drop_columns(partition_columns)
+
+        # Write next to the final name and rename, so readers never see half-written files
+        tmp_path = f"{path}.tmp"
+        pq.write_table(table, tmp_path, compression=self.compression)
+        os.replace(tmp_path, path)
+
+
+_exporter: Optional[ParquetExporter] = None
+
+
+def get_parquet_exporter() -> Optional[ParquetExporter]:
+    """
+    Returns the process-wide exporter configured by PARQUET_EXPORT_DIR
+    (and optionally PARQUET_EXPORT_COMPRESSION), or None when exports are disabled.
+    """
+    global _exporter
+    root_dir = os.environ.get('PARQUET_EXPORT_DIR')
+    if not root_dir:
+        return None
+    if _exporter is None or _exporter.root_dir != root_dir:
+        _exporter = ParquetExporter(
+            root_dir,
+            compression=os.environ.get('PARQUET_EXPORT_COMPRESSION', 'zstd')
+        )
+    return _exporter
@@ -0,0 +1,219 @@
+"""
+Resilient Supabase Upserts
+
+Writes a batch so that one bad row cannot fail the whole sync:
+- transient errors (network, timeouts, deadlocks, overloaded database) are
+  retried with jittered exponential backoff;
+- data errors (e.g. NUMERIC overflow, FK violation) bisect the batch until the
+  offending rows are isolated; everything else is committed;
+- errors that would reject every row the same way (permissions, missing
+  table or column, missing partition, and anything that is not a database
+  error at all, such as a payload that cannot be encoded) are raised at once,
+  so the sync fails and keeps its checkpoint instead of dead-lettering the
+  whole batch;
+- offending rows are appended to a local dead-letter file (JSON lines) under
+  DEAD_LETTER_DIR, together with the database error;
+- callers that size batches adaptively can have oversized batches (statement
+  or read timeouts) raised at once, to retry them smaller instead.
+"""
+
+import json
+import os
+import random
+import threading
+import time
+from datetime import datetime
+from typing import Dict, List, Any, Optional
+
+import httpx
+from postgrest.exceptions import APIError
+from supabase import Client
+
+from lib.services.common.structured_log import get_logger
+from lib.services.common.adaptive_batcher import is_oversized_error
+
+log = get_logger(__name__)
+
+# SQLSTATE classes worth retrying: connection exceptions, transaction rollback
+# (serialization failure, deadlock), insufficient resources, operator intervention
+# (includes statement timeout)
+TRANSIENT_SQLSTATE_CLASSES = ('08', '40', '53', '57')
+
+# HTTP statuses reported as the error code when the gateway returns a non-JSON error body
+TRANSIENT_HTTP_STATUSES = ('429', '500', '502', '503', '504')
+
+# SQLSTATE classes that no row of the batch can get past: invalid authorization,
+# invalid schema name, syntax error or access rule violation (42501 permission
+# denied, 42703 undefined column, 42P01 undefined table, 42883 undefined function)
+FATAL_SQLSTATE_CLASSES = ('28', '3F', '42')
+
+# PostgREST's own errors (PGRST...) are about the request, the schema cache or the
+# JWT, never one row; 401/403/404 when the gateway answers without a JSON body
+FATAL_CODE_PREFIXES = ('PGRST',)
+FATAL_HTTP_STATUSES = ('401', '403', '404')
+
+# A row outside every partition is a check violation (23514), but it means the
+# partitions are missing for the month, not that the row is bad
+MISSING_PARTITION_MESSAGE = 'no partition of relation'
+FATAL_ERROR_MESSAGES = (MISSING_PARTITION_MESSAGE,)
+
+MAX_RETRIES = 4
+BACKOFF_BASE_SECONDS = 0.5
+BACKOFF_CAP_SECONDS = 8.0
+
+_dead_letter_lock = threading.Lock()
+
+
+def is_transient_error(error: Exception) -> bool:
+    """
+    Tells whether an upsert failure is worth retrying as-is.
+    """
+    if isinstance(error, APIError):
+        code = str(error.code or '')
+        return code in TRANSIENT_HTTP_STATUSES or code.startswith(TRANSIENT_SQLSTATE_CLASSES)
+    return isinstance(error, (httpx.TransportError, ConnectionError, TimeoutError))
+
+
+def is_fatal_error(error: Exception) -> bool:
+    """
+    Tells whether an upsert failure would reject any subset of the batch too,
+    so bisecting it would only dead-letter every row.
+    """
+    if not isinstance(error, APIError):
+        return False
+    code = str(error.code or '')
+    if code in FATAL_HTTP_STATUSES or code.startswith(FATAL_SQLSTATE_CLASSES + FATAL_CODE_PREFIXES):
+        return True
+    message = str(error.message or '').lower()
+    return any(text in message for text in FATAL_ERROR_MESSAGES)
+
+
+def is_missing_partition_error(error: Exception) -> bool:
+    """
+    Tells whether an upsert failed because the rows' partition does not exist.
+    """
+    return isinstance(error, APIError) and MISSING_PARTITION_MESSAGE in str(error.message or '').lower()
+
+
+def write_dead_letters(table: str, rows: List[Dict[str, Any]], error: Exception, job_id: Optional[str] = None) -> str:
+    """
+    Appends rows that could not be written to the dead-letter file of a table.
+
+    Returns:
+        Path of the dead-letter file
+    """
+    directory = os.environ.get('DEAD_LETTER_DIR', '/tmp/flux-dead-letter')
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, f"{table}-{datetime.utcnow().strftime('%Y%m%d')}.jsonl")
+
+    failed_at = datetime.utcnow().isoformat()
+    with _dead_letter_lock, open(path, 'a', encoding='utf-8') as f:
+        for row in rows:
+            f.write(json.dumps({
+                'table': table,
+                'job_id': job_id,
+                'failed_at': failed_at,
+                'error': str(error),
+                'row': row
+            }, default=str) + '\n')
+
+    return path
+
+
+def _execute_with_retry(
+    supabase: Client,
+    table: str,
+    rows: List[Dict[str, Any]],
+    on_conflict: str,
+    raise_oversized: bool = False
+) -> Optional[Exception]:
+    """
+    Upserts rows, retrying transient errors.
+
+    Returns:
+        None on success, or the data error that rejected the rows
+
+    Raises:
+        Exception: The last transient error once retries are exhausted, a
+            fatal or non-database error at once, or an oversized-batch error
+            at once when raise_oversized is set
+    """
+    for attempt in range(MAX_RETRIES + 1):
+        try:
+            supabase.table(table).upsert(rows, on_conflict=on_conflict).execute()
+            return None
+        except Exception as e:
+            if raise_oversized and len(rows) > 1 and is_oversized_error(e):
+                raise
+            if is_fatal_error(e):
+                raise
+            if not is_transient_error(e):
+                # Only the database rejects rows; any other error would recur for every half
+                if not isinstance(e, APIError):
+                    raise
+                return e
+            if attempt == MAX_RETRIES:
+                raise
+            # Full jitter keeps concurrent workers from retrying in lockstep
+            delay = random.uniform(0, min(BACKOFF_CAP_SECONDS, BACKOFF_BASE_SECONDS * 2 ** attempt))
+            log.warning('upsert_retrying', table=table, attempt=attempt + 1, delay_seconds=round(delay, 2), error=str(e))
+            time.sleep(delay)
+
+
+def resilient_upsert(
+    supabase: Client,
+    table: str,
+    rows: List[Dict[str, Any]],
+    on_conflict: str,
+    job_id: Optional[str] = None,
+    raise_oversized: bool = False
+) -> Dict[str, List[Dict[str, Any]]]:
+    """
+    Upserts a batch, isolating rows the database rejects.
+
+    A rejected batch is split in halves and each half retried, recursively, so a
+    batch of n rows with k bad ones costs about k * log2(n) extra requests.
+
+    Args:
+        supabase: Supabase client
+        table: Table to upsert into
+        rows: Rows of the batch
+        on_conflict: Conflict columns (comma separated)
+        job_id: Sync job ID, recorded with dead-lettered rows (optional)
+        raise_oversized: Raise a timeout of a multi-row batch at once instead
+            of retrying it, so the caller can retry it in smaller batches
+
+    Returns:
+        Dictionary with two keys:
+        - 'committed': Rows written to the table
+        - 'dead_lettered': Rows rejected and written to the dead-letter file
+
+    Raises:
+        Exception: If a transient error persists after all retries or the
+            error is fatal (the sync should fail and be resumed, not drop
+            rows), or an oversized-batch error when raise_oversized is set
+    """
+    result: Dict[str, List[Dict[str, Any]]] = {'committed': [], 'dead_lettered': []}
+    if not rows:
+        return result
+
+    error = _execute_with_retry(supabase, table, rows, on_conflict, raise_oversized)
+    if error is None:
+        result['committed'].extend(rows)
+        return result
+
+    if len(rows) == 1:
+        path = write_dead_letters(table, rows, error, job_id)
+        log.warning('row_dead_lettered', table=table, path=path, error=str(error))
+        result['dead_lettered'].extend(rows)
+        return result
+
+    # Halves never raise as oversized: once the first half is committed the
+    # caller could not tell which rows of the batch were written
+    middle = len(rows) // 2
+    for half in (rows[:middle], rows[middle:]):
+        half_result = resilient_upsert(supabase, table, half, on_conflict, job_id)
+        result['committed'].extend(half_result['committed'])
+        result['dead_lettered'].extend(half_result['dead_lettered'])
+
+    return result
@@ -0,0 +1,235 @@
+"""
+Sync Checkpoint Store
+
+Persists the progress of a Meta creative sync job in the sync_checkpoints table,
+so a job interrupted by a timeout, scale-in or OOM resumes from its last checkpoint.
+Fetched insights pages go to sync_checkpoint_pages, one row per page written once,
+so the checkpoint itself only carries cursors and maps.
+
+A checkpoint is only resumed by a sync of the same user and ad account: job IDs
+come from callers (and default ones are predictable), so a job ID alone must not
+hand out another account's fetched data. Checkpoints of jobs that never
+completed are purged after CHECKPOINT_TTL_HOURS, by the scheduled
+purge_stale_sync_checkpoints() and whenever a job completes.
+"""
+
+import os
+from datetime import datetime, timedelta
+from typing import Dict, List, Any, Optional
+from supabase import Client
+
+from lib.services.common.structured_log import get_logger
+
+log = get_logger(__name__)
+
+# Age after which an abandoned checkpoint (and its pages) is purged
+CHECKPOINT_TTL_HOURS = int(os.environ.get('CHECKPOINT_TTL_HOURS', 48))
+
+
+def _same_account(a: Any, b: Any) -> bool:
+    # '123' and 'act_123' are the same account
+    return str(a or '').replace('act_', '', 1) == str(b or '').replace('act_', '', 1)
+
+
+def default_job_id(user_id: int, ad_account_id: str, date_preset: str) -> str:
+    """
+    Builds the job ID used when the caller does not provide one.
+    
+    A retried request for the same user, account and preset on the same (UTC) day
+    maps to the same job, and therefore picks up its checkpoint.
+    """
+    return f"{user_id}:{ad_account_id}:{date_preset}:{datetime.utcnow().strftime('%Y-%m-%d')}"
+
+
+class SyncCheckpoint:
+    """
+    Durable state of one sync job.
+    
+    The state is a plain JSON-serialisable dict; callers update it with save()
+    after each unit of work that should survive a restart. Markers that change
+    often (such as the number of committed upsert rows) go through
+    save_progress(), which does not resend the whole state, and insights pages
+    through save_page(). Checkpointing is best-effort: if the table cannot be
+    reached the sync keeps going, it only loses the ability to resume.
+    """
+
+    # Pages read back per request when resuming
+    PAGES_PER_READ = 20
+
+    def __init__(self, supabase: Client, job_id: str, user_id: int, ad_account_id: str):
+        self.supabase = supabase
+        self.job_id = job_id
+        self.user_id = user_id
+        self.ad_account_id = ad_account_id
+        self.stage = 'started'
+        self.state: Dict[str, Any] = {}
+        self.progress: Dict[str, Any] = {}
+        # Set when a page could not be stored (a later checkpoint would resume without
+        # it), or when the job ID belongs to another user or account
+        self.disabled = False
+        # Whether the sync_checkpoints row exists: pages reference it
+        self._persisted = False
+
+    def load(self) -> Dict[str, Any]:
+        """
+        Loads the checkpoint of this job, if any, with its insights pages
+        (as state['fetch']['insights_rows']).
+        
+        Returns:
+            The checkpointed state (empty dict when starting fresh)
+        """
+        try:
+            response = self.supabase.table('sync_checkpoints').select(
+                'user_id, ad_account_id, stage, state, progress'
+            ).eq('job_id', self.job_id).execute()
+        except Exception as e:
+            # Without knowing whose job this is, writing to it could clobber another one
+            log.warning('checkpoint_load_failed', error=str(e))
+            self.disabled = True
+            return self.state
+        
+        if response.data:
+            row = response.data[0]
+            if row.get('user_id') != self.user_id or not _same_account(row.get('ad_account_id'), self.ad_account_id):
+                # Someone else's job: start fresh, and leave their checkpoint alone
+                log.warning('checkpoint_owner_mismatch')
+                self.disabled = True
+                return self.state
+            self._persisted = True
+            self.stage = row.get('stage') or self.stage
+            self.state = row.get('state') or {}
+            self.progress = row.get('progress') or {}
+        
+        fetch_state = self.state.get('fetch') or {}
+        if fetch_state.get('insights_pages'):
+            rows = self._load_pages(int(fetch_state['insights_pages']))
+            if rows is None:
+                # Without every page the later stages cannot resume either
+                # (committed fact rows are counted in fetch order)
+                log.warning('checkpoint_pages_missing', pages=fetch_state['insights_pages'])
+                self.stage, self.state, self.progress = 'started', {}, {}
+            else:
+                # Handed to the caller only: save() keeps writing the state without them
+                return {**self.state, 'fetch': {**fetch_state, 'insights_rows': rows}}
+        
+        return self.state
+
+    def _load_pages(self, count: int) -> Optional[List[Dict[str, Any]]]:
+        """
+        Reads pages 0..count-1 back, in order. Returns None if any is missing.
+        """
+        rows: List[Dict[str, Any]] = []
+        try:
+            for start in range(0, count, self.PAGES_PER_READ):
+                end = min(start + self.PAGES_PER_READ, count) - 1
+                response = self.supabase.table('sync_checkpoint_pages').select('page, rows').eq(
+                    'job_id', self.job_id
+                ).gte('page', start).lte('page', end).order('page').execute()
+                pages = response.data or []
+                if [p['page'] for p in pages] != list(range(start, end + 1)):
+                    return None
+                for page in pages:
+                    rows.extend(page['rows'])
+        except Exception as e:
+            log.warning('checkpoint_pages_load_failed', error=str(e))
+            return None
+        return rows
+
+    def save(self, stage: Optional[str] = None, **updates: Any) -> None:
+        """
+        Merges updates into the state and writes the checkpoint.
+        
+        Args:
+            stage: Name of the stage reached (optional, keeps the current one)
+            **updates: State keys to set
+        """
+        if stage:
+            self.stage = stage
+        self.state.update(updates)
+        if self.disabled:
+            return
+        
+        try:
+            self.supabase.table('sync_checkpoints').upsert({
+                'job_id': self.job_id,
+                'user_id': self.user_id,
+                'ad_account_id': self.ad_account_id,
+                'stage': self.stage,
+                'state': self.state,
+                'progress': self.progress,
+                'updated_at': datetime.utcnow().isoformat()
+            }, on_conflict='job_id').execute()
+            self._persisted = True
+        except Exception as e:
+            log.warning('checkpoint_save_failed', error=str(e))
+
+    def save_progress(self, **updates: Any) -> None:
+        """
+        Merges updates into the progress markers and writes only those.
+        
+        Args:
+            **updates: Progress keys to set
+        """
+        self.progress.update(updates)
+        if self.disabled:
+            return
+        
+        try:
+            self.supabase.table('sync_checkpoints').update({
+                'progress': self.progress,
+                'updated_at': datetime.utcnow().isoformat()
+            }).eq('job_id', self.job_id).execute()
+        except Exception as e:
+            log.warning('checkpoint_progress_save_failed', error=str(e))
+
+    def save_page(self, page: int, rows: List[Dict[str, Any]]) -> None:
+        """
+        Stores one fetched insights page (pages are numbered from 0).
+        
+        If a page cannot be stored, checkpointing stops for the rest of the job
+        and the existing checkpoint is deleted: resuming without that page would
+        silently lose its rows.
+        """
+        if self.disabled:
+            return
+        if not self._persisted:
+            self.save()
+        try:
+            self.supabase.table('sync_checkpoint_pages').upsert({
+                'job_id': self.job_id,
+                'page': page,
+                'rows': rows
+            }, on_conflict='job_id,page').execute()
+        except Exception as e:
+            log.warning('checkpoint_page_save_failed', page=page, error=str(e))
+            self.disabled = True
+            self._delete()
+
+    def clear(self) -> None:
+        """
+        Deletes the checkpoint once the job has completed, along with
+        checkpoints of other jobs abandoned for longer than CHECKPOINT_TTL_HOURS.
+        """
+        if not self.disabled:
+            self._delete()
+        self.state = {}
+        self.progress = {}
+        self.purge_stale()
+
+    def purge_stale(self) -> None:
+        """
+        Deletes checkpoints not updated for CHECKPOINT_TTL_HOURS (their pages cascade).
+        """
+        cutoff = datetime.utcnow() - timedelta(hours=CHECKPOINT_TTL_HOURS)
+        try:
+            self.supabase.table('sync_checkpoints').delete().lt('updated_at', cutoff.isoformat()).execute()
+        except Exception as e:
+            log.warning('checkpoint_purge_failed', error=str(e))
+
+    def _delete(self) -> None:
+        try:
+            # Its pages are deleted with it (ON DELETE CASCADE)
+            self.supabase.table('sync_checkpoints').delete().eq('job_id', self.job_id).execute()
+            self._persisted = False
+        except Exception as e:
+            log.warning('checkpoint_clear_failed', error=str(e))
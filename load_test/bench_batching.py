@@ -0,0 +1,160 @@
+"""
+Batching benchmark: fixed batch sizes vs the adaptive batcher.
+
+Replays two workloads against a latency model of the backend, on a simulated
+clock (nothing sleeps, results are reproducible with --seed):
+
+wide_creatives   Graph API creative lookups. Rows are wide (object_story_spec,
+                 long copy; --creative-kb on average, log-normal). Latency is
+                 a round trip plus transfer time; a response over
+                 --meta-max-mb fails with "Please reduce the amount of data".
+                 Fixed: 50 ids per call (the old chunk_size); a failed chunk
+                 is skipped, as the fetcher did.
+narrow_facts     fact_creative_daily upserts of ~350 byte rows. Latency is a
+                 round trip plus per-row write cost; a statement over
+                 --statement-timeout fails with SQLSTATE 57014.
+                 Fixed: 100 rows per upsert (the old batch_size).
+
+Both runs use the batchers with the settings of the fetcher and sync service.
+
+Usage (from the project root):
+    python load_test/bench_batching.py
+    python load_test/bench_batching.py --rows 20000 --creative-kb 45 --rtt-ms 120
+"""
+
+import argparse
+import os
+import random
+import sys
+from typing import Dict, List, Any, Callable, Optional
+
+project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, project_root)
+
+from lib.services.common.adaptive_batcher import AdaptiveBatcher
+
+
+class OversizedError(Exception):
+
+    def __init__(self, message: str, code: Optional[str] = None):
+        super().__init__(message)
+        self.code = code
+
+
+# A request: takes the item sizes (bytes) of the batch, returns latency in seconds or raises
+Backend = Callable[[List[int]], float]
+
+
+def meta_lookup_backend(args: argparse.Namespace) -> Backend:
+    def call(item_bytes: List[int]) -> float:
+        total = sum(item_bytes)
+        transfer = total / (args.meta_mb_per_s * 1_000_000)
+        if total > args.meta_max_mb * 1_000_000:
+            # Meta spends the time building the response before giving up
+            raise OversizedError('Please reduce the amount of data you\'re asking for, then retry your request')
+        return args.rtt_ms / 1000 + 0.002 * len(item_bytes) + transfer
+    return call
+
+
+def supabase_upsert_backend(args: argparse.Namespace) -> Backend:
+    def call(item_bytes: List[int]) -> float:
+        latency = args.rtt_ms / 1000 + args.row_write_ms / 1000 * len(item_bytes) + sum(item_bytes) / 20_000_000
+        if latency > args.statement_timeout:
+            raise OversizedError('canceling statement due to statement timeout', code='57014')
+        return latency
+    return call
+
+
+def run_fixed(items: List[int], size: int, backend: Backend) -> Dict[str, Any]:
+    clock, delivered, failed, requests = 0.0, 0, 0, 0
+    for i in range(0, len(items), size):
+        batch = items[i:i + size]
+        requests += 1
+        try:
+            clock += backend(batch)
+            delivered += len(batch)
+        except OversizedError:
+            clock += 1.0  # time until the error came back
+            failed += len(batch)
+    return {'seconds': clock, 'delivered': delivered, 'failed': failed, 'requests': requests}
+
+
+def run_adaptive(items: List[int], batcher: AdaptiveBatcher, backend: Backend) -> Dict[str, Any]:
+    clock, delivered, failed, requests = 0.0, 0, 0, 0
+    sizes: List[int] = []
+    i = 0
+    while i < len(items):
+        batch = items[i:i + batcher.size]
+        requests += 1
+        sizes.append(len(batch))
+        try:
+            latency = backend(batch)
+        except OversizedError:
+            clock += 1.0
+            if batcher.record_oversized(len(batch)):
+                continue
+            failed += len(batch)
+            i += len(batch)
+            continue
+        clock += latency
+        batcher.record(len(batch), latency, sum(batch))
+        delivered += len(batch)
+        i += len(batch)
+    return {'seconds': clock, 'delivered': delivered, 'failed': failed, 'requests': requests,
+            'final_size': batcher.size, 'median_size': sorted(sizes)[len(sizes) // 2]}
+
+
+def report(name: str, fixed: Dict[str, Any], adaptive: Dict[str, Any]) -> None:
+    print(f"{name}")
+    for label, r in (('fixed', fixed), ('adaptive', adaptive)):
+        throughput = r['delivered'] / r['seconds'] if r['seconds'] else 0.0
+        extra = f"  median batch {r['median_size']}, final {r['final_size']}" if 'final_size' in r else ''
+        print(f"   {label:<9} {throughput:>9.0f} rows/s  {r['requests']:>5} requests  "
+              f"{r['seconds']:>7.1f}s  delivered {r['delivered']}  failed {r['failed']}{extra}")
+    fixed_rate = fixed['delivered'] / fixed['seconds'] if fixed['seconds'] else 0.0
+    adaptive_rate = adaptive['delivered'] / adaptive['seconds']
+    if fixed_rate:
+        print(f"   throughput gain: {adaptive_rate / fixed_rate:.2f}x")
+    else:
+        print("   throughput gain: fixed batches delivered nothing")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Compare fixed and adaptive batch sizes on a backend latency model')
+    parser.add_argument('--rows', type=int, default=20000)
+    parser.add_argument('--seed', type=int, default=7)
+    parser.add_argument('--rtt-ms', type=float, default=80.0)
+    parser.add_argument('--creative-kb', type=float, default=30.0, help='Average creative row size')
+    parser.add_argument('--meta-mb-per-s', type=float, default=5.0)
+    parser.add_argument('--meta-max-mb', type=float, default=2.0, help='Response size Meta refuses')
+    parser.add_argument('--row-write-ms', type=float, default=0.4, help='Database cost per upserted row')
+    parser.add_argument('--statement-timeout', type=float, default=2.0)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    creatives = [int(rng.lognormvariate(0, 0.5) * args.creative_kb * 1000) for _ in range(args.rows // 10)]
+    facts = [int(rng.gauss(350, 40)) for _ in range(args.rows)]
+
+    print(f"Latency model: rtt {args.rtt_ms} ms, {len(creatives)} creatives (~{args.creative_kb} KB), "
+          f"{len(facts)} fact rows (~350 B)")
+
+    report(
+        'wide_creatives (Graph API creative lookups)',
+        run_fixed(creatives, 50, meta_lookup_backend(args)),
+        run_adaptive(creatives, AdaptiveBatcher(
+            'meta_creative_lookup', initial_size=50, min_size=1, max_size=50,
+            target_latency_seconds=3.0, max_payload_bytes=1_500_000
+        ), meta_lookup_backend(args))
+    )
+    report(
+        'narrow_facts (fact_creative_daily upserts)',
+        run_fixed(facts, 100, supabase_upsert_backend(args)),
+        run_adaptive(facts, AdaptiveBatcher(
+            'supabase_fact_upsert', initial_size=100, min_size=10, max_size=1000,
+            target_latency_seconds=1.0, max_payload_bytes=1_000_000
+        ), supabase_upsert_backend(args))
+    )
+
+
+if __name__ == '__main__':
+    main()
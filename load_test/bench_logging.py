@@ -0,0 +1,164 @@
+"""
+Logging overhead benchmark for the sync stages.
+
+Runs a CPU-only stand-in for the fact stage (build the rows of each batch the
+way meta_sync_service does) and compares its wall time with:
+    none        no logging at all
+    print       the previous style: line-buffered print per batch and stage
+    info        structured logger at INFO (per-batch debug events are dropped)
+    debug       structured logger at DEBUG, per-batch events sampled 1 in 10
+    debug_all   structured logger at DEBUG, every event kept
+
+Output goes to a file in a temporary directory so that every write is a real
+syscall, as it is on a container's stdout. For the structured variants,
+'drained' includes the time for the background thread to write the queue out.
+'per call' is the caller-side cost of one per-batch log call.
+
+Usage (from the project root):
+    python load_test/bench_logging.py --batches 2000 --batch-size 100 --repeat 7
+"""
+
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+from datetime import datetime
+from typing import Dict, List, Any, Callable
+
+project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, project_root)
+
+from lib.services.common.structured_log import configure_logging, flush_logging, get_logger, log_context
+
+
+def build_batch(batch_size: int, offset: int) -> List[Dict[str, Any]]:
+    rows = []
+    for n in range(offset, offset + batch_size):
+        rows.append({
+            'creative_id': f'uuid-{n % 500}',
+            'user_id': 7,
+            'ad_id': f'ad_{n}',
+            'ad_name': f'Ad {n}',
+            'adset_id': f'as_{n % 40}',
+            'campaign_id': f'cmp_{n % 5}',
+            'date': '2025-01-15',
+            'spend': float(n % 300),
+            'impressions': n * 7 % 50000,
+            'clicks': n % 900,
+            'updated_at': datetime.utcnow().isoformat()
+        })
+    return rows
+
+
+def stage_without_logging(batches: int, batch_size: int) -> None:
+    total = 0
+    for i in range(batches):
+        total += len(build_batch(batch_size, i * batch_size))
+
+
+def stage_with_print(batches: int, batch_size: int) -> None:
+    print("📈 Phase 2: Syncing performance to fact_creative_daily...")
+    total = 0
+    for i in range(batches):
+        batch = build_batch(batch_size, i * batch_size)
+        print(f"   Processing batch {i + 1} ({len(batch)} rows)...")
+        total += len(batch)
+    print(f"   ✅ Upserted {total} performance rows")
+
+
+def stage_with_structured_log(batches: int, batch_size: int) -> None:
+    log = get_logger('bench')
+    log.debug('facts_sync_started')
+    total = 0
+    for i in range(batches):
+        batch = build_batch(batch_size, i * batch_size)
+        total += len(batch)
+        log.debug('facts_batch_upserted', sample=True, month='2025-01', rows=len(batch), total_rows=total)
+    log.debug('facts_upserted', rows=total)
+
+
+def per_call_seconds(call: Callable[[], None], n: int) -> float:
+    started = time.perf_counter()
+    for _ in range(n):
+        call()
+    return (time.perf_counter() - started) / n
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Measure logging overhead in the fact stage')
+    parser.add_argument('--batches', type=int, default=2000)
+    parser.add_argument('--batch-size', type=int, default=100)
+    parser.add_argument('--repeat', type=int, default=7)
+    parser.add_argument('--calls', type=int, default=200000, help='Calls timed per variant in the per-call test')
+    args = parser.parse_args()
+
+    # (level, sample every) of the structured variants; None = not structured
+    variants = {
+        'none': None,
+        'print': None,
+        'info': ('INFO', 10),
+        'debug': ('DEBUG', 10),
+        'debug_all': ('DEBUG', 1)
+    }
+    stage: Dict[str, List[float]] = {name: [] for name in variants}
+    drained: Dict[str, List[float]] = {name: [] for name in variants}
+    per_call: Dict[str, float] = {}
+
+    with tempfile.TemporaryDirectory() as tmp:
+        out = open(os.path.join(tmp, 'out.log'), 'w', buffering=1)
+        stdout = sys.stdout
+        log = get_logger('bench')
+
+        def select(name: str) -> Callable[[], None]:
+            if name == 'none':
+                return lambda: stage_without_logging(args.batches, args.batch_size)
+            if name == 'print':
+                return lambda: stage_with_print(args.batches, args.batch_size)
+            level, sample_every = variants[name]
+            # Large enough that no record is dropped: the full cost is measured
+            configure_logging(level=level, fmt='json', sample_every=sample_every,
+                              queue_size=max(args.calls, args.batches) + 10, stream=out)
+            return lambda: stage_with_structured_log(args.batches, args.batch_size)
+
+        # Variants are interleaved and the best run kept, so machine noise
+        # (other tenants, frequency scaling) does not favour one of them
+        sys.stdout = out
+        try:
+            with log_context(sync_id='bench', job_id='bench:job', user_id=7, ad_account_id='act_1'):
+                for _ in range(args.repeat):
+                    for name in random.sample(list(variants), len(variants)):
+                        run = select(name)
+                        started = time.perf_counter()
+                        run()
+                        stage[name].append(time.perf_counter() - started)
+                        flush_logging()
+                        drained[name].append(time.perf_counter() - started)
+
+                # Caller-side cost of one per-batch log call
+                per_call['print'] = per_call_seconds(
+                    lambda: print(f"   Processing batch {1} ({100} rows)..."), args.calls)
+                for name in ('info', 'debug', 'debug_all'):
+                    select(name)
+                    per_call[name] = per_call_seconds(
+                        lambda: log.debug('facts_batch_upserted', sample=True, month='2025-01', rows=100,
+                                          total_rows=1000),
+                        args.calls)
+                    flush_logging()
+        finally:
+            sys.stdout = stdout
+        out.close()
+
+    baseline = min(stage['none'])
+    print(f"Fact stage stand-in: {args.batches} batches x {args.batch_size} rows, best of {args.repeat}")
+    print(f"{'variant':<10} {'stage ms':>10} {'overhead':>10} {'drained ms':>11} {'per call':>10}")
+    for name in variants:
+        best = min(stage[name])
+        call = f"{per_call[name] * 1e6:>8.2f}us" if name in per_call else f"{'-':>10}"
+        print(f"{name:<10} {best * 1000:>10.1f} {(best - baseline) / baseline * 100:>9.1f}% "
+              f"{min(drained[name]) * 1000:>11.1f} {call}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,391 @@
+"""
+Partitioning benchmark: fact_creative_daily as a single heap table vs monthly
+range partitions.
+
+Builds one database per layout from the real migrations (heap: up to
+20250116000000_add_user_id_to_fact_creative_daily.sql; partitioned: up to
+20250201000000_partition_fact_creative_daily.sql), loads the same generated
+rows into both, and measures:
+
+bulk_load        rows loaded in date order (how syncs fill the table over time)
+upsert_recent    sync-shaped upserts (ON CONFLICT (ad_id, date, user_id) DO
+                 UPDATE, one transaction per batch, as PostgREST runs them) of
+                 the last 3 days of every user: two days of updates, one of
+                 new rows
+upsert_backfill  the same for 3 days a year back (re-syncs of closed months)
+leaderboard_7d   per-user spend/revenue by creative over 7 days (the
+leaderboard_90d  dashboard's query), over 90 days
+month_scan       total spend of one closed month (the backfill month) across
+                 all users
+maintenance      maintain_fact_creative_daily_partitions(): compacts (CLUSTER)
+                 the closed months (partitioned layout only)
+
+and the table and index sizes of each layout.
+
+Needs a Postgres 14+ server where the user may create databases, and psycopg2
+(pip install psycopg2-binary). Supabase roles and the auth schema are created
+if missing, so a plain local Postgres works.
+
+Usage (from the project root):
+    python load_test/bench_partitioning.py --dsn postgresql://postgres@localhost:5432/postgres
+    python load_test/bench_partitioning.py --dsn ... --users 20 --days 120 --json bench.json
+"""
+
+import argparse
+import glob
+import json
+import os
+import random
+import time
+from datetime import date, timedelta
+from typing import Dict, List, Any, Optional, Tuple
+
+project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+migrations_dir = os.path.join(project_root, 'supabase', 'migrations')
+
+# Last migration applied for each layout
+LAYOUTS = {
+    'heap': '20250116000000',
+    'partitioned': '20250201000000',
+}
+
+# What the migrations expect from Supabase
+SUPABASE_PREREQUISITES = """
+DO $$
+BEGIN
+    IF NOT EXISTS (SELECT 1 FROM pg_roles WHERE rolname = 'anon') THEN CREATE ROLE anon NOLOGIN; END IF;
+    IF NOT EXISTS (SELECT 1 FROM pg_roles WHERE rolname = 'authenticated') THEN CREATE ROLE authenticated NOLOGIN; END IF;
+    IF NOT EXISTS (SELECT 1 FROM pg_roles WHERE rolname = 'service_role') THEN CREATE ROLE service_role NOLOGIN; END IF;
+END $$;
+CREATE SCHEMA IF NOT EXISTS auth;
+CREATE TABLE IF NOT EXISTS auth.users (id UUID PRIMARY KEY, email TEXT);
+CREATE OR REPLACE FUNCTION auth.uid() RETURNS UUID LANGUAGE sql STABLE AS 'SELECT NULL::UUID';
+CREATE TABLE IF NOT EXISTS users (id SERIAL PRIMARY KEY, email TEXT UNIQUE);
+"""
+
+FACT_COLUMNS = (
+    'creative_id', 'user_id', 'ad_id', 'ad_name', 'adset_id', 'adset_name', 'campaign_id', 'campaign_name',
+    'date', 'spend', 'impressions', 'clicks', 'link_clicks', 'purchases', 'revenue', 'currency', 'updated_at'
+)
+
+# One day of generated rows: every ad of every user, with random metrics
+GENERATE_DAY = """
+INSERT INTO fact_creative_daily (
+    creative_id, user_id, ad_id, ad_name, adset_id, adset_name, campaign_id, campaign_name,
+    date, spend, impressions, clicks, link_clicks, purchases, revenue, currency
+)
+SELECT
+    c.id, u, 'ad_' || u || '_' || a, 'Ad ' || a, 'as_' || u || '_' || (a %% 8), 'Ad set ' || (a %% 8),
+    'cp_' || u || '_' || (a %% 3), 'Campaign ' || (a %% 3),
+    %(day)s::DATE,
+    round((random() * 200)::NUMERIC, 2), (random() * 20000)::INT, (random() * 400)::INT,
+    (random() * 300)::INT, (random() * 12)::INT, round((random() * 600)::NUMERIC, 2), 'USD'
+FROM generate_series(1, %(users)s) AS u
+CROSS JOIN generate_series(0, %(ads)s - 1) AS a
+JOIN bench_creatives c ON c.user_id = u AND c.k = a %% %(creatives)s
+"""
+
+
+def percentile(values: List[float], p: float) -> float:
+    ordered = sorted(values)
+    k = (len(ordered) - 1) * p / 100.0
+    lower = int(k)
+    upper = min(lower + 1, len(ordered) - 1)
+    return ordered[lower] + (ordered[upper] - ordered[lower]) * (k - lower)
+
+
+def connect(dsn: str, dbname: Optional[str] = None):
+    import psycopg2
+    kwargs = {'dbname': dbname} if dbname else {}
+    return psycopg2.connect(dsn, **kwargs)
+
+
+def create_database(args: argparse.Namespace, layout: str) -> str:
+    name = f'bench_fact_{layout}'
+    admin = connect(args.dsn)
+    admin.autocommit = True
+    with admin.cursor() as cur:
+        cur.execute(f'DROP DATABASE IF EXISTS {name}')
+        cur.execute(f'CREATE DATABASE {name}')
+    admin.close()
+
+    conn = connect(args.dsn, name)
+    conn.autocommit = True
+    with conn.cursor() as cur:
+        cur.execute(SUPABASE_PREREQUISITES)
+        for path in sorted(glob.glob(os.path.join(migrations_dir, '*.sql'))):
+            version = os.path.basename(path).split('_')[0]
+            if version > LAYOUTS[layout]:
+                break
+            with open(path) as f:
+                cur.execute(f.read())
+    conn.close()
+    return name
+
+
+def seed(conn, args: argparse.Namespace, first_day: date, last_day: date, partitioned: bool) -> float:
+    """
+    Loads every user's ads for every day in date order. Returns the seconds taken.
+    """
+    with conn.cursor() as cur:
+        cur.execute("INSERT INTO users (email) SELECT 'user' || u || '@bench.local' FROM generate_series(1, %s) u",
+                    (args.users,))
+        cur.execute("""
+            CREATE TABLE bench_creatives AS
+            SELECT u AS user_id, k, gen_random_uuid() AS id
+            FROM generate_series(1, %(users)s) u CROSS JOIN generate_series(0, %(creatives)s - 1) k
+        """, {'users': args.users, 'creatives': args.creatives})
+        cur.execute("""
+            INSERT INTO dim_creatives (id, platform_id, platform, name)
+            SELECT id, 'cr_' || user_id || '_' || k, 'meta', 'Creative ' || k FROM bench_creatives
+        """)
+        cur.execute('CREATE INDEX ON bench_creatives (user_id, k)')
+        if partitioned:
+            cur.execute('SELECT ensure_fact_creative_daily_partitions(%s, %s)', (first_day, last_day))
+    conn.commit()
+
+    started = time.perf_counter()
+    day, loaded = first_day, 0
+    params = {'users': args.users, 'ads': args.ads, 'creatives': args.creatives}
+    while day <= last_day:
+        with conn.cursor() as cur:
+            cur.execute(GENERATE_DAY, dict(params, day=day))
+            loaded += cur.rowcount
+        conn.commit()
+        if day.day == 1:
+            print(f"   {day:%Y-%m}  {loaded:>11,} rows  {time.perf_counter() - started:>7.0f}s", flush=True)
+        day += timedelta(days=1)
+    seconds = time.perf_counter() - started
+
+    with conn.cursor() as cur:
+        cur.execute('ANALYZE')
+    conn.commit()
+    return seconds
+
+
+def sync_rows(conn, users: List[int], days: List[date], args: argparse.Namespace) -> List[Tuple]:
+    """
+    Rows a sync of `days` would upsert for `users` (new metrics for every ad).
+    """
+    with conn.cursor() as cur:
+        cur.execute('SELECT user_id, k, id FROM bench_creatives WHERE user_id = ANY(%s)', (users,))
+        creatives = {(u, k): str(i) for u, k, i in cur.fetchall()}
+    rng = random.Random(args.seed)
+    rows = []
+    for u in users:
+        for d in days:
+            for a in range(args.ads):
+                rows.append((
+                    creatives[(u, a % args.creatives)], u, f'ad_{u}_{a}', f'Ad {a}', f'as_{u}_{a % 8}',
+                    f'Ad set {a % 8}', f'cp_{u}_{a % 3}', f'Campaign {a % 3}', d,
+                    round(rng.random() * 200, 2), rng.randrange(20000), rng.randrange(400), rng.randrange(300),
+                    rng.randrange(12), round(rng.random() * 600, 2), 'USD', 'now'
+                ))
+    return rows
+
+
+def run_upserts(conn, rows: List[Tuple], batch_size: int) -> Dict[str, Any]:
+    from psycopg2.extras import execute_values
+    sql = (
+        f"INSERT INTO fact_creative_daily ({', '.join(FACT_COLUMNS)}) VALUES %s "
+        f"ON CONFLICT (ad_id, date, user_id) DO UPDATE SET "
+        + ', '.join(f'{c} = EXCLUDED.{c}' for c in FACT_COLUMNS if c not in ('ad_id', 'date', 'user_id'))
+    )
+    latencies = []
+    started = time.perf_counter()
+    for i in range(0, len(rows), batch_size):
+        batch_started = time.perf_counter()
+        with conn.cursor() as cur:
+            execute_values(cur, sql, rows[i:i + batch_size], page_size=batch_size)
+        conn.commit()
+        latencies.append(time.perf_counter() - batch_started)
+    seconds = time.perf_counter() - started
+    return {
+        'rows': len(rows), 'seconds': round(seconds, 2), 'rows_per_s': round(len(rows) / seconds),
+        'batch_p50_ms': round(percentile(latencies, 50) * 1000, 1),
+        'batch_p95_ms': round(percentile(latencies, 95) * 1000, 1)
+    }
+
+
+def run_queries(conn, sql: str, params: List[Dict[str, Any]]) -> Dict[str, Any]:
+    latencies = []
+    for p in params:
+        started = time.perf_counter()
+        with conn.cursor() as cur:
+            cur.execute(sql, p)
+            cur.fetchall()
+        latencies.append(time.perf_counter() - started)
+    conn.rollback()
+    return {
+        'queries': len(params), 'queries_per_s': round(len(params) / sum(latencies), 1),
+        'p50_ms': round(percentile(latencies, 50) * 1000, 2),
+        'p95_ms': round(percentile(latencies, 95) * 1000, 2)
+    }
+
+
+LEADERBOARD = """
+SELECT creative_id, SUM(spend) AS spend, SUM(revenue) AS revenue, SUM(impressions), SUM(clicks)
+FROM fact_creative_daily
+WHERE user_id = %(user_id)s AND date BETWEEN %(start)s AND %(end)s
+GROUP BY creative_id
+ORDER BY spend DESC
+"""
+
+MONTH_SCAN = "SELECT SUM(spend) FROM fact_creative_daily WHERE date >= %(start)s AND date < %(end)s"
+
+
+def sizes(conn) -> Dict[str, Any]:
+    with conn.cursor() as cur:
+        # pg_partition_tree() lists nothing for a plain table
+        cur.execute("""
+            WITH leaves AS (
+                SELECT relid FROM pg_partition_tree('fact_creative_daily') WHERE isleaf
+                UNION
+                SELECT oid FROM pg_class WHERE oid = 'fact_creative_daily'::regclass AND relkind = 'r'
+            )
+            SELECT SUM(pg_table_size(relid)), SUM(pg_indexes_size(relid)), COUNT(*) FROM leaves
+        """)
+        table_bytes, index_bytes, leaves = cur.fetchone()
+        cur.execute("""
+            SELECT COUNT(DISTINCT indexrelid) FROM pg_index
+            WHERE indrelid = 'fact_creative_daily'::regclass
+        """)
+        indexes = cur.fetchone()[0]
+    conn.rollback()
+    return {'table_mb': round(table_bytes / 2 ** 20), 'index_mb': round(index_bytes / 2 ** 20),
+            'tables': leaves, 'indexes': indexes}
+
+
+def bench_layout(args: argparse.Namespace, layout: str, first_day: date, last_day: date) -> Dict[str, Any]:
+    print(f"{layout}: creating database", flush=True)
+    conn = connect(args.dsn, create_database(args, layout))
+    partitioned = layout == 'partitioned'
+    result: Dict[str, Any] = {}
+
+    print(f"{layout}: loading {args.users} users x {args.ads} ads x {(last_day - first_day).days + 1} days", flush=True)
+    seconds = seed(conn, args, first_day, last_day, partitioned)
+    with conn.cursor() as cur:
+        cur.execute('SELECT COUNT(*) FROM fact_creative_daily')
+        rows = cur.fetchone()[0]
+    conn.rollback()
+    result['bulk_load'] = {'rows': rows, 'seconds': round(seconds, 1), 'rows_per_s': round(rows / seconds)}
+    result['size_after_load'] = sizes(conn)
+
+    rng = random.Random(args.seed)
+    users = rng.sample(range(1, args.users + 1), min(args.sync_users, args.users))
+    recent = [last_day - timedelta(days=1), last_day, last_day + timedelta(days=1)]
+    if partitioned:
+        with conn.cursor() as cur:
+            cur.execute('SELECT ensure_fact_creative_daily_partitions(%s, %s)', (recent[0], recent[-1]))
+        conn.commit()
+    # A year back, or the oldest days with a shorter history
+    backfill_end = max(last_day - timedelta(days=365), first_day + timedelta(days=2))
+    backfill = [backfill_end - timedelta(days=2), backfill_end - timedelta(days=1), backfill_end]
+
+    print(f"{layout}: upserts", flush=True)
+    result['upsert_recent'] = run_upserts(conn, sync_rows(conn, users, recent, args), args.batch_size)
+    result['upsert_backfill'] = run_upserts(conn, sync_rows(conn, users, backfill, args), args.batch_size)
+
+    print(f"{layout}: range scans", flush=True)
+    with conn.cursor() as cur:
+        cur.execute('ANALYZE fact_creative_daily')
+    conn.commit()
+    scan_users = [rng.randrange(1, args.users + 1) for _ in range(args.queries)]
+    for name, span in (('leaderboard_7d', 7), ('leaderboard_90d', 90)):
+        result[name] = run_queries(conn, LEADERBOARD, [
+            {'user_id': u, 'start': last_day - timedelta(days=span - 1), 'end': last_day} for u in scan_users
+        ])
+    month = date(backfill_end.year, backfill_end.month, 1)
+    next_month = date(month.year + month.month // 12, month.month % 12 + 1, 1)
+    result['month_scan'] = run_queries(conn, MONTH_SCAN, [{'start': month, 'end': next_month}] * args.month_queries)
+
+    if partitioned and not args.skip_maintenance:
+        print(f"{layout}: maintenance (compaction of closed months)", flush=True)
+        conn.autocommit = True
+        started = time.perf_counter()
+        with conn.cursor() as cur:
+            # Retention long enough to keep every generated month
+            cur.execute('SELECT maintain_fact_creative_daily_partitions(%s)', (args.days // 28 + 3,))
+        result['maintenance'] = {'seconds': round(time.perf_counter() - started, 1)}
+        conn.autocommit = False
+        result['size_after_maintenance'] = sizes(conn)
+        result['leaderboard_90d_after_maintenance'] = run_queries(conn, LEADERBOARD, [
+            {'user_id': u, 'start': last_day - timedelta(days=89), 'end': last_day} for u in scan_users
+        ])
+
+    conn.close()
+    return result
+
+
+def report(results: Dict[str, Dict[str, Any]]) -> None:
+    heap, part = results.get('heap'), results.get('partitioned')
+
+    def ratio(key: str, metric: str) -> str:
+        if not heap or not part or key not in heap or key not in part:
+            return ''
+        return f"{part[key][metric] / heap[key][metric]:.2f}x"
+
+    print()
+    print(f"{'':<22}{'heap':>18}{'partitioned':>18}{'partitioned/heap':>18}")
+    for key, metric, unit in (
+        ('bulk_load', 'rows_per_s', 'rows/s'),
+        ('upsert_recent', 'rows_per_s', 'rows/s'),
+        ('upsert_backfill', 'rows_per_s', 'rows/s'),
+        ('leaderboard_7d', 'queries_per_s', 'q/s'),
+        ('leaderboard_90d', 'queries_per_s', 'q/s'),
+        ('month_scan', 'queries_per_s', 'q/s'),
+    ):
+        cells = [f"{r[key][metric]:>11,} {unit:<6}" if r and key in r else f"{'-':>18}" for r in (heap, part)]
+        print(f"{key:<22}{cells[0]}{cells[1]}{ratio(key, metric):>18}")
+    for key in ('upsert_recent', 'upsert_backfill'):
+        cells = [f"{r[key]['batch_p95_ms']:>11} {'ms':<6}" if r and key in r else f"{'-':>18}" for r in (heap, part)]
+        print(f"{key + ' p95':<22}{cells[0]}{cells[1]}")
+    for key in ('leaderboard_7d', 'leaderboard_90d', 'month_scan'):
+        cells = [f"{r[key]['p50_ms']:>11} {'ms':<6}" if r and key in r else f"{'-':>18}" for r in (heap, part)]
+        print(f"{key + ' p50':<22}{cells[0]}{cells[1]}")
+    for r, label in ((heap, 'heap'), (part, 'partitioned')):
+        if r:
+            s = r['size_after_load']
+            print(f"size ({label}): table {s['table_mb']} MB, indexes {s['index_mb']} MB "
+                  f"({s['indexes']} indexes, {s['tables']} tables)")
+    if part and 'maintenance' in part:
+        s = part['size_after_maintenance']
+        print(f"maintenance: {part['maintenance']['seconds']}s, then table {s['table_mb']} MB, "
+              f"indexes {s['index_mb']} MB; leaderboard_90d "
+              f"{part['leaderboard_90d_after_maintenance']['queries_per_s']} q/s "
+              f"(p50 {part['leaderboard_90d_after_maintenance']['p50_ms']} ms)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Compare the heap and partitioned fact_creative_daily layouts')
+    parser.add_argument('--dsn', default=os.environ.get('DATABASE_URL'), help='Server to create the databases on')
+    parser.add_argument('--layouts', default='heap,partitioned')
+    parser.add_argument('--users', type=int, default=200)
+    parser.add_argument('--ads', type=int, default=66, help='Ads per user (one row per ad and day)')
+    parser.add_argument('--creatives', type=int, default=20, help='Creatives per user')
+    parser.add_argument('--days', type=int, default=760, help='Days of history (default: ~25 months)')
+    parser.add_argument('--sync-users', type=int, default=200, help='Users synced in the upsert runs')
+    parser.add_argument('--batch-size', type=int, default=500)
+    parser.add_argument('--queries', type=int, default=200)
+    parser.add_argument('--month-queries', type=int, default=5)
+    parser.add_argument('--skip-maintenance', action='store_true')
+    parser.add_argument('--seed', type=int, default=7)
+    parser.add_argument('--json', dest='json_path', default=None, help='Also write the results as JSON to this path')
+    args = parser.parse_args()
+    if not args.dsn:
+        parser.error('--dsn (or DATABASE_URL) is required')
+
+    # History ends yesterday: the recent upserts update two days and insert today
+    last_day = date.today() - timedelta(days=1)
+    first_day = last_day - timedelta(days=args.days - 1)
+    print(f"{args.users * args.ads * args.days:,} rows from {first_day} to {last_day}")
+
+    results = {layout: bench_layout(args, layout, first_day, last_day) for layout in args.layouts.split(',')}
+    report(results)
+    if args.json_path:
+        with open(args.json_path, 'w') as f:
+            json.dump(results, f, indent=2, default=str)
+
+
+if __name__ == '__main__':
+    main()
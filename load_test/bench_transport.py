@@ -0,0 +1,127 @@
+"""
+Transport benchmark: a fresh SDK session per sync vs the shared connection pool.
+
+Runs the same Meta fetches (fetch_creative_performance) against FakeMetaServer
+twice:
+
+before   every sync builds its API with FacebookAdsApi.init(), as the fetcher
+         did before http_transport: a new requests.Session, so a new
+         connection pool, per sync.
+after    every sync builds its API with http_transport.build_api(): one
+         process-wide pool, keep-alive sockets reused across syncs.
+
+For each run it reports requests served against connections opened, from
+get_transport_stats() for the shared pool and from the per-sync pools for the
+SDK sessions, cross-checked with the connections the fake server accepted.
+The fake server speaks plain HTTP on localhost: a connection here costs a TCP
+handshake only, where Meta also costs a TLS handshake per connection, so the
+wall-clock difference understates the one in production.
+
+Usage (from the project root):
+    python load_test/bench_transport.py
+    python load_test/bench_transport.py --syncs 40 --concurrency 4 --latency-ms 30
+"""
+
+import argparse
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Any, Callable
+
+project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, project_root)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from facebook_business.api import FacebookAdsApi
+from facebook_business.session import FacebookSession
+
+from fake_servers import FakeMetaServer, FaultProfile
+from lib.services.common.structured_log import configure_logging
+from lib.services.connector import http_transport, meta_creative_fetcher
+from lib.services.connector.http_transport import configure_transport, get_transport_stats
+
+
+def run_syncs(meta: FakeMetaServer, build: Callable[[str], FacebookAdsApi], args: argparse.Namespace) -> float:
+    meta_creative_fetcher.build_api = build
+
+    def sync(n: int) -> None:
+        account = str(n % args.accounts + 1)
+        meta_creative_fetcher.fetch_creative_performance(f'act_{account}', f'token-{account}')
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+        list(pool.map(sync, range(args.syncs)))
+    return time.perf_counter() - started
+
+
+def run_before(meta: FakeMetaServer, args: argparse.Namespace) -> Dict[str, Any]:
+    sessions: List[FacebookSession] = []
+    lock = threading.Lock()
+
+    def build(access_token: str) -> FacebookAdsApi:
+        # What FacebookAdsApi.init() does, pointed at the fake server
+        session = FacebookSession(access_token=access_token)
+        session.GRAPH = meta.url
+        with lock:
+            sessions.append(session)
+        return FacebookAdsApi(session)
+
+    seconds = run_syncs(meta, build, args)
+    connections_opened = 0
+    for session in sessions:
+        for adapter in session.requests.adapters.values():
+            pools = adapter.poolmanager.pools
+            for key in list(pools.keys()):
+                connections_opened += pools[key].num_connections
+    return {'seconds': seconds, 'requests': meta.stats['requests'], 'connections_opened': connections_opened}
+
+
+def run_after(meta: FakeMetaServer, args: argparse.Namespace) -> Dict[str, Any]:
+    os.environ['META_GRAPH_URL'] = meta.url
+    configure_transport()
+    seconds = run_syncs(meta, http_transport.build_api, args)
+    stats = get_transport_stats()
+    return {'seconds': seconds, 'requests': stats['requests'], 'connections_opened': stats['connections_opened']}
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Compare per-sync SDK sessions with the shared Graph API pool')
+    parser.add_argument('--syncs', type=int, default=20)
+    parser.add_argument('--accounts', type=int, default=5)
+    parser.add_argument('--concurrency', type=int, default=4)
+    parser.add_argument('--ads', type=int, default=200, help='Ads per account')
+    parser.add_argument('--days', type=int, default=7)
+    parser.add_argument('--page-size', type=int, default=100, help='Insights rows per page')
+    parser.add_argument('--latency-ms', type=float, default=20.0, help='Fake Meta latency per request')
+    args = parser.parse_args()
+
+    # The fetcher logs every batch; keep the report readable
+    configure_logging(level='WARNING')
+
+    results = {}
+    for name, run in (('before', run_before), ('after', run_after)):
+        meta = FakeMetaServer(FaultProfile(latency_ms=args.latency_ms), ads_per_account=args.ads, days=args.days,
+                              creatives_per_account=args.ads // 4, page_size=args.page_size).start()
+        try:
+            result = run(meta, args)
+            result['server_connections'] = meta.stats['connections']
+        finally:
+            meta.stop()
+        results[name] = result
+
+    print(f"{args.syncs} syncs over {args.accounts} accounts, {args.concurrency} at once, "
+          f"{args.ads} ads x {args.days} days, {args.latency_ms} ms per request")
+    for name, r in results.items():
+        reuse = r['requests'] / r['connections_opened'] if r['connections_opened'] else 0.0
+        print(f"   {name:<7} {r['requests']:>6} requests  {r['connections_opened']:>5} connections opened "
+              f"(server saw {r['server_connections']})  {reuse:>6.1f} requests/connection  {r['seconds']:>6.2f}s")
+    before, after = results['before'], results['after']
+    if after['connections_opened']:
+        print(f"   connections: {before['connections_opened'] / after['connections_opened']:.1f}x fewer, "
+              f"wall clock: {before['seconds'] / after['seconds']:.2f}x")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,371 @@
+"""
+Fake Meta Graph API and Supabase (PostgREST) servers for load testing.
+
+Both servers are in-memory, thread-per-request HTTP servers with tunable
+latency and error injection. They implement only what the worker calls:
+
+FakeMetaServer
+    GET /<version>/act_<id>/insights   paged ad-level insights
+    GET /<version>/?ids=...&fields=... Ad / AdCreative lookups
+    Every account only accepts the token 'token-<account id>'; a request
+    carrying another account's token is answered with an OAuth error and
+    counted as token cross-talk.
+
+FakeSupabaseServer
+    /rest/v1/<table>      GET (eq./in. filters), POST (upsert), PATCH, DELETE
+    /rest/v1/rpc/<name>   POST (partition, membership and lease functions)
+"""
+
+import json
+import random
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Any
+from urllib.parse import urlsplit, parse_qs
+
+
+class FaultProfile:
+    """
+    Latency and error injection settings of a fake server.
+    """
+
+    def __init__(self, latency_ms: float = 0.0, jitter_ms: float = 0.0, error_rate: float = 0.0):
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.error_rate = error_rate
+
+    def delay(self) -> None:
+        latency = self.latency_ms + random.uniform(-self.jitter_ms, self.jitter_ms)
+        if latency > 0:
+            time.sleep(latency / 1000.0)
+
+    def should_fail(self) -> bool:
+        return self.error_rate > 0 and random.random() < self.error_rate
+
+
+class _FakeServer:
+    """
+    Runs a ThreadingHTTPServer with the given handler on a background thread.
+    """
+
+    def __init__(self, handler_class, faults: FaultProfile, host: str = '127.0.0.1', port: int = 0):
+        self.faults = faults
+        self.stats: Dict[str, int] = {'requests': 0, 'connections': 0, 'injected_errors': 0}
+        self.stats_lock = threading.Lock()
+        self.httpd = ThreadingHTTPServer((host, port), handler_class)
+        self.httpd.daemon_threads = True
+        self.httpd.fake = self
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+
+    @property
+    def url(self) -> str:
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def count(self, key: str, n: int = 1) -> None:
+        with self.stats_lock:
+            self.stats[key] = self.stats.get(key, 0) + n
+
+    def start(self) -> '_FakeServer':
+        self.thread.start()
+        return self
+
+    def stop(self) -> None:
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+class _JsonHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format, *args):
+        # Keep the load test output readable
+        pass
+
+    @property
+    def fake(self):
+        return self.server.fake
+
+    def setup(self):
+        # One handler per TCP connection: keep-alive requests reuse it
+        super().setup()
+        self.fake.count('connections')
+
+    def send_json(self, status: int, payload: Any) -> None:
+        body = json.dumps(payload).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def read_json(self) -> Any:
+        length = int(self.headers.get('Content-Length') or 0)
+        if not length:
+            return None
+        return json.loads(self.rfile.read(length))
+
+    def begin(self) -> bool:
+        """
+        Applies latency and error injection. Returns False if an error was sent.
+        """
+        self.fake.count('requests')
+        self.fake.faults.delay()
+        if self.fake.faults.should_fail():
+            self.fake.count('injected_errors')
+            self.read_json()
+            self.send_injected_error()
+            return False
+        return True
+
+    def send_injected_error(self) -> None:
+        raise NotImplementedError
+
+
+# ============================================
+# Fake Meta Graph API
+# ============================================
+
+class _MetaHandler(_JsonHandler):
+
+    def send_injected_error(self) -> None:
+        self.send_json(500, {'error': {
+            'message': 'An unexpected error has occurred. Please retry your request later.',
+            'type': 'OAuthException',
+            'code': 2,
+            'is_transient': True
+        }})
+
+    def send_token_error(self) -> None:
+        self.fake.count('token_crosstalk')
+        self.send_json(400, {'error': {
+            'message': 'Invalid OAuth access token for this account',
+            'type': 'OAuthException',
+            'code': 190
+        }})
+
+    def do_GET(self):
+        if not self.begin():
+            return
+
+        url = urlsplit(self.path)
+        params = {k: v[0] for k, v in parse_qs(url.query).items()}
+        parts = [p for p in url.path.split('/') if p]
+        token = params.get('access_token', '')
+
+        # /<version>/act_<id>/insights
+        if len(parts) == 3 and parts[1].startswith('act_') and parts[2] == 'insights':
+            account = parts[1][len('act_'):]
+            if token != f'token-{account}':
+                return self.send_token_error()
+            return self.send_json(200, self.fake.insights_page(account, params))
+
+        # /<version>/?ids=...
+        if len(parts) <= 1 and 'ids' in params:
+            ids = [i for i in params['ids'].split(',') if i]
+            fields = params.get('fields', '')
+            for object_id in ids:
+                if token != f"token-{object_id.split('_')[1]}":
+                    return self.send_token_error()
+            if 'thumbnail_url' in fields:
+                return self.send_json(200, {i: self.fake.creative(i) for i in ids})
+            return self.send_json(200, {i: self.fake.ad(i) for i in ids})
+
+        self.send_json(404, {'error': {'message': f'Unknown path {url.path}', 'code': 100}})
+
+
+class FakeMetaServer(_FakeServer):
+    """
+    Serves synthetic insights: `ads_per_account` ads with one row per day over `days` days.
+    Ad IDs look like 'ad_<account>_<n>' and creative IDs like 'cr_<account>_<n>'.
+    """
+
+    def __init__(self, faults: FaultProfile, ads_per_account: int = 200, days: int = 3,
+                 creatives_per_account: int = 50, page_size: int = 500, **kwargs):
+        super().__init__(_MetaHandler, faults, **kwargs)
+        self.ads_per_account = ads_per_account
+        self.days = days
+        self.creatives_per_account = creatives_per_account
+        self.page_size = page_size
+
+    def insights_page(self, account: str, params: Dict[str, str]) -> Dict[str, Any]:
+        total = self.ads_per_account * self.days
+        page_size = min(int(params.get('limit', self.page_size)), self.page_size)
+        offset = int(params.get('after') or 0)
+        end = min(offset + page_size, total)
+
+        rows = []
+        for n in range(offset, end):
+            ad, day = divmod(n, self.days)
+            date = time.strftime('%Y-%m-%d', time.gmtime(time.time() - 86400 * (day + 1)))
+            rows.append({
+                'ad_id': f'ad_{account}_{ad}',
+                'ad_name': f'Ad {ad}',
+                'adset_id': f'as_{account}_{ad % 10}',
+                'adset_name': f'Ad set {ad % 10}',
+                'campaign_id': f'cmp_{account}_{ad % 3}',
+                'campaign_name': f'Campaign {ad % 3}',
+                'spend': f'{random.uniform(1, 300):.2f}',
+                'impressions': str(random.randint(100, 50000)),
+                'clicks': str(random.randint(1, 900)),
+                'outbound_clicks': [{'action_type': 'outbound_click', 'value': str(random.randint(0, 400))}],
+                'actions': [{'action_type': 'purchase', 'value': str(random.randint(0, 20))}],
+                'action_values': [{'action_type': 'purchase', 'value': f'{random.uniform(0, 900):.2f}'}],
+                'date_start': date,
+                'date_stop': date
+            })
+
+        response: Dict[str, Any] = {'data': rows, 'paging': {'cursors': {'before': str(offset), 'after': str(end)}}}
+        if end < total:
+            response['paging']['next'] = f'{self.url}/insights?after={end}'
+        return response
+
+    def ad(self, ad_id: str) -> Dict[str, Any]:
+        _, account, n = ad_id.split('_')
+        return {'id': ad_id, 'creative': {'id': f'cr_{account}_{int(n) % self.creatives_per_account}'}}
+
+    def creative(self, creative_id: str) -> Dict[str, Any]:
+        return {
+            'id': creative_id,
+            'name': f'Creative {creative_id}',
+            'thumbnail_url': f'https://example.invalid/{creative_id}.jpg',
+            'body': 'Body copy ' * 8,
+            'title': f'Headline {creative_id}',
+            'call_to_action_type': 'SHOP_NOW'
+        }
+
+
+# ============================================
+# Fake Supabase (PostgREST)
+# ============================================
+
+class _SupabaseHandler(_JsonHandler):
+
+    def send_injected_error(self) -> None:
+        # 57014 = statement timeout, which the worker treats as transient
+        self.send_json(500, {'code': '57014', 'message': 'canceling statement due to statement timeout',
+                             'details': None, 'hint': None})
+
+    def route(self):
+        url = urlsplit(self.path)
+        parts = [p for p in url.path.split('/') if p]
+        params = {k: v[0] for k, v in parse_qs(url.query).items()}
+        # /rest/v1/<table> or /rest/v1/rpc/<name>
+        if len(parts) >= 3 and parts[:2] == ['rest', 'v1']:
+            return parts[2:], params
+        return None, params
+
+    def do_GET(self):
+        if not self.begin():
+            return
+        path, params = self.route()
+        if not path:
+            return self.send_json(404, {'message': 'not found'})
+        self.send_json(200, self.fake.select(path[0], params))
+
+    def do_POST(self):
+        if not self.begin():
+            return
+        path, params = self.route()
+        body = self.read_json()
+        if not path:
+            return self.send_json(404, {'message': 'not found'})
+        if path[0] == 'rpc':
+            return self.send_json(200, self.fake.rpc(path[1], body or {}))
+        rows = body if isinstance(body, list) else [body]
+        self.send_json(201, self.fake.upsert(path[0], rows))
+
+    def do_PATCH(self):
+        if not self.begin():
+            return
+        path, _ = self.route()
+        self.read_json()
+        self.fake.count(f'patch:{path[0] if path else "?"}')
+        self.send_json(200, [])
+
+    def do_DELETE(self):
+        if not self.begin():
+            return
+        path, _ = self.route()
+        self.fake.count(f'delete:{path[0] if path else "?"}')
+        self.send_json(200, [])
+
+
+class FakeSupabaseServer(_FakeServer):
+    """
+    Keeps dim_creatives in memory (so UUID mappings work) and only counts writes
+    to every other table.
+    """
+
+    def __init__(self, faults: FaultProfile, **kwargs):
+        super().__init__(_SupabaseHandler, faults, **kwargs)
+        self.creative_ids: Dict[str, str] = {}
+        # Coordination state, mirroring sync_instances and sync_leases
+        self.instances: Dict[str, Dict[str, Any]] = {}
+        self.leases: Dict[str, Dict[str, Any]] = {}
+        self.data_lock = threading.Lock()
+
+    def upsert(self, table: str, rows: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        self.count(f'rows:{table}', len(rows))
+        if table != 'dim_creatives':
+            return rows
+        with self.data_lock:
+            for row in rows:
+                row['id'] = self.creative_ids.setdefault(row['platform_id'], str(uuid.uuid4()))
+        return rows
+
+    def select(self, table: str, params: Dict[str, str]) -> List[Dict[str, Any]]:
+        self.count(f'select:{table}')
+        if table != 'dim_creatives' or 'platform_id' not in params:
+            return []
+        values = params['platform_id']
+        if not values.startswith('in.('):
+            return []
+        wanted = [v.strip('"') for v in values[len('in.('):-1].split(',')]
+        with self.data_lock:
+            return [
+                {'id': self.creative_ids[p], 'platform_id': p}
+                for p in wanted if p in self.creative_ids
+            ]
+
+    def rpc(self, name: str, args: Dict[str, Any]) -> Any:
+        self.count(f'rpc:{name}')
+        if name == 'ensure_fact_creative_daily_partitions':
+            return 1
+
+        now = time.time()
+        with self.data_lock:
+            if name == 'heartbeat_sync_instance':
+                self.instances[args['p_instance_id']] = {'url': args.get('p_instance_url'), 'at': now}
+                ttl = args.get('p_ttl_seconds', 60)
+                self.instances = {k: v for k, v in self.instances.items() if v['at'] >= now - ttl}
+                return [{'instance_id': k, 'instance_url': v['url']} for k, v in sorted(self.instances.items())]
+            if name == 'leave_sync_instance':
+                self.instances.pop(args['p_instance_id'], None)
+                self.leases = {k: v for k, v in self.leases.items() if v['instance_id'] != args['p_instance_id']}
+                return None
+            if name == 'acquire_sync_lease':
+                lease = self.leases.get(args['p_ad_account_id'])
+                # Not re-entrant: a held lease is refused even to the same instance
+                if lease and lease['expires_at'] >= now:
+                    self.count('lease_conflicts')
+                    return False
+                self.leases[args['p_ad_account_id']] = {
+                    'holder': args['p_holder'], 'instance_id': args['p_instance_id'],
+                    'expires_at': now + args['p_ttl_seconds']
+                }
+                return True
+            if name == 'renew_sync_lease':
+                lease = self.leases.get(args['p_ad_account_id'])
+                if not lease or lease['holder'] != args['p_holder']:
+                    return False
+                lease['expires_at'] = now + args['p_ttl_seconds']
+                return True
+            if name == 'release_sync_lease':
+                lease = self.leases.get(args['p_ad_account_id'])
+                if lease and lease['holder'] == args['p_holder']:
+                    del self.leases[args['p_ad_account_id']]
+                return None
+        return None
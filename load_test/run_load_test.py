@@ -0,0 +1,300 @@
+"""
+Load test for the Python sync worker (main.py).
+
+Starts fake Meta Graph API and Supabase servers, launches the worker against
+them, then drives POST /sync and GET /health at a configurable concurrency and
+arrival rate. Reports p50/p95/p99 latency, throughput and error rate per
+endpoint, and the worker's resident memory over time.
+
+Usage (from the project root):
+    python load_test/run_load_test.py --concurrency 16 --rate 4 --duration 60
+    python load_test/run_load_test.py --concurrency 8 --rate 0 --meta-latency-ms 150 --meta-error-rate 0.02
+
+--rate is the mean number of requests per second (Poisson arrivals, open loop);
+--rate 0 runs a closed loop where each of the --concurrency clients sends its
+next request as soon as the previous one returns.
+"""
+
+import argparse
+import json
+import os
+import random
+import subprocess
+import sys
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Any, Optional
+
+import requests
+
+sys.path.insert(0, os.path.dirname(__file__))
+
+from fake_servers import FakeMetaServer, FakeSupabaseServer, FaultProfile
+
+project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+
+# Shaped like a JWT, which the Supabase client requires; never valid anywhere
+FAKE_SUPABASE_KEY = 'eyJhbGciOiJIUzI1NiIsInR5cCI6IkpXVCJ9.eyJyb2xlIjoic2VydmljZV9yb2xlIn0.load-test'
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description='Load test the /sync worker against fake Meta and Supabase servers')
+    parser.add_argument('--concurrency', type=int, default=8, help='Maximum requests in flight')
+    parser.add_argument('--rate', type=float, default=2.0, help='Mean arrivals per second (0 = closed loop)')
+    parser.add_argument('--duration', type=float, default=60.0, help='Seconds to generate load')
+    parser.add_argument('--health-ratio', type=float, default=0.2, help='Share of requests sent to /health')
+    parser.add_argument('--accounts', type=int, default=50, help='Distinct ad accounts to sync')
+    parser.add_argument('--ads', type=int, default=200, help='Ads per account')
+    parser.add_argument('--days', type=int, default=3, help='Days of insights per ad')
+    parser.add_argument('--meta-latency-ms', type=float, default=80.0)
+    parser.add_argument('--meta-jitter-ms', type=float, default=40.0)
+    parser.add_argument('--meta-error-rate', type=float, default=0.0)
+    parser.add_argument('--supabase-latency-ms', type=float, default=20.0)
+    parser.add_argument('--supabase-jitter-ms', type=float, default=10.0)
+    parser.add_argument('--supabase-error-rate', type=float, default=0.0)
+    parser.add_argument('--worker-port', type=int, default=18080)
+    parser.add_argument('--worker-url', default=None, help='Use an already running worker instead of starting one')
+    parser.add_argument('--request-timeout', type=float, default=300.0)
+    parser.add_argument('--json', dest='json_path', default=None, help='Also write the report as JSON to this path')
+    return parser.parse_args()
+
+
+def percentile(values: List[float], p: float) -> Optional[float]:
+    if not values:
+        return None
+    ordered = sorted(values)
+    k = (len(ordered) - 1) * p / 100.0
+    lower = int(k)
+    upper = min(lower + 1, len(ordered) - 1)
+    return ordered[lower] + (ordered[upper] - ordered[lower]) * (k - lower)
+
+
+def read_rss_mb(pid: int) -> Optional[float]:
+    """
+    Resident set size of a process in MB (Linux /proc only).
+    """
+    try:
+        with open(f'/proc/{pid}/status') as f:
+            for line in f:
+                if line.startswith('VmRSS:'):
+                    return int(line.split()[1]) / 1024.0
+    except OSError:
+        return None
+    return None
+
+
+class LoadTest:
+
+    def __init__(self, args: argparse.Namespace, worker_url: str, worker_pid: Optional[int]):
+        self.args = args
+        self.worker_url = worker_url
+        self.worker_pid = worker_pid
+        self.results: List[Dict[str, Any]] = []
+        self.results_lock = threading.Lock()
+        self.memory: List[Dict[str, float]] = []
+        self.stop = threading.Event()
+
+    def one_request(self) -> None:
+        if random.random() < self.args.health_ratio:
+            endpoint = '/health'
+            call = lambda: requests.get(f'{self.worker_url}/health', timeout=self.args.request_timeout)
+        else:
+            endpoint = '/sync'
+            account = 1000 + random.randrange(self.args.accounts)
+            payload = {
+                'user_id': 1 + account % 20,
+                'ad_account_id': f'act_{account}',
+                'access_token': f'token-{account}',
+                'date_preset': 'last_3d',
+                # Unique job per request: every sync does the full work
+                'job_id': f'load-{uuid.uuid4().hex}'
+            }
+            call = lambda: requests.post(f'{self.worker_url}/sync', json=payload, timeout=self.args.request_timeout)
+
+        started = time.perf_counter()
+        try:
+            response = call()
+            status = response.status_code
+            ok = status == 200
+        except requests.RequestException as e:
+            status = type(e).__name__
+            ok = False
+        latency = time.perf_counter() - started
+
+        with self.results_lock:
+            self.results.append({
+                'endpoint': endpoint,
+                'latency': latency,
+                'ok': ok,
+                'status': status,
+                'finished_at': time.time()
+            })
+
+    def sample_memory(self, started: float) -> None:
+        while not self.stop.is_set():
+            rss = read_rss_mb(self.worker_pid) if self.worker_pid else None
+            with self.results_lock:
+                completed = len(self.results)
+            self.memory.append({'t': round(time.time() - started, 1), 'rss_mb': rss, 'completed': completed})
+            self.stop.wait(1.0)
+
+    def run(self) -> float:
+        started = time.time()
+        sampler = threading.Thread(target=self.sample_memory, args=(started,), daemon=True)
+        sampler.start()
+
+        deadline = time.monotonic() + self.args.duration
+        if self.args.rate > 0:
+            # Open loop: arrivals do not wait for responses, up to `concurrency` in flight
+            slots = threading.Semaphore(self.args.concurrency)
+            with ThreadPoolExecutor(max_workers=self.args.concurrency) as pool:
+                next_arrival = time.monotonic()
+                while next_arrival < deadline:
+                    time.sleep(max(0.0, next_arrival - time.monotonic()))
+                    if slots.acquire(blocking=False):
+                        future = pool.submit(self.one_request)
+                        future.add_done_callback(lambda _: slots.release())
+                    else:
+                        # Saturated: the arrival is dropped and counted as an error
+                        with self.results_lock:
+                            self.results.append({'endpoint': 'dropped', 'latency': 0.0, 'ok': False,
+                                                 'status': 'client_saturated', 'finished_at': time.time()})
+                    next_arrival += random.expovariate(self.args.rate)
+        else:
+            def client():
+                while time.monotonic() < deadline:
+                    self.one_request()
+            threads = [threading.Thread(target=client) for _ in range(self.args.concurrency)]
+            for t in threads:
+                t.start()
+            for t in threads:
+                t.join()
+
+        elapsed = time.time() - started
+        self.stop.set()
+        sampler.join()
+        return elapsed
+
+    def report(self, elapsed: float, meta: FakeMetaServer, supabase: FakeSupabaseServer) -> Dict[str, Any]:
+        report: Dict[str, Any] = {'elapsed_seconds': round(elapsed, 1), 'endpoints': {}}
+        for endpoint in sorted({r['endpoint'] for r in self.results}):
+            rows = [r for r in self.results if r['endpoint'] == endpoint]
+            latencies = [r['latency'] for r in rows if r['ok']]
+            errors = [r for r in rows if not r['ok']]
+            statuses: Dict[str, int] = {}
+            for r in errors:
+                statuses[str(r['status'])] = statuses.get(str(r['status']), 0) + 1
+            report['endpoints'][endpoint] = {
+                'requests': len(rows),
+                'throughput_rps': round(len(rows) / elapsed, 2) if elapsed else None,
+                'error_rate': round(len(errors) / len(rows), 4) if rows else None,
+                'errors_by_status': statuses,
+                'p50_ms': _ms(percentile(latencies, 50)),
+                'p95_ms': _ms(percentile(latencies, 95)),
+                'p99_ms': _ms(percentile(latencies, 99)),
+                'max_ms': _ms(max(latencies) if latencies else None)
+            }
+        report['worker_memory'] = self.memory
+        report['fake_meta'] = dict(meta.stats)
+        report['fake_supabase'] = dict(supabase.stats)
+        return report
+
+
+def _ms(seconds: Optional[float]) -> Optional[float]:
+    return round(seconds * 1000, 1) if seconds is not None else None
+
+
+def start_worker(args: argparse.Namespace, meta: FakeMetaServer, supabase: FakeSupabaseServer) -> subprocess.Popen:
+    env = dict(os.environ)
+    env.update({
+        'PORT': str(args.worker_port),
+        'NEXT_PUBLIC_SUPABASE_URL': supabase.url,
+        'SUPABASE_SERVICE_ROLE_KEY': FAKE_SUPABASE_KEY,
+        'META_GRAPH_URL': meta.url,
+        'DEAD_LETTER_DIR': os.path.join(project_root, '.load_test_dead_letter'),
+        'PYTHONUNBUFFERED': '1'
+    })
+    env.pop('PARQUET_EXPORT_DIR', None)
+    log = open(os.path.join(project_root, 'load_test_worker.log'), 'w')
+    return subprocess.Popen([sys.executable, 'main.py'], cwd=project_root, env=env, stdout=log, stderr=subprocess.STDOUT)
+
+
+def wait_until_healthy(url: str, timeout: float = 30.0) -> None:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            if requests.get(f'{url}/health', timeout=1).status_code == 200:
+                return
+        except requests.RequestException:
+            pass
+        time.sleep(0.2)
+    raise RuntimeError(f'Worker at {url} did not become healthy within {timeout}s (see load_test_worker.log)')
+
+
+def print_report(report: Dict[str, Any]) -> None:
+    print('=' * 60)
+    print(f"📊 Load test results ({report['elapsed_seconds']}s)")
+    print('=' * 60)
+    for endpoint, stats in report['endpoints'].items():
+        print(f"{endpoint}")
+        print(f"   requests: {stats['requests']}  throughput: {stats['throughput_rps']} req/s  "
+              f"error rate: {stats['error_rate']}")
+        print(f"   p50: {stats['p50_ms']} ms  p95: {stats['p95_ms']} ms  p99: {stats['p99_ms']} ms  "
+              f"max: {stats['max_ms']} ms")
+        if stats['errors_by_status']:
+            print(f"   errors: {stats['errors_by_status']}")
+    samples = [m for m in report['worker_memory'] if m['rss_mb'] is not None]
+    if samples:
+        print(f"worker RSS: start {samples[0]['rss_mb']:.1f} MB, "
+              f"peak {max(m['rss_mb'] for m in samples):.1f} MB, end {samples[-1]['rss_mb']:.1f} MB")
+        step = max(1, len(samples) // 10)
+        print('   ' + '  '.join(f"{m['t']}s:{m['rss_mb']:.0f}MB" for m in samples[::step]))
+    print(f"fake Meta: {report['fake_meta']}")
+    print(f"fake Supabase: {report['fake_supabase']}")
+    if report['fake_meta'].get('token_crosstalk'):
+        print('❌ Token cross-talk detected: a sync called Meta with another account\'s token')
+
+
+def main():
+    args = parse_args()
+
+    meta = FakeMetaServer(
+        FaultProfile(args.meta_latency_ms, args.meta_jitter_ms, args.meta_error_rate),
+        ads_per_account=args.ads,
+        days=args.days
+    ).start()
+    supabase = FakeSupabaseServer(
+        FaultProfile(args.supabase_latency_ms, args.supabase_jitter_ms, args.supabase_error_rate)
+    ).start()
+
+    worker = None
+    try:
+        if args.worker_url:
+            worker_url = args.worker_url.rstrip('/')
+        else:
+            worker = start_worker(args, meta, supabase)
+            worker_url = f'http://127.0.0.1:{args.worker_port}'
+        wait_until_healthy(worker_url)
+
+        print(f"🚀 Driving {worker_url}: concurrency={args.concurrency} rate={args.rate}/s "
+              f"duration={args.duration}s")
+        test = LoadTest(args, worker_url, worker.pid if worker else None)
+        elapsed = test.run()
+        report = test.report(elapsed, meta, supabase)
+
+        print_report(report)
+        if args.json_path:
+            with open(args.json_path, 'w') as f:
+                json.dump(report, f, indent=2)
+    finally:
+        if worker:
+            worker.terminate()
+            worker.wait(timeout=10)
+        meta.stop()
+        supabase.stop()
+
+
+if __name__ == '__main__':
+    main()
@@ -7,14 +7,29 @@ Meta creative data synchronization.
 
 import os
 import sys
-from flask import Flask, request, jsonify
+from datetime import date, timedelta
+from typing import Optional
+import requests
+from flask import Flask, request, jsonify, Response
 
 # Add project root to path for imports
 project_root = os.path.abspath(os.path.dirname(__file__))
 if project_root not in sys.path:
     sys.path.insert(0, project_root)
 
-from lib.services.sync.meta_sync_service import sync_meta_creative_data
+from lib.services.sync.meta_sync_service import sync_meta_creative_data, get_supabase_client
+from lib.services.sync.fact_cache import get_creative_leaderboard
+from lib.services.sync.coordination import LeaseUnavailableError, get_coordinator
+from lib.services.common.structured_log import get_logger
+from lib.services.common.load_reporter import load_reporter
+from lib.services.common.adaptive_batcher import get_batcher_stats
+from lib.services.common.session_cache import session_cache
+from lib.services.connector.http_transport import add_request_listener
+
+log = get_logger('worker')
+
+# Meta rate-limit usage headers feed the readiness check
+add_request_listener(load_reporter.record_meta_response)
 
 app = Flask(__name__)
 
@@ -29,7 +44,8 @@ def sync_meta_data():
         "user_id": 123,
         "ad_account_id": "act_123456789",
         "access_token": "...",
-        "date_preset": "last_3d"  # optional
+        "date_preset": "last_3d",  # optional
+        "job_id": "..."  # optional, resumes the checkpoint of an interrupted job
     }
     
     Returns:
@@ -60,6 +76,7 @@ def sync_meta_data():
         ad_account_id = data['ad_account_id']
         access_token = data['access_token']
         date_preset = data.get('date_preset', 'last_3d')  # Optional, default to last_3d
+        job_id = data.get('job_id')  # Optional, derived by the sync service if missing
         
         # Validate user_id is an integer
         try:
@@ -84,25 +101,54 @@ def sync_meta_data():
                 "message": "access_token must be a non-empty string"
             }), 400
         
-        # Call the sync function
+        # With coordination enabled, send the sync to the instance that owns this
+        # account on the hash ring (once: forwarded requests are always run locally)
+        coordinator = get_coordinator()
+        if coordinator and not request.headers.get('X-Sync-Forwarded-By'):
+            owner_url = coordinator.owner_url(ad_account_id)
+            if owner_url:
+                try:
+                    forwarded = requests.post(
+                        f"{owner_url.rstrip('/')}/sync",
+                        json=data,
+                        headers={'X-Sync-Forwarded-By': coordinator.instance_id},
+                        timeout=float(os.environ.get('SYNC_FORWARD_TIMEOUT_SECONDS', 900))
+                    )
+                    return Response(
+                        forwarded.content,
+                        status=forwarded.status_code,
+                        content_type=forwarded.headers.get('Content-Type', 'application/json')
+                    )
+                except requests.RequestException as e:
+                    # Owner unreachable: the lease still keeps the sync exclusive
+                    log.warning('sync_forward_failed', owner_url=owner_url, ad_account_id=ad_account_id, error=str(e))
+        
+        # Call the sync function (counted in the load report; waits for a slot
+        # when MAX_CONCURRENT_SYNCS is set)
         try:
-            result_message = sync_meta_creative_data(
-                user_id=user_id,
-                ad_account_id=ad_account_id,
-                access_token=access_token,
-                date_preset=date_preset
-            )
+            with load_reporter.sync_slot():
+                result_message = sync_meta_creative_data(
+                    user_id=user_id,
+                    ad_account_id=ad_account_id,
+                    access_token=access_token,
+                    date_preset=date_preset,
+                    job_id=str(job_id) if job_id else None
+                )
             
             return jsonify({
                 "status": "success",
                 "message": result_message
             }), 200
             
+        except LeaseUnavailableError as e:
+            return jsonify({
+                "status": "error",
+                "message": str(e)
+            }), 409
+            
         except Exception as e:
             # Log the error for debugging
-            print(f"❌ Sync error: {str(e)}", file=sys.stderr)
-            import traceback
-            traceback.print_exc()
+            log.exception('sync_request_failed', user_id=user_id, ad_account_id=ad_account_id, error=str(e))
             
             return jsonify({
                 "status": "error",
@@ -111,9 +157,136 @@ def sync_meta_data():
     
     except Exception as e:
         # Catch any unexpected errors
-        print(f"❌ Unexpected error: {str(e)}", file=sys.stderr)
-        import traceback
-        traceback.print_exc()
+        log.exception('sync_request_error', error=str(e))
+        
+        return jsonify({
+            "status": "error",
+            "message": f"Internal server error: {str(e)}"
+        }), 500
+
+
+# Client of the read endpoints, created on first use and shared by their requests
+_supabase_client = None
+
+
+def _shared_supabase_client():
+    global _supabase_client
+    if _supabase_client is None:
+        _supabase_client = get_supabase_client()
+    return _supabase_client
+
+
+def _session_user_id(supabase, authorization: str) -> Optional[int]:
+    """
+    Returns the users.id of the Supabase session in an 'Authorization: Bearer' header,
+    or None if the token is missing or invalid. Resolved tokens are cached (see session_cache).
+    """
+    scheme, _, token = authorization.partition(' ')
+    token = token.strip()
+    if scheme.lower() != 'bearer' or not token:
+        return None
+    user_id = session_cache.get(token)
+    if user_id is not None:
+        return user_id
+    try:
+        auth_user = supabase.auth.get_user(token).user
+    except Exception as e:
+        log.info('leaderboard_auth_rejected', error=str(e))
+        return None
+    if not auth_user or not auth_user.email:
+        return None
+    response = supabase.table('users').select('id').eq('email', auth_user.email).execute()
+    if not response.data:
+        return None
+    user_id = int(response.data[0]['id'])
+    session_cache.put(token, user_id)
+    return user_id
+
+
+@app.route('/leaderboard', methods=['GET'])
+def creative_leaderboard():
+    """
+    GET /leaderboard endpoint
+    
+    Requires the dashboard's Supabase session: 'Authorization: Bearer <access token>'.
+    Only the signed-in user's own leaderboard can be read.
+    
+    Query parameters:
+        user_id: User ID (optional, default: the signed-in user; any other user is refused)
+        start_date: YYYY-MM-DD (optional, default: 7 days before end_date)
+        end_date: YYYY-MM-DD (optional, default: today)
+        limit: Maximum number of creatives (optional, default: all)
+    
+    Returns:
+        JSON response with per-creative spend, revenue and ROAS, sorted by spend,
+        served from the in-memory fact cache when possible
+    """
+    try:
+        supabase = _shared_supabase_client()
+        
+        # Same check as the dashboard's RLS policy: the session's email maps to users.id
+        auth_user_id = _session_user_id(supabase, request.headers.get('Authorization', ''))
+        if auth_user_id is None:
+            return jsonify({
+                "status": "error",
+                "message": "A valid Supabase session token is required"
+            }), 401
+        
+        try:
+            user_id = int(request.args.get('user_id', auth_user_id))
+        except ValueError:
+            return jsonify({
+                "status": "error",
+                "message": "user_id must be an integer"
+            }), 400
+        
+        if user_id != auth_user_id:
+            return jsonify({
+                "status": "error",
+                "message": "Not allowed to read another user's leaderboard"
+            }), 403
+        
+        try:
+            end_date = date.fromisoformat(request.args['end_date']) if request.args.get('end_date') else date.today()
+            start_date = (
+                date.fromisoformat(request.args['start_date']) if request.args.get('start_date')
+                else end_date - timedelta(days=7)
+            )
+            limit = int(request.args.get('limit', 0))
+        except ValueError:
+            return jsonify({
+                "status": "error",
+                "message": "start_date and end_date must be YYYY-MM-DD and limit an integer"
+            }), 400
+        
+        if start_date > end_date:
+            return jsonify({
+                "status": "error",
+                "message": "start_date must not be after end_date"
+            }), 400
+        
+        if limit < 0:
+            return jsonify({
+                "status": "error",
+                "message": "limit must not be negative"
+            }), 400
+        
+        data, source = get_creative_leaderboard(
+            supabase,
+            user_id,
+            start_date,
+            end_date,
+            limit
+        )
+        
+        return jsonify({
+            "status": "success",
+            "source": source,
+            "data": data
+        }), 200
+    
+    except Exception as e:
+        log.exception('leaderboard_request_failed', error=str(e))
         
         return jsonify({
             "status": "error",
@@ -123,13 +296,39 @@ def sync_meta_data():
 
 @app.route('/health', methods=['GET'])
 def health_check():
-    """Health check endpoint for Cloud Run"""
+    """Health check endpoint for Cloud Run (liveness: the process is up)"""
     return jsonify({
         "status": "healthy",
         "service": "meta-sync-worker"
     }), 200
 
 
+@app.route('/ready', methods=['GET'])
+def readiness_check():
+    """
+    Readiness endpoint: 503 while the instance is saturated with syncs or
+    throttled by Meta, so new syncs are routed to other instances
+    """
+    report = load_reporter.snapshot()
+    return jsonify({
+        "status": "ready" if report['ready'] else "not_ready",
+        "reasons": report['reasons'],
+        "load": report['load']
+    }), 200 if report['ready'] else 503
+
+
+@app.route('/load', methods=['GET'])
+def load_report():
+    """Load report: in-flight and queued syncs, Meta throttle state, recent stage latencies"""
+    report = load_reporter.snapshot()
+    # Current adaptive batch sizes (see adaptive_batcher)
+    report['batchers'] = get_batcher_stats()
+    return jsonify({
+        "status": "success",
+        "data": report
+    }), 200
+
+
 @app.route('/', methods=['GET'])
 def root():
     """Root endpoint"""
@@ -137,7 +336,10 @@ def root():
         "service": "Meta Creative Sync Worker",
         "endpoints": {
             "POST /sync": "Trigger Meta creative data sync",
-            "GET /health": "Health check endpoint"
+            "GET /leaderboard": "Cached creative leaderboard (spend, revenue, ROAS)",
+            "GET /health": "Health check endpoint",
+            "GET /ready": "Readiness (503 when saturated or throttled by Meta)",
+            "GET /load": "Load report for autoscaling"
         }
     }), 200
 
@@ -148,5 +350,6 @@ if __name__ == '__main__':
     
     # Run Flask app
     # Set host to 0.0.0.0 to listen on all interfaces (required for Cloud Run)
-    app.run(host='0.0.0.0', port=port, debug=False)
+    # Each request runs in its own thread; syncs use isolated Meta API sessions
+    app.run(host='0.0.0.0', port=port, debug=False, threaded=True)
 
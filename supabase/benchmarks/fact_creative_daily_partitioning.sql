@@ -0,0 +1,179 @@
+-- Benchmark: fact_creative_daily heap layout vs monthly range partitions
+-- Description: Loads 10M+ synthetic fact rows into both layouts inside a scratch schema and times
+-- the sync's upsert pattern (100-row ON CONFLICT batches) and dashboard range scans.
+--
+-- Run against a disposable database (not production):
+--   psql "$DATABASE_URL" -v rows=12000000 -f supabase/benchmarks/fact_creative_daily_partitioning.sql
+--
+-- Compare the "Time:" lines printed by \timing for each labelled step.
+
+\set ON_ERROR_STOP on
+\if :{?rows}
+\else
+    \set rows 12000000
+\endif
+\timing on
+
+DROP SCHEMA IF EXISTS bench_fact CASCADE;
+CREATE SCHEMA bench_fact;
+SET search_path = bench_fact, public;
+
+-- ============================================
+-- Layouts
+-- ============================================
+
+-- Current layout: single heap, unique constraint + seven secondary B-tree indexes
+CREATE TABLE heap_fact (
+    id UUID PRIMARY KEY DEFAULT gen_random_uuid(),
+    creative_id UUID NOT NULL,
+    user_id INTEGER NOT NULL,
+    ad_id TEXT NOT NULL,
+    campaign_id TEXT,
+    date DATE NOT NULL,
+    spend NUMERIC(15, 2) DEFAULT 0,
+    impressions INTEGER DEFAULT 0,
+    clicks INTEGER DEFAULT 0,
+    revenue NUMERIC(15, 2) DEFAULT 0,
+    updated_at TIMESTAMP WITH TIME ZONE DEFAULT NOW(),
+    UNIQUE (ad_id, date, user_id)
+);
+CREATE INDEX ON heap_fact(creative_id);
+CREATE INDEX ON heap_fact(user_id);
+CREATE INDEX ON heap_fact(ad_id);
+CREATE INDEX ON heap_fact(date);
+CREATE INDEX ON heap_fact(ad_id, date);
+CREATE INDEX ON heap_fact(campaign_id);
+CREATE INDEX ON heap_fact(user_id, date);
+
+-- New layout: monthly partitions, unique constraint + two indexes
+CREATE TABLE part_fact (
+    id UUID NOT NULL DEFAULT gen_random_uuid(),
+    creative_id UUID NOT NULL,
+    user_id INTEGER NOT NULL,
+    ad_id TEXT NOT NULL,
+    campaign_id TEXT,
+    date DATE NOT NULL,
+    spend NUMERIC(15, 2) DEFAULT 0,
+    impressions INTEGER DEFAULT 0,
+    clicks INTEGER DEFAULT 0,
+    revenue NUMERIC(15, 2) DEFAULT 0,
+    updated_at TIMESTAMP WITH TIME ZONE DEFAULT NOW(),
+    PRIMARY KEY (id, date),
+    UNIQUE (ad_id, date, user_id)
+) PARTITION BY RANGE (date);
+CREATE INDEX ON part_fact(user_id, date);
+CREATE INDEX ON part_fact(creative_id);
+
+DO $$
+DECLARE
+    v_month DATE := DATE '2024-01-01';
+BEGIN
+    WHILE v_month < DATE '2026-01-01' LOOP
+        EXECUTE format(
+            'CREATE TABLE bench_fact.%I PARTITION OF bench_fact.part_fact FOR VALUES FROM (%L) TO (%L) WITH (fillfactor = 90)',
+            'part_fact_' || to_char(v_month, 'YYYY_MM'), v_month, (v_month + INTERVAL '1 month')::DATE
+        );
+        v_month := (v_month + INTERVAL '1 month')::DATE;
+    END LOOP;
+END $$;
+
+-- ============================================
+-- Data: :rows rows spread evenly over 730 days and 500 users
+-- (g maps one-to-one onto (ad, user, date), so every row is unique)
+-- ============================================
+
+CREATE UNLOGGED TABLE seed AS
+SELECT
+    md5('ad_' || (g / 365000) || '_' || (g / 730) % 500)::UUID AS creative_id,
+    ((g / 730) % 500) + 1 AS user_id,
+    'ad_' || (g / 365000) || '_' || (g / 730) % 500 AS ad_id,
+    'cmp_' || (g % 900) AS campaign_id,
+    DATE '2024-01-01' + (g % 730)::INTEGER AS date,
+    round((random() * 500)::NUMERIC, 2) AS spend,
+    (random() * 100000)::INTEGER AS impressions,
+    (random() * 2000)::INTEGER AS clicks,
+    round((random() * 1500)::NUMERIC, 2) AS revenue
+FROM generate_series(1, :rows) AS g;
+
+\echo '--- bulk load: heap'
+INSERT INTO heap_fact (creative_id, user_id, ad_id, campaign_id, date, spend, impressions, clicks, revenue)
+SELECT * FROM seed ON CONFLICT DO NOTHING;
+\echo '--- bulk load: partitioned'
+INSERT INTO part_fact (creative_id, user_id, ad_id, campaign_id, date, spend, impressions, clicks, revenue)
+SELECT * FROM seed ON CONFLICT DO NOTHING;
+
+VACUUM ANALYZE heap_fact;
+VACUUM ANALYZE part_fact;
+
+-- ============================================
+-- Upsert throughput: 2,000 batches of 100 rows re-syncing the most recent 3 days,
+-- the same shape meta_sync_service sends for date_preset=last_3d
+-- ============================================
+
+CREATE OR REPLACE FUNCTION run_upserts(p_table TEXT, p_batches INTEGER) RETURNS VOID
+LANGUAGE plpgsql AS $$
+DECLARE
+    v_batch INTEGER;
+BEGIN
+    FOR v_batch IN 0..p_batches - 1 LOOP
+        EXECUTE format($sql$
+            INSERT INTO bench_fact.%I (creative_id, user_id, ad_id, campaign_id, date, spend, impressions, clicks, revenue)
+            SELECT creative_id, user_id, ad_id, campaign_id, date, spend + 1, impressions + 1, clicks, revenue
+            FROM bench_fact.seed
+            WHERE date >= DATE '2025-12-29'
+            OFFSET %s LIMIT 100
+            ON CONFLICT (ad_id, date, user_id) DO UPDATE SET
+                spend = EXCLUDED.spend,
+                impressions = EXCLUDED.impressions,
+                clicks = EXCLUDED.clicks,
+                revenue = EXCLUDED.revenue,
+                updated_at = NOW()
+        $sql$, p_table, (v_batch * 100) % 40000);
+    END LOOP;
+END;
+$$;
+
+\echo '--- upsert 200k rows: heap'
+SELECT run_upserts('heap_fact', 2000);
+\echo '--- upsert 200k rows: partitioned'
+SELECT run_upserts('part_fact', 2000);
+
+-- ============================================
+-- Range scans: the analytics leaderboard query (one user, 7 and 90 days)
+-- ============================================
+
+\echo '--- range scan 7d: heap'
+SELECT creative_id, SUM(spend), SUM(revenue) FROM heap_fact
+WHERE user_id = 42 AND date BETWEEN DATE '2025-12-24' AND DATE '2025-12-31'
+GROUP BY creative_id;
+\echo '--- range scan 7d: partitioned'
+SELECT creative_id, SUM(spend), SUM(revenue) FROM part_fact
+WHERE user_id = 42 AND date BETWEEN DATE '2025-12-24' AND DATE '2025-12-31'
+GROUP BY creative_id;
+
+\echo '--- range scan 90d all users: heap'
+SELECT date, SUM(spend) FROM heap_fact
+WHERE date BETWEEN DATE '2025-10-01' AND DATE '2025-12-31'
+GROUP BY date;
+\echo '--- range scan 90d all users: partitioned'
+SELECT date, SUM(spend) FROM part_fact
+WHERE date BETWEEN DATE '2025-10-01' AND DATE '2025-12-31'
+GROUP BY date;
+
+-- ============================================
+-- Retention: dropping a month vs deleting it
+-- ============================================
+
+\echo '--- retention (delete one month): heap'
+DELETE FROM heap_fact WHERE date < DATE '2024-02-01';
+\echo '--- retention (drop one month): partitioned'
+ALTER TABLE part_fact DETACH PARTITION part_fact_2024_01;
+DROP TABLE part_fact_2024_01;
+
+\echo '--- on-disk size (table + indexes)'
+SELECT 'heap' AS layout, pg_size_pretty(pg_total_relation_size('heap_fact')) AS size
+UNION ALL
+SELECT 'partitioned', pg_size_pretty(SUM(pg_total_relation_size(inhrelid)))
+FROM pg_inherits WHERE inhparent = 'part_fact'::regclass;
+
+DROP SCHEMA bench_fact CASCADE;
@@ -0,0 +1,244 @@
+-- Migration: Range-partition fact_creative_daily by date
+-- Description: Converts fact_creative_daily into monthly range partitions, trims the index set,
+-- and adds partition management functions (creation, retention, compaction)
+
+-- ============================================
+-- Partitioned table
+-- ============================================
+
+-- The partition key must be part of every unique constraint, so the primary key becomes (id, date).
+-- (ad_id, date, user_id) already contains the key and stays the upsert conflict target.
+CREATE TABLE fact_creative_daily_partitioned (
+    id UUID NOT NULL DEFAULT gen_random_uuid(),
+    creative_id UUID NOT NULL REFERENCES dim_creatives(id) ON DELETE CASCADE,
+    user_id INTEGER NOT NULL REFERENCES users(id) ON DELETE CASCADE,
+    ad_id TEXT NOT NULL,
+    ad_name TEXT,
+    adset_id TEXT,
+    adset_name TEXT,
+    campaign_id TEXT,
+    campaign_name TEXT,
+    date DATE NOT NULL,
+    spend NUMERIC(15, 2) DEFAULT 0,
+    impressions INTEGER DEFAULT 0,
+    clicks INTEGER DEFAULT 0,
+    link_clicks INTEGER DEFAULT 0,
+    purchases INTEGER DEFAULT 0,
+    revenue NUMERIC(15, 2) DEFAULT 0,
+    currency TEXT,
+    created_at TIMESTAMP WITH TIME ZONE DEFAULT NOW(),
+    updated_at TIMESTAMP WITH TIME ZONE DEFAULT NOW(),
+    PRIMARY KEY (id, date),
+    UNIQUE (ad_id, date, user_id)
+) PARTITION BY RANGE (date);
+
+-- ============================================
+-- Partition management functions
+-- ============================================
+
+-- Creates the monthly partition holding p_date if it does not exist yet.
+-- Returns the partition name.
+CREATE OR REPLACE FUNCTION ensure_fact_creative_daily_partition(p_date DATE)
+RETURNS TEXT
+LANGUAGE plpgsql
+SECURITY DEFINER
+SET search_path = public
+AS $$
+DECLARE
+    v_start DATE := date_trunc('month', p_date)::DATE;
+    v_end DATE := (date_trunc('month', p_date) + INTERVAL '1 month')::DATE;
+    v_name TEXT := 'fact_creative_daily_' || to_char(v_start, 'YYYY_MM');
+    v_parent TEXT;
+BEGIN
+    -- Resolve the parent by name so the function works both during and after this migration
+    SELECT CASE
+        WHEN to_regclass('public.fact_creative_daily_partitioned') IS NOT NULL
+            THEN 'fact_creative_daily_partitioned'
+        ELSE 'fact_creative_daily'
+    END INTO v_parent;
+
+    IF to_regclass('public.' || v_name) IS NULL THEN
+        -- Hot partitions leave room on each page so upserts can use HOT updates
+        EXECUTE format(
+            'CREATE TABLE IF NOT EXISTS %I PARTITION OF %I FOR VALUES FROM (%L) TO (%L) WITH (fillfactor = 90)',
+            v_name, v_parent, v_start, v_end
+        );
+        -- Partitions are only meant to be read through the parent (and its RLS policy)
+        EXECUTE format('ALTER TABLE %I ENABLE ROW LEVEL SECURITY', v_name);
+    END IF;
+
+    RETURN v_name;
+END;
+$$;
+
+-- Creates every monthly partition between p_start and p_end (inclusive).
+-- Returns the number of months covered.
+CREATE OR REPLACE FUNCTION ensure_fact_creative_daily_partitions(p_start DATE, p_end DATE)
+RETURNS INTEGER
+LANGUAGE plpgsql
+SECURITY DEFINER
+SET search_path = public
+AS $$
+DECLARE
+    v_month DATE := date_trunc('month', LEAST(p_start, p_end))::DATE;
+    v_last DATE := date_trunc('month', GREATEST(p_start, p_end))::DATE;
+    v_count INTEGER := 0;
+BEGIN
+    WHILE v_month <= v_last LOOP
+        PERFORM ensure_fact_creative_daily_partition(v_month);
+        v_month := (v_month + INTERVAL '1 month')::DATE;
+        v_count := v_count + 1;
+    END LOOP;
+
+    RETURN v_count;
+END;
+$$;
+
+-- Retention and compaction policy:
+-- - pre-creates partitions for the next p_premake_months months
+-- - drops partitions that end before the retention window (p_retention_months)
+-- - compacts closed months (older than the Meta attribution window) once: the partition is
+--   set to fillfactor 100 and rewritten with CLUSTER on its (user_id, date) index, which packs
+--   the pages and orders rows the way the dashboard reads them. A partition already at
+--   fillfactor 100 has been compacted and is skipped.
+-- Returns the number of dropped partitions.
+CREATE OR REPLACE FUNCTION maintain_fact_creative_daily_partitions(
+    p_retention_months INTEGER DEFAULT 25,
+    p_premake_months INTEGER DEFAULT 2
+)
+RETURNS INTEGER
+LANGUAGE plpgsql
+SECURITY DEFINER
+SET search_path = public
+AS $$
+DECLARE
+    v_cutoff DATE := (date_trunc('month', CURRENT_DATE) - make_interval(months => p_retention_months))::DATE;
+    v_closed DATE := (date_trunc('month', CURRENT_DATE) - INTERVAL '1 month')::DATE;
+    v_partition RECORD;
+    v_index TEXT;
+    v_dropped INTEGER := 0;
+BEGIN
+    PERFORM ensure_fact_creative_daily_partitions(
+        CURRENT_DATE,
+        (CURRENT_DATE + make_interval(months => p_premake_months))::DATE
+    );
+
+    FOR v_partition IN
+        SELECT c.oid AS oid,
+               c.relname AS name,
+               to_date(right(c.relname, 7), 'YYYY_MM') AS month_start,
+               COALESCE('fillfactor=100' = ANY(c.reloptions), FALSE) AS compacted
+        FROM pg_inherits i
+        JOIN pg_class c ON c.oid = i.inhrelid
+        JOIN pg_class p ON p.oid = i.inhparent
+        WHERE p.relname = 'fact_creative_daily'
+          AND c.relname ~ '^fact_creative_daily_[0-9]{4}_[0-9]{2}$'
+    LOOP
+        IF (v_partition.month_start + INTERVAL '1 month')::DATE <= v_cutoff THEN
+            EXECUTE format('ALTER TABLE fact_creative_daily DETACH PARTITION %I', v_partition.name);
+            EXECUTE format('DROP TABLE %I', v_partition.name);
+            v_dropped := v_dropped + 1;
+        ELSIF v_partition.month_start < v_closed AND NOT v_partition.compacted THEN
+            -- The partition's copy of idx_fact_creative_daily_user_date
+            SELECT ci.relname INTO v_index
+            FROM pg_inherits ii
+            JOIN pg_class ci ON ci.oid = ii.inhrelid
+            JOIN pg_index x ON x.indexrelid = ci.oid
+            WHERE ii.inhparent = 'idx_fact_creative_daily_user_date'::regclass
+              AND x.indrelid = v_partition.oid;
+
+            -- (VACUUM FULL cannot run inside a function; CLUSTER of a single table can)
+            IF v_index IS NOT NULL THEN
+                EXECUTE format('ALTER TABLE %I SET (fillfactor = 100)', v_partition.name);
+                EXECUTE format('CLUSTER %I USING %I', v_partition.name, v_index);
+            END IF;
+        END IF;
+    END LOOP;
+
+    RETURN v_dropped;
+END;
+$$;
+
+-- The functions run as their owner: only the worker (service role) and scheduled jobs may
+-- call them. PostgREST would otherwise expose them to the anon and authenticated roles.
+REVOKE EXECUTE ON FUNCTION ensure_fact_creative_daily_partition(DATE) FROM PUBLIC, anon, authenticated;
+REVOKE EXECUTE ON FUNCTION ensure_fact_creative_daily_partitions(DATE, DATE) FROM PUBLIC, anon, authenticated;
+REVOKE EXECUTE ON FUNCTION maintain_fact_creative_daily_partitions(INTEGER, INTEGER) FROM PUBLIC, anon, authenticated;
+GRANT EXECUTE ON FUNCTION ensure_fact_creative_daily_partition(DATE) TO service_role;
+GRANT EXECUTE ON FUNCTION ensure_fact_creative_daily_partitions(DATE, DATE) TO service_role;
+GRANT EXECUTE ON FUNCTION maintain_fact_creative_daily_partitions(INTEGER, INTEGER) TO service_role;
+
+-- ============================================
+-- Copy existing rows and swap tables
+-- ============================================
+
+DO $$
+DECLARE
+    v_min DATE;
+    v_max DATE;
+BEGIN
+    SELECT MIN(date), MAX(date) INTO v_min, v_max FROM fact_creative_daily;
+    IF v_min IS NOT NULL THEN
+        PERFORM ensure_fact_creative_daily_partitions(v_min, v_max);
+    END IF;
+END $$;
+
+INSERT INTO fact_creative_daily_partitioned (
+    id, creative_id, user_id, ad_id, ad_name, adset_id, adset_name, campaign_id, campaign_name,
+    date, spend, impressions, clicks, link_clicks, purchases, revenue, currency, created_at, updated_at
+)
+SELECT
+    id, creative_id, user_id, ad_id, ad_name, adset_id, adset_name, campaign_id, campaign_name,
+    date, spend, impressions, clicks, link_clicks, purchases, revenue, currency, created_at, updated_at
+FROM fact_creative_daily;
+
+DROP TABLE fact_creative_daily;
+ALTER TABLE fact_creative_daily_partitioned RENAME TO fact_creative_daily;
+
+-- Current and upcoming months are always available
+SELECT ensure_fact_creative_daily_partitions(CURRENT_DATE, (CURRENT_DATE + INTERVAL '2 months')::DATE);
+
+-- ============================================
+-- Indexes
+-- ============================================
+
+-- The old layout kept seven B-tree indexes on top of the unique constraint. With date partitioning:
+-- - the (ad_id, date, user_id) unique index already serves ad_id and (ad_id, date) lookups
+-- - partition pruning replaces the standalone date index
+-- - user_id lookups are served by (user_id, date)
+CREATE INDEX IF NOT EXISTS idx_fact_creative_daily_user_date ON fact_creative_daily(user_id, date);
+-- Needed for ON DELETE CASCADE from dim_creatives and the analytics join
+CREATE INDEX IF NOT EXISTS idx_fact_creative_daily_creative_id ON fact_creative_daily(creative_id);
+
+-- ============================================
+-- Row Level Security
+-- ============================================
+
+ALTER TABLE fact_creative_daily ENABLE ROW LEVEL SECURITY;
+
+DROP POLICY IF EXISTS "Allow read access to fact_creative_daily for authenticated users" ON fact_creative_daily;
+CREATE POLICY "Allow read access to fact_creative_daily for authenticated users"
+    ON fact_creative_daily
+    FOR SELECT
+    TO authenticated
+    USING (
+        user_id IN (
+            SELECT id FROM users
+            WHERE email = (SELECT email FROM auth.users WHERE id = auth.uid())
+        )
+    );
+
+-- ============================================
+-- Scheduled maintenance (only when pg_cron is enabled)
+-- ============================================
+
+DO $$
+BEGIN
+    IF EXISTS (SELECT 1 FROM pg_extension WHERE extname = 'pg_cron') THEN
+        PERFORM cron.schedule(
+            'fact_creative_daily_maintenance',
+            '15 3 * * *',
+            'SELECT maintain_fact_creative_daily_partitions()'
+        );
+    END IF;
+END $$;
@@ -0,0 +1,70 @@
+-- Migration: Create sync_checkpoints table
+-- Description: Durable per-job progress for Meta creative syncs, so a killed worker can resume
+-- from the last checkpoint instead of re-fetching everything
+
+CREATE TABLE IF NOT EXISTS sync_checkpoints (
+    job_id TEXT PRIMARY KEY,
+    user_id INTEGER NOT NULL REFERENCES users(id) ON DELETE CASCADE,
+    ad_account_id TEXT NOT NULL,
+    stage TEXT NOT NULL,
+    state JSONB NOT NULL DEFAULT '{}'::JSONB,
+    -- Small, frequently updated markers (e.g. rows committed so far), written without resending state
+    progress JSONB NOT NULL DEFAULT '{}'::JSONB,
+    created_at TIMESTAMP WITH TIME ZONE DEFAULT NOW(),
+    updated_at TIMESTAMP WITH TIME ZONE DEFAULT NOW()
+);
+
+-- Stale checkpoints (jobs that never resumed) are looked up by age
+CREATE INDEX IF NOT EXISTS idx_sync_checkpoints_updated_at ON sync_checkpoints(updated_at);
+
+-- Enable Row Level Security (RLS)
+-- No policies: only the worker (service role) reads and writes checkpoints
+ALTER TABLE sync_checkpoints ENABLE ROW LEVEL SECURITY;
+
+-- Insights pages of a job, written once each as they are fetched (the checkpoint state only keeps
+-- the paging cursor and the page count, so it stays small however large the account is)
+CREATE TABLE IF NOT EXISTS sync_checkpoint_pages (
+    job_id TEXT NOT NULL REFERENCES sync_checkpoints(job_id) ON DELETE CASCADE,
+    page INTEGER NOT NULL,
+    rows JSONB NOT NULL DEFAULT '[]'::JSONB,
+    created_at TIMESTAMP WITH TIME ZONE DEFAULT NOW(),
+    PRIMARY KEY (job_id, page)
+);
+
+-- No policies: only the worker (service role) reads and writes checkpoint pages
+ALTER TABLE sync_checkpoint_pages ENABLE ROW LEVEL SECURITY;
+
+-- ============================================
+-- Purge abandoned checkpoints
+-- ============================================
+
+-- Jobs that failed and were never resumed (default job IDs change every UTC day) keep their
+-- checkpoint, and its pages, until purged; the pages go with it (ON DELETE CASCADE)
+CREATE OR REPLACE FUNCTION purge_stale_sync_checkpoints(p_max_age_hours INTEGER DEFAULT 48)
+RETURNS INTEGER
+LANGUAGE plpgsql
+AS $$
+DECLARE
+    v_deleted INTEGER;
+BEGIN
+    DELETE FROM sync_checkpoints
+    WHERE updated_at < NOW() - make_interval(hours => p_max_age_hours);
+    GET DIAGNOSTICS v_deleted = ROW_COUNT;
+    RETURN v_deleted;
+END;
+$$;
+
+REVOKE EXECUTE ON FUNCTION purge_stale_sync_checkpoints(INTEGER) FROM PUBLIC, anon, authenticated;
+GRANT EXECUTE ON FUNCTION purge_stale_sync_checkpoints(INTEGER) TO service_role;
+
+-- Scheduled purge (only when pg_cron is enabled); completed jobs also purge stale checkpoints
+DO $$
+BEGIN
+    IF EXISTS (SELECT 1 FROM pg_extension WHERE extname = 'pg_cron') THEN
+        PERFORM cron.schedule(
+            'sync_checkpoints_purge',
+            '45 * * * *',
+            'SELECT purge_stale_sync_checkpoints()'
+        );
+    END IF;
+END $$;
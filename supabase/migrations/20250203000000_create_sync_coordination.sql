@@ -0,0 +1,146 @@
+-- Migration: Create sync coordination tables
+-- Description: Worker instance membership (heartbeats) and per-account sync leases, so that each
+-- ad account is synced by exactly one worker instance at a time
+
+-- Live worker instances; a row expires when its heartbeat is older than the caller's TTL
+CREATE TABLE IF NOT EXISTS sync_instances (
+    instance_id TEXT PRIMARY KEY,
+    instance_url TEXT,
+    started_at TIMESTAMP WITH TIME ZONE DEFAULT NOW(),
+    heartbeat_at TIMESTAMP WITH TIME ZONE DEFAULT NOW()
+);
+
+-- One lease per ad account; a lease is free once expires_at has passed.
+-- holder is a token unique to one acquisition (one sync), instance_id the instance running it.
+CREATE TABLE IF NOT EXISTS sync_leases (
+    ad_account_id TEXT PRIMARY KEY,
+    holder TEXT NOT NULL,
+    instance_id TEXT NOT NULL,
+    job_id TEXT,
+    acquired_at TIMESTAMP WITH TIME ZONE DEFAULT NOW(),
+    heartbeat_at TIMESTAMP WITH TIME ZONE DEFAULT NOW(),
+    expires_at TIMESTAMP WITH TIME ZONE NOT NULL
+);
+
+CREATE INDEX IF NOT EXISTS idx_sync_leases_instance_id ON sync_leases(instance_id);
+
+-- Enable Row Level Security (RLS)
+-- No policies: only the workers (service role) use these tables
+ALTER TABLE sync_instances ENABLE ROW LEVEL SECURITY;
+ALTER TABLE sync_leases ENABLE ROW LEVEL SECURITY;
+
+-- Records a heartbeat for an instance, forgets instances silent for longer than p_ttl_seconds,
+-- and returns the live membership
+CREATE OR REPLACE FUNCTION heartbeat_sync_instance(
+    p_instance_id TEXT,
+    p_instance_url TEXT,
+    p_ttl_seconds INTEGER
+)
+RETURNS TABLE (instance_id TEXT, instance_url TEXT)
+LANGUAGE plpgsql
+SECURITY DEFINER
+SET search_path = public
+AS $$
+BEGIN
+    INSERT INTO sync_instances AS i (instance_id, instance_url, heartbeat_at)
+    VALUES (p_instance_id, p_instance_url, NOW())
+    ON CONFLICT ON CONSTRAINT sync_instances_pkey DO UPDATE
+        SET instance_url = EXCLUDED.instance_url, heartbeat_at = NOW();
+
+    DELETE FROM sync_instances AS i
+    WHERE i.heartbeat_at < NOW() - make_interval(secs => p_ttl_seconds);
+
+    RETURN QUERY
+        SELECT i.instance_id, i.instance_url FROM sync_instances AS i ORDER BY i.instance_id;
+END;
+$$;
+
+-- Removes an instance from the membership and frees its leases (graceful shutdown)
+CREATE OR REPLACE FUNCTION leave_sync_instance(p_instance_id TEXT)
+RETURNS VOID
+LANGUAGE sql
+SECURITY DEFINER
+SET search_path = public
+AS $$
+    DELETE FROM sync_leases WHERE instance_id = p_instance_id;
+    DELETE FROM sync_instances WHERE instance_id = p_instance_id;
+$$;
+
+-- Takes the lease of an account if it is free or expired. Not re-entrant: a held lease is
+-- refused even to the same instance, so two syncs of one account never overlap.
+-- Returns TRUE if p_holder holds the lease afterwards.
+CREATE OR REPLACE FUNCTION acquire_sync_lease(
+    p_ad_account_id TEXT,
+    p_holder TEXT,
+    p_instance_id TEXT,
+    p_job_id TEXT,
+    p_ttl_seconds INTEGER
+)
+RETURNS BOOLEAN
+LANGUAGE plpgsql
+SECURITY DEFINER
+SET search_path = public
+AS $$
+BEGIN
+    INSERT INTO sync_leases AS l (
+        ad_account_id, holder, instance_id, job_id, acquired_at, heartbeat_at, expires_at
+    )
+    VALUES (
+        p_ad_account_id, p_holder, p_instance_id, p_job_id,
+        NOW(), NOW(), NOW() + make_interval(secs => p_ttl_seconds)
+    )
+    ON CONFLICT (ad_account_id) DO UPDATE
+        SET holder = EXCLUDED.holder,
+            instance_id = EXCLUDED.instance_id,
+            job_id = EXCLUDED.job_id,
+            acquired_at = EXCLUDED.acquired_at,
+            heartbeat_at = EXCLUDED.heartbeat_at,
+            expires_at = EXCLUDED.expires_at
+        WHERE l.expires_at < NOW();
+
+    RETURN FOUND;
+END;
+$$;
+
+-- Extends a lease still held by p_holder. Returns FALSE if the lease was lost.
+CREATE OR REPLACE FUNCTION renew_sync_lease(
+    p_ad_account_id TEXT,
+    p_holder TEXT,
+    p_ttl_seconds INTEGER
+)
+RETURNS BOOLEAN
+LANGUAGE plpgsql
+SECURITY DEFINER
+SET search_path = public
+AS $$
+BEGIN
+    UPDATE sync_leases
+    SET heartbeat_at = NOW(), expires_at = NOW() + make_interval(secs => p_ttl_seconds)
+    WHERE ad_account_id = p_ad_account_id AND holder = p_holder;
+
+    RETURN FOUND;
+END;
+$$;
+
+-- Frees a lease held by p_holder
+CREATE OR REPLACE FUNCTION release_sync_lease(p_ad_account_id TEXT, p_holder TEXT)
+RETURNS VOID
+LANGUAGE sql
+SECURITY DEFINER
+SET search_path = public
+AS $$
+    DELETE FROM sync_leases WHERE ad_account_id = p_ad_account_id AND holder = p_holder;
+$$;
+
+-- The functions run as their owner: only the workers (service role) may call them.
+-- PostgREST would otherwise expose them to the anon and authenticated roles.
+REVOKE EXECUTE ON FUNCTION heartbeat_sync_instance(TEXT, TEXT, INTEGER) FROM PUBLIC, anon, authenticated;
+REVOKE EXECUTE ON FUNCTION leave_sync_instance(TEXT) FROM PUBLIC, anon, authenticated;
+REVOKE EXECUTE ON FUNCTION acquire_sync_lease(TEXT, TEXT, TEXT, TEXT, INTEGER) FROM PUBLIC, anon, authenticated;
+REVOKE EXECUTE ON FUNCTION renew_sync_lease(TEXT, TEXT, INTEGER) FROM PUBLIC, anon, authenticated;
+REVOKE EXECUTE ON FUNCTION release_sync_lease(TEXT, TEXT) FROM PUBLIC, anon, authenticated;
+GRANT EXECUTE ON FUNCTION heartbeat_sync_instance(TEXT, TEXT, INTEGER) TO service_role;
+GRANT EXECUTE ON FUNCTION leave_sync_instance(TEXT) TO service_role;
+GRANT EXECUTE ON FUNCTION acquire_sync_lease(TEXT, TEXT, TEXT, TEXT, INTEGER) TO service_role;
+GRANT EXECUTE ON FUNCTION renew_sync_lease(TEXT, TEXT, INTEGER) TO service_role;
+GRANT EXECUTE ON FUNCTION release_sync_lease(TEXT, TEXT) TO service_role;
@@ -0,0 +1,38 @@
+"""
+Shared setup for the unit tests: the project root and the load-test fakes
+are importable, and the supabase client used against FakeSupabaseServer.
+"""
+
+import os
+import sys
+
+import pytest
+
+project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, project_root)
+sys.path.insert(0, os.path.join(project_root, 'load_test'))
+
+from fake_servers import FakeMetaServer, FakeSupabaseServer, FaultProfile
+
+# Shaped like a JWT, which the Supabase client requires; never valid anywhere
+FAKE_SUPABASE_KEY = 'eyJhbGciOiJIUzI1NiIsInR5cCI6IkpXVCJ9.eyJyb2xlIjoic2VydmljZV9yb2xlIn0.unit-test'
+
+
+@pytest.fixture
+def fake_supabase():
+    server = FakeSupabaseServer(FaultProfile()).start()
+    yield server
+    server.stop()
+
+
+@pytest.fixture
+def fake_meta():
+    server = FakeMetaServer(FaultProfile(), ads_per_account=60, days=2, creatives_per_account=20).start()
+    yield server
+    server.stop()
+
+
+@pytest.fixture
+def supabase_client(fake_supabase):
+    from supabase import create_client
+    return create_client(fake_supabase.url, FAKE_SUPABASE_KEY)
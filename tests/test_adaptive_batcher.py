@@ -0,0 +1,80 @@
+import httpx
+import pytest
+from postgrest.exceptions import APIError
+
+from lib.services.common.adaptive_batcher import AdaptiveBatcher, estimate_bytes, is_oversized_error
+
+
+def test_grows_on_fast_full_batches_only():
+    batcher = AdaptiveBatcher('test', initial_size=100, max_size=1000, target_latency_seconds=1.0)
+
+    # A partial (last) batch is no signal to grow
+    batcher.record(40, 0.1)
+    assert batcher.size == 100
+
+    batcher.record(100, 0.1)
+    assert batcher.size == 125
+
+    for _ in range(20):
+        batcher.record(batcher.size, 0.1)
+    assert batcher.size == 1000
+
+
+def test_shrinks_on_slow_batches_and_keeps_the_minimum():
+    batcher = AdaptiveBatcher('test', initial_size=100, min_size=10, target_latency_seconds=1.0)
+
+    # Slower than the target but within twice the target: unchanged
+    batcher.record(100, 1.5)
+    assert batcher.size == 100
+
+    batcher.record(100, 3.0)
+    assert batcher.size == 70
+
+    for _ in range(20):
+        batcher.record(batcher.size, 3.0)
+    assert batcher.size == 10
+
+
+def test_oversized_errors_halve_down_to_the_minimum():
+    batcher = AdaptiveBatcher('test', initial_size=100, min_size=10)
+
+    assert batcher.record_oversized(100)
+    assert batcher.size == 50
+    # Halves the failed batch, not the current size, when the batch was smaller
+    assert batcher.record_oversized(30)
+    assert batcher.size == 15
+    assert batcher.record_oversized(15)
+    assert batcher.size == 10
+    assert not batcher.record_oversized(10)
+    assert batcher.stats()['oversized_errors'] == 4
+
+
+def test_payload_budget_caps_the_size():
+    batcher = AdaptiveBatcher('test', initial_size=500, max_size=1000, max_payload_bytes=10_000)
+
+    batcher.record(100, 0.1, payload_bytes=100 * 200)
+    assert batcher.size == 50
+    assert batcher.stats()['avg_item_bytes'] == 200
+
+    # Smaller items move the average gradually
+    batcher.record(50, 0.1, payload_bytes=50 * 100)
+    assert batcher.stats()['avg_item_bytes'] == 170
+    assert batcher.size == 58
+
+
+@pytest.mark.parametrize('error, oversized', [
+    (APIError({'code': '57014', 'message': 'canceling statement due to statement timeout'}), True),
+    (APIError({'code': '413', 'message': 'Payload Too Large'}), True),
+    (httpx.ReadTimeout('timed out'), True),
+    (Exception('Please reduce the amount of data you are asking for'), True),
+    (httpx.ConnectTimeout('timed out'), False),
+    (APIError({'code': '23505', 'message': 'duplicate key value'}), False),
+])
+def test_is_oversized_error(error, oversized):
+    assert is_oversized_error(error) is oversized
+
+
+def test_estimate_bytes():
+    assert estimate_bytes([]) == 0
+    items = [{'id': str(i).zfill(4)} for i in range(100)]
+    assert estimate_bytes(items) == 100 * len('{"id": "0000"}')
@@ -0,0 +1,86 @@
+import threading
+
+import pytest
+
+from lib.services.sync.coordination import (
+    ConsistentHashRing, LeaseUnavailableError, SyncCoordinator
+)
+
+
+def test_ring_moves_only_the_new_nodes_share():
+    keys = [f'act_{n}' for n in range(5000)]
+    before = ConsistentHashRing(['a', 'b', 'c'])
+    after = ConsistentHashRing(['a', 'b', 'c', 'd'])
+
+    moved = [k for k in keys if before.owner(k) != after.owner(k)]
+    # Every moved key went to the new node, and roughly a quarter moved
+    assert all(after.owner(k) == 'd' for k in moved)
+    assert 0.15 < len(moved) / len(keys) < 0.35
+
+
+def test_ring_is_deterministic_and_empty_ring_has_no_owner():
+    assert ConsistentHashRing(['x', 'y']).owner('act_1') == ConsistentHashRing(['y', 'x']).owner('act_1')
+    assert ConsistentHashRing([]).owner('act_1') is None
+
+
+def test_two_syncs_of_one_account_on_one_instance_do_not_overlap(supabase_client, fake_supabase):
+    coordinator = SyncCoordinator(supabase_client, instance_id='worker-1')
+    first_holds = threading.Event()
+    second_done = threading.Event()
+    outcomes = {}
+
+    def first():
+        with coordinator.lease('123', job_id='job-1'):
+            first_holds.set()
+            second_done.wait(10)
+            outcomes['first_lease_in_db'] = dict(fake_supabase.leases.get('act_123') or {})
+        outcomes['first'] = 'synced'
+
+    def second():
+        first_holds.wait(10)
+        try:
+            with coordinator.lease('act_123', job_id='job-2'):
+                outcomes['second'] = 'synced'
+        except LeaseUnavailableError:
+            outcomes['second'] = 'refused'
+        finally:
+            second_done.set()
+
+    threads = [threading.Thread(target=first), threading.Thread(target=second)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(10)
+
+    assert outcomes['first'] == 'synced'
+    assert outcomes['second'] == 'refused'
+    # The refused sync neither replaced nor released the first one's lease
+    assert outcomes['first_lease_in_db']['instance_id'] == 'worker-1'
+    assert 'act_123' not in fake_supabase.leases
+
+
+def test_lease_held_by_another_instance_is_refused(supabase_client, fake_supabase):
+    one = SyncCoordinator(supabase_client, instance_id='worker-1')
+    two = SyncCoordinator(supabase_client, instance_id='worker-2')
+
+    with one.lease('act_9'):
+        with pytest.raises(LeaseUnavailableError):
+            with two.lease('act_9'):
+                pass
+    # Released: the other instance can take it now
+    with two.lease('act_9') as lease:
+        lease.ensure_held()
+
+
+def test_renewal_uses_the_acquisition_token(supabase_client, fake_supabase):
+    coordinator = SyncCoordinator(supabase_client, instance_id='worker-1')
+
+    with coordinator.lease('act_5') as lease:
+        coordinator.heartbeat()
+        assert not lease.lost.is_set()
+        # Another sync took the account over (e.g. after the lease expired)
+        fake_supabase.leases['act_5']['holder'] = 'worker-1/other-sync'
+        coordinator.heartbeat()
+        assert lease.lost.is_set()
+    # Releasing the lost lease left the new holder's lease alone
+    assert fake_supabase.leases['act_5']['holder'] == 'worker-1/other-sync'
@@ -0,0 +1,86 @@
+from datetime import date, timedelta
+
+from lib.services.sync import fact_cache as fact_cache_module
+from lib.services.sync.fact_cache import FactCache, MAX_RESULTS_PER_USER
+
+TODAY = date.today()
+
+
+def row(ad, creative, days_ago, spend, revenue=0.0):
+    return {
+        'ad_id': ad, 'creative_id': creative, 'date': (TODAY - timedelta(days=days_ago)).isoformat(),
+        'spend': spend, 'revenue': revenue, 'impressions': 100, 'clicks': 5
+    }
+
+
+def loaded(cache, user_id, rows):
+    assert cache.load(user_id, rows, cache.window_start(), cache.generation(user_id))
+
+
+def test_leaderboard_sums_and_ranks_by_spend():
+    cache = FactCache()
+    loaded(cache, 1, [row('a1', 'c1', 1, 10, 30), row('a1', 'c1', 2, 5, 0), row('a2', 'c2', 1, 40, 20)])
+
+    board = cache.leaderboard(1, TODAY - timedelta(days=7), TODAY)
+
+    assert [(r['creative_id'], r['total_spend'], r['roas']) for r in board] == [('c2', 40, 0.5), ('c1', 15, 2.0)]
+    assert cache.leaderboard(1, TODAY - timedelta(days=7), TODAY, limit=1)[0]['creative_id'] == 'c2'
+    # Before the window: a miss, answered from the database
+    assert cache.leaderboard(1, TODAY - timedelta(days=200), TODAY) is None
+
+
+def test_apply_rows_replaces_by_ad_and_day():
+    cache = FactCache()
+    loaded(cache, 1, [row('a1', 'c1', 1, 10)])
+    cache.leaderboard(1, TODAY - timedelta(days=7), TODAY)
+
+    cache.apply_rows(1, [row('a1', 'c1', 1, 12), row('a3', 'c1', 2, 3)])
+
+    board = cache.leaderboard(1, TODAY - timedelta(days=7), TODAY)
+    assert board[0]['total_spend'] == 15
+    assert cache.stats()['rows'] == 2
+
+
+def test_load_racing_a_write_is_discarded():
+    cache = FactCache()
+    generation = cache.generation(1)
+    cache.apply_rows(1, [row('a1', 'c1', 1, 10)])
+
+    assert not cache.load(1, [row('a1', 'c1', 1, 9)], cache.window_start(), generation)
+    assert cache.leaderboard(1, TODAY - timedelta(days=7), TODAY) is None
+
+
+def test_entries_expire_after_max_age(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(fact_cache_module.time, 'monotonic', lambda: now[0])
+    cache = FactCache(max_age_seconds=60)
+    loaded(cache, 1, [row('a1', 'c1', 1, 10)])
+
+    now[0] += 59
+    assert cache.leaderboard(1, TODAY - timedelta(days=7), TODAY) is not None
+    now[0] += 2
+    # Another instance may have synced this user: reload instead of serving it
+    assert cache.leaderboard(1, TODAY - timedelta(days=7), TODAY) is None
+    assert cache.stats()['users'] == 0
+
+
+def test_memoized_results_are_capped():
+    cache = FactCache()
+    loaded(cache, 1, [row('a1', 'c1', 1, 10)])
+
+    for limit in range(MAX_RESULTS_PER_USER * 3):
+        cache.leaderboard(1, TODAY - timedelta(days=7), TODAY, limit)
+
+    assert len(cache._users[1].results) == MAX_RESULTS_PER_USER
+
+
+def test_least_recently_used_user_is_evicted():
+    cache = FactCache(max_rows=3)
+    loaded(cache, 1, [row('a1', 'c1', 1, 1), row('a2', 'c1', 1, 1)])
+    loaded(cache, 2, [row('b1', 'c2', 1, 1)])
+    cache.leaderboard(1, TODAY - timedelta(days=7), TODAY)
+
+    loaded(cache, 3, [row('d1', 'c3', 1, 1)])
+
+    assert cache.leaderboard(2, TODAY - timedelta(days=7), TODAY) is None
+    assert cache.leaderboard(1, TODAY - timedelta(days=7), TODAY) is not None
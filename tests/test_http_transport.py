@@ -0,0 +1,60 @@
+import gzip
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import requests
+
+from lib.services.connector import http_transport
+from lib.services.connector.http_transport import configure_transport, get_transport_stats
+from lib.services.connector.meta_creative_fetcher import fetch_creative_performance
+
+BODY = gzip.compress(json.dumps({'data': [{'body': 'Body copy ' * 20}] * 50}).encode('utf-8'))
+
+
+class GzipHandler(BaseHTTPRequestHandler):
+    # HTTP/1.0 without Content-Length: the body ends when the connection closes
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        self.send_response(200)
+        self.send_header('Content-Encoding', 'gzip')
+        self.end_headers()
+        self.wfile.write(BODY)
+
+
+def test_bytes_are_counted_compressed_without_content_length():
+    server = ThreadingHTTPServer(('127.0.0.1', 0), GzipHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    records = []
+    http_transport.add_request_listener(records.append)
+    try:
+        session = requests.Session()
+        session.hooks['response'].append(http_transport._record_response)
+        response = session.get(f'http://127.0.0.1:{server.server_address[1]}/')
+    finally:
+        http_transport.remove_request_listener(records.append)
+        server.shutdown()
+        server.server_close()
+
+    assert len(response.content) > len(BODY)
+    assert records[0]['bytes'] == len(BODY)
+
+
+def test_syncs_reuse_pooled_connections(fake_meta, monkeypatch):
+    monkeypatch.setenv('META_GRAPH_URL', fake_meta.url)
+    configure_transport()
+    served_before = get_transport_stats()['requests']
+    try:
+        for account in ('1', '2', '1'):
+            fetch_creative_performance(f'act_{account}', f'token-{account}')
+        stats = get_transport_stats()
+    finally:
+        monkeypatch.delenv('META_GRAPH_URL')
+        configure_transport()
+
+    assert stats['requests'] - served_before == fake_meta.stats['requests'] > 1
+    # Sequential syncs: one socket serves every request
+    assert stats['connections_opened'] == fake_meta.stats['connections'] == 1
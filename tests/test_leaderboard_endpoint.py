@@ -0,0 +1,82 @@
+from types import SimpleNamespace
+
+import pytest
+
+import main
+
+SESSIONS = {'token-alice': 'alice@example.com', 'token-bob': 'bob@example.com'}
+USERS = {'alice@example.com': 1, 'bob@example.com': 2}
+
+
+class StubSupabase:
+
+    created = 0
+
+    def __init__(self):
+        StubSupabase.created += 1
+        self.auth = SimpleNamespace(get_user=self.get_user)
+        self.auth_calls = 0
+
+    def get_user(self, token):
+        self.auth_calls += 1
+        if token not in SESSIONS:
+            raise ValueError('invalid JWT')
+        return SimpleNamespace(user=SimpleNamespace(email=SESSIONS[token]))
+
+    def table(self, name):
+        assert name == 'users'
+        query = SimpleNamespace()
+        query.select = lambda columns: query
+        query.eq = lambda column, value: SimpleNamespace(
+            execute=lambda: SimpleNamespace(data=[{'id': USERS[value]}] if value in USERS else [])
+        )
+        return query
+
+
+@pytest.fixture
+def client(monkeypatch):
+    served = []
+
+    def leaderboard(supabase, user_id, start, end, limit):
+        served.append((user_id, limit))
+        return [{'creative_id': 'c1'}], 'cache'
+
+    monkeypatch.setattr(main, 'get_supabase_client', StubSupabase)
+    monkeypatch.setattr(main, '_supabase_client', None)
+    monkeypatch.setattr(StubSupabase, 'created', 0)
+    main.session_cache.clear()
+    monkeypatch.setattr(main, 'get_creative_leaderboard', leaderboard)
+    client = main.app.test_client()
+    client.served = served
+    return client
+
+
+def test_requires_a_session(client):
+    assert client.get('/leaderboard?user_id=1').status_code == 401
+    assert client.get('/leaderboard?user_id=1', headers={'Authorization': 'Bearer forged'}).status_code == 401
+    assert client.served == []
+
+
+def test_serves_only_the_signed_in_user(client):
+    alice = {'Authorization': 'Bearer token-alice'}
+
+    assert client.get('/leaderboard?user_id=2', headers=alice).status_code == 403
+    response = client.get('/leaderboard', headers=alice)
+    assert response.status_code == 200 and response.get_json()['data'] == [{'creative_id': 'c1'}]
+    assert client.get('/leaderboard?user_id=1&limit=5', headers=alice).status_code == 200
+    assert client.served == [(1, 0), (1, 5)]
+
+
+def test_rejects_negative_limit(client):
+    response = client.get('/leaderboard?limit=-1', headers={'Authorization': 'Bearer token-bob'})
+    assert response.status_code == 400
+    assert client.served == []
+
+
+def test_reuses_the_client_and_the_resolved_session(client):
+    alice = {'Authorization': 'Bearer token-alice'}
+    for _ in range(3):
+        assert client.get('/leaderboard', headers=alice).status_code == 200
+
+    assert StubSupabase.created == 1
+    assert main._supabase_client.auth_calls == 1
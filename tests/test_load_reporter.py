@@ -0,0 +1,106 @@
+import json
+
+from lib.services.common import load_reporter as load_reportermodule
+from lib.services.common.load_reporter import LoadReporter, parse_meta_usage
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+def usage_headers(app=None, account=None, business=None):
+    headers = {}
+    if app is not None:
+        headers['x-app-usage'] = json.dumps(app)
+    if account is not None:
+        headers['x-ad-account-usage'] = json.dumps(account)
+    if business is not None:
+        headers['x-business-use-case-usage'] = json.dumps(business)
+    return headers
+
+
+def test_parse_meta_usage():
+    headers = usage_headers(
+        app={'call_count': 12, 'total_cputime': 40, 'total_time': 7},
+        account={'acc_id_util_pct': 100, 'reset_time_duration': 90},
+        business={'555': [{'type': 'ads_insights', 'call_count': 3, 'total_cputime': 101,
+                           'total_time': 5, 'estimated_time_to_regain_access': 2}]}
+    )
+    usages = parse_meta_usage(headers, '/v19.0/act_1/insights')
+
+    assert sorted(usages) == [
+        ('account:act_1', 100.0, 90.0),
+        ('app', 40.0, 0.0),
+        ('buc:555:ads_insights', 101.0, 120.0),
+    ]
+
+
+def test_parse_meta_usage_ignores_malformed_headers():
+    headers = {'x-app-usage': 'not json', 'x-ad-account-usage': json.dumps({'acc_id_util_pct': 20})}
+    assert parse_meta_usage(headers, '/v19.0/act_2/ads') == [('account:act_2', 20.0, 0.0)]
+    # Below 100% the account reset time is not a time to regain access
+    headers = usage_headers(account={'acc_id_util_pct': 99, 'reset_time_duration': 90})
+    assert parse_meta_usage(headers, '/v19.0/act_2/ads') == [('account:act_2', 99.0, 0.0)]
+
+
+def make_reporter(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(load_reportermodule.time, 'monotonic', clock)
+    return LoadReporter(meta_usage_threshold=90, usage_validity_seconds=60, usage_window_seconds=300), clock
+
+
+def test_account_usage_is_reported_but_keeps_the_instance_ready(monkeypatch):
+    reporter, _ = make_reporter(monkeypatch)
+    reporter.record_meta_response({
+        'path': '/v19.0/act_1/insights',
+        'usage_headers': usage_headers(
+            account={'acc_id_util_pct': 100, 'reset_time_duration': 90},
+            business={'555': [{'type': 'ads_insights', 'call_count': 100,
+                               'estimated_time_to_regain_access': 5}]}
+        )
+    })
+
+    report = reporter.snapshot()
+    assert report['ready']
+    assert report['meta']['account_usage'] == {
+        'account:act_1': {'usage_pct': 100.0, 'regain_access_seconds': 90.0},
+        'buc:555:ads_insights': {'usage_pct': 100.0, 'regain_access_seconds': 300.0},
+    }
+
+
+def test_high_app_usage_expires_after_the_validity_period(monkeypatch):
+    reporter, clock = make_reporter(monkeypatch)
+    reporter.record_meta_response({'path': '/v19.0/act_1/ads', 'usage_headers': usage_headers(app={'call_count': 95})})
+
+    report = reporter.snapshot()
+    assert not report['ready']
+    assert report['meta']['max_usage_pct'] == 95.0
+
+    # Well within the usage window, but the report is no longer current
+    clock.now += 61
+    report = reporter.snapshot()
+    assert report['ready']
+    assert report['meta']['usage_reports'] == 1
+
+
+def test_rate_limit_makes_the_instance_not_ready_until_it_is_lifted(monkeypatch):
+    reporter, clock = make_reporter(monkeypatch)
+    reporter.record_rate_limit(30)
+
+    assert not reporter.snapshot()['ready']
+    clock.now += 31
+    assert reporter.snapshot()['ready']
+
+
+def test_account_rate_limit_is_reported_but_keeps_the_instance_ready(monkeypatch):
+    reporter, _ = make_reporter(monkeypatch)
+    reporter.record_rate_limit(60, app_wide=False)
+
+    report = reporter.snapshot()
+    assert report['ready']
+    assert report['meta']['account_rate_limit_errors'] == 1
+    assert report['meta']['rate_limit_errors'] == 0
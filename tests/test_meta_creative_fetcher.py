@@ -0,0 +1,117 @@
+import json
+import threading
+
+import pytest
+from facebook_business.adobjects.ad import Ad
+from facebook_business.exceptions import FacebookRequestError
+
+from lib.services.common.load_reporter import LoadReporter
+from lib.services.connector import meta_creative_fetcher
+from lib.services.connector.http_transport import configure_transport
+from lib.services.connector.meta_creative_fetcher import fetch_creative_performance
+
+
+@pytest.fixture
+def graph_api(fake_meta, monkeypatch):
+    # Small pages so the accounts span several of them
+    monkeypatch.setattr(fake_meta, 'page_size', 25)
+    monkeypatch.setenv('META_GRAPH_URL', fake_meta.url)
+    configure_transport()
+    yield fake_meta
+    monkeypatch.delenv('META_GRAPH_URL')
+    configure_transport()
+
+
+def test_checkpoints_carry_cursors_not_insights_rows(graph_api, monkeypatch):
+    monkeypatch.setattr(meta_creative_fetcher, 'CHECKPOINT_EVERY_PAGES', 1)
+    checkpoints, pages = [], {}
+
+    data = fetch_creative_performance(
+        'act_1', 'token-1',
+        on_checkpoint=lambda state: checkpoints.append(json.loads(json.dumps(state))),
+        on_insights_page=lambda page, rows: pages.setdefault(page, rows)
+    )
+
+    total_rows = graph_api.ads_per_account * graph_api.days
+    assert len(data['performance']) == total_rows
+    assert sorted(pages) == list(range(len(pages))) and len(pages) > 1
+    assert sum(len(rows) for rows in pages.values()) == total_rows
+    assert all('insights_rows' not in state for state in checkpoints)
+    # Checkpoints stay small: no state is anywhere near the size of the rows
+    assert max(len(json.dumps(state)) for state in checkpoints) < len(json.dumps(pages)) / 2
+
+
+def test_resume_from_stored_pages(graph_api, monkeypatch):
+    monkeypatch.setattr(meta_creative_fetcher, 'CHECKPOINT_EVERY_PAGES', 1)
+    checkpoints, pages = [], {}
+    full = fetch_creative_performance(
+        'act_2', 'token-2',
+        on_checkpoint=lambda state: checkpoints.append(json.loads(json.dumps(state))),
+        on_insights_page=lambda page, rows: pages.setdefault(page, rows)
+    )
+
+    # Interrupted after the second page: resume with the cursor and the stored pages
+    interrupted = next(s for s in checkpoints if s.get('insights_pages') == 2)
+    resume_state = dict(interrupted, insights_rows=[row for p in range(2) for row in pages[p]])
+    resumed_pages = {}
+    resumed = fetch_creative_performance(
+        'act_2', 'token-2',
+        resume_state=resume_state,
+        on_insights_page=lambda page, rows: resumed_pages.setdefault(page, rows)
+    )
+
+    assert min(resumed_pages) == 2
+    assert len(resumed['performance']) == len(full['performance'])
+    key = lambda row: (row['ad_id'], row['date'])
+    assert sorted(map(key, resumed['performance'])) == sorted(map(key, full['performance']))
+
+
+def test_concurrent_fetches_keep_their_own_tokens(graph_api):
+    # Two accounts fetched at once share the transport: each request must carry its own token
+    start = threading.Barrier(2)
+    results, errors = {}, []
+
+    def fetch(account):
+        try:
+            start.wait()
+            results[account] = fetch_creative_performance(f'act_{account}', f'token-{account}')
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=fetch, args=(account,)) for account in ('1', '2')]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(timeout=60)
+
+    assert not errors
+    assert graph_api.stats.get('token_crosstalk', 0) == 0
+    for account, data in results.items():
+        assert len(data['performance']) == graph_api.ads_per_account * graph_api.days
+        assert all(str(row['ad_id']).split('_')[1] == account for row in data['performance'])
+    assert sorted(results) == ['1', '2']
+
+
+def test_account_rate_limit_does_not_throttle_the_instance(graph_api, monkeypatch):
+    reporter = LoadReporter()
+    monkeypatch.setattr(meta_creative_fetcher, 'load_reporter', reporter)
+    monkeypatch.setattr(meta_creative_fetcher.time, 'sleep', lambda seconds: None)
+    get_by_ids = Ad.get_by_ids
+    calls = []
+
+    def rate_limited_once(*args, **kwargs):
+        calls.append(1)
+        if len(calls) == 1:
+            raise FacebookRequestError(
+                'Call was not successful', {}, 400, {},
+                json.dumps({'error': {'message': 'Calls to this api have exceeded the rate limit.', 'code': 613}})
+            )
+        return get_by_ids(*args, **kwargs)
+
+    monkeypatch.setattr(meta_creative_fetcher.Ad, 'get_by_ids', rate_limited_once)
+    data = fetch_creative_performance('act_1', 'token-1')
+
+    assert len(data['performance']) == graph_api.ads_per_account * graph_api.days
+    report = reporter.snapshot()
+    assert report['ready']
+    assert report['meta']['account_rate_limit_errors'] == 1
@@ -0,0 +1,98 @@
+from types import SimpleNamespace
+
+import pyarrow.dataset as ds
+import pytest
+from postgrest.exceptions import APIError
+
+from lib.services.connector.http_transport import configure_transport
+from lib.services.sync import meta_sync_service
+from lib.services.sync.meta_sync_service import ensure_fact_partitions, group_rows_by_partition, sync_meta_creative_data
+
+from conftest import FAKE_SUPABASE_KEY
+
+
+@pytest.fixture
+def sync_env(fake_meta, fake_supabase, tmp_path, monkeypatch):
+    # The worker's environment, pointed at the fake servers
+    monkeypatch.setenv('NEXT_PUBLIC_SUPABASE_URL', fake_supabase.url)
+    monkeypatch.setenv('SUPABASE_SERVICE_ROLE_KEY', FAKE_SUPABASE_KEY)
+    monkeypatch.setenv('META_GRAPH_URL', fake_meta.url)
+    monkeypatch.setenv('DEAD_LETTER_DIR', str(tmp_path / 'dead_letter'))
+    monkeypatch.delenv('SYNC_COORDINATION_ENABLED', raising=False)
+    monkeypatch.setattr(meta_sync_service, '_known_fact_partitions', set())
+    configure_transport()
+    yield tmp_path
+    monkeypatch.delenv('META_GRAPH_URL')
+    configure_transport()
+
+
+def test_sync_exports_parquet_files(sync_env, fake_meta, monkeypatch):
+    export_dir = sync_env / 'export'
+    monkeypatch.setenv('PARQUET_EXPORT_DIR', str(export_dir))
+
+    summary = sync_meta_creative_data(7, 'act_1', 'token-1', job_id='export-test')
+
+    assert 'Synced' in summary
+    assert list((export_dir / 'dim_creatives' / 'user_id=7').glob('*.parquet'))
+    parts = list((export_dir / 'fact_creative_daily' / 'user_id=7').glob('date=*/*.parquet'))
+    assert len(parts) == fake_meta.days
+
+    facts = ds.dataset(export_dir / 'fact_creative_daily', partitioning='hive').to_table()
+    assert facts.num_rows == fake_meta.ads_per_account * fake_meta.days
+    assert set(facts.column('user_id').to_pylist()) == {7}
+
+
+class RpcRecorder:
+
+    def __init__(self):
+        self.calls = []
+
+    def rpc(self, name, args):
+        self.calls.append((name, args))
+        return SimpleNamespace(execute=lambda: SimpleNamespace(data=1))
+
+
+def test_rows_are_grouped_by_month_oldest_first():
+    rows = [{'date': d} for d in ('2025-01-02', '2024-12-31', '2025-01-01', '2024-11-30')]
+
+    groups = group_rows_by_partition(rows)
+
+    assert list(groups) == ['2024-11', '2024-12', '2025-01']
+    assert [r['date'] for r in groups['2025-01']] == ['2025-01-02', '2025-01-01']
+
+
+def test_partitions_are_ensured_once_across_the_year_boundary(monkeypatch):
+    monkeypatch.setattr(meta_sync_service, '_known_fact_partitions', set())
+    client = RpcRecorder()
+
+    ensure_fact_partitions(client, ['2024-11-30', '2025-01-02'])
+    # December was created with the span even though no row fell in it
+    ensure_fact_partitions(client, ['2024-12-15', '2025-01-31'])
+
+    assert client.calls == [
+        ('ensure_fact_creative_daily_partitions', {'p_start': '2024-11-01', 'p_end': '2025-01-01'})
+    ]
+    assert meta_sync_service._known_fact_partitions == {'2024-11', '2024-12', '2025-01'}
+
+
+def test_dropped_partition_is_recreated_and_the_batch_retried(sync_env, fake_supabase, monkeypatch):
+    sync_meta_creative_data(7, 'act_1', 'token-1', job_id='first')
+    assert fake_supabase.stats['rpc:ensure_fact_creative_daily_partitions'] == 1
+
+    # The retention policy dropped a month this process still remembers
+    upsert = meta_sync_service.resilient_upsert
+    failures = []
+
+    def dropped_once(supabase, table, rows, *args, **kwargs):
+        if table == 'fact_creative_daily' and not failures:
+            failures.append(len(rows))
+            raise APIError({'code': '23514', 'message': 'no partition of relation "fact_creative_daily" found for row'})
+        return upsert(supabase, table, rows, *args, **kwargs)
+
+    monkeypatch.setattr(meta_sync_service, 'resilient_upsert', dropped_once)
+    rows_before = fake_supabase.stats['rows:fact_creative_daily']
+
+    sync_meta_creative_data(7, 'act_1', 'token-1', job_id='second')
+
+    assert fake_supabase.stats['rpc:ensure_fact_creative_daily_partitions'] == 2
+    assert fake_supabase.stats['rows:fact_creative_daily'] - rows_before == rows_before
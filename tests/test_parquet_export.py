@@ -0,0 +1,55 @@
+from datetime import date
+
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+
+from lib.services.sync.parquet_export import ParquetExporter
+
+
+def performance_row(ad_id, day, spend):
+    return {
+        'creative_id': 'uuid-1', 'user_id': 7, 'ad_id': ad_id, 'ad_name': 'Ad', 'date': day,
+        'spend': spend, 'impressions': 10, 'clicks': 1, 'link_clicks': 1, 'purchases': 0,
+        'revenue': 0, 'currency': 'USD', 'updated_at': '2025-01-16T10:00:00'
+    }
+
+
+def export_two_days(root):
+    exporter = ParquetExporter(str(root))
+    published = []
+    exporter.add_consumer(lambda table, batch: published.append((table, batch)))
+    written = exporter.export(
+        7,
+        [{'platform_id': 'cr_1', 'platform': 'meta', 'name': 'Creative', 'updated_at': '2025-01-16T10:00:00'}],
+        [performance_row('ad_1', '2025-01-14', 12.5), performance_row('ad_2', '2025-01-15', 3)],
+        job_id='7:act_1:last_3d:2025-01-16'
+    )
+    return written, published
+
+
+def test_partitioned_dataset_reads_back(tmp_path):
+    written, _ = export_two_days(tmp_path)
+    assert written == {'dim_creatives': 1, 'fact_creative_daily': 2}
+
+    facts = pq.read_table(tmp_path / 'fact_creative_daily')
+    assert facts.num_rows == 2
+    assert sorted(facts.column('ad_id').to_pylist()) == ['ad_1', 'ad_2']
+
+    dataset = ds.dataset(tmp_path / 'fact_creative_daily', partitioning='hive')
+    table = dataset.to_table()
+    assert set(table.column('user_id').to_pylist()) == {7}
+    assert sorted(str(d) for d in table.column('date').to_pylist()) == ['2025-01-14', '2025-01-15']
+
+    creatives = pq.read_table(tmp_path / 'dim_creatives')
+    assert creatives.column('platform_id').to_pylist() == ['cr_1']
+
+
+def test_files_leave_partition_keys_to_the_path(tmp_path):
+    _, published = export_two_days(tmp_path)
+
+    part = next((tmp_path / 'fact_creative_daily' / 'user_id=7' / 'date=2025-01-14').glob('*.parquet'))
+    names = pq.read_schema(part).names
+    assert 'user_id' not in names and 'date' not in names
+    # Consumers still get complete rows
+    table, batch = next(p for p in published if p[0] == 'fact_creative_daily')
+    assert batch.column('date').to_pylist() == [date(2025, 1, 14)]
@@ -0,0 +1,134 @@
+import json
+
+import httpx
+import pytest
+from postgrest.exceptions import APIError
+
+from lib.services.sync import resilient_upsert as upsert_module
+from lib.services.sync.resilient_upsert import is_fatal_error, is_transient_error, resilient_upsert
+
+
+class StubSupabase:
+    """
+    Records upserts; `reject(rows)` returns the error for a batch, or None to accept it.
+    """
+
+    def __init__(self, reject):
+        self.reject = reject
+        self.requests = []
+        self.written = []
+
+    def table(self, name):
+        return self
+
+    def upsert(self, rows, on_conflict=None):
+        self._rows = rows
+        return self
+
+    def execute(self):
+        self.requests.append(len(self._rows))
+        error = self.reject(self._rows)
+        if error is not None:
+            raise error
+        self.written.extend(self._rows)
+
+
+def api_error(code, message='error'):
+    return APIError({'code': code, 'message': message, 'details': None, 'hint': None})
+
+
+@pytest.fixture(autouse=True)
+def dead_letter_dir(tmp_path, monkeypatch):
+    monkeypatch.setenv('DEAD_LETTER_DIR', str(tmp_path))
+    monkeypatch.setattr(upsert_module.time, 'sleep', lambda seconds: None)
+    return tmp_path
+
+
+def test_bisection_isolates_bad_rows(dead_letter_dir):
+    rows = [{'n': n} for n in range(16)]
+    bad = {3, 11}
+    client = StubSupabase(
+        lambda batch: api_error('22003', 'numeric field overflow') if any(r['n'] in bad for r in batch) else None
+    )
+
+    result = resilient_upsert(client, 'fact_creative_daily', rows, 'ad_id,date,user_id', job_id='job-1')
+
+    assert sorted(r['n'] for r in result['dead_lettered']) == [3, 11]
+    assert sorted(r['n'] for r in result['committed']) == [n for n in range(16) if n not in bad]
+    assert len(client.written) == 14
+    # k * log2(n) extra requests, not one per row
+    assert len(client.requests) <= 1 + 2 * 2 * 4
+
+    lines = [json.loads(line) for f in dead_letter_dir.iterdir() for line in f.read_text().splitlines()]
+    assert [(l['job_id'], l['row']['n']) for l in lines] == [('job-1', 3), ('job-1', 11)]
+
+
+@pytest.mark.parametrize('error', [
+    api_error('42501', 'permission denied for table fact_creative_daily'),
+    api_error('42703', 'column "revenue" does not exist'),
+    api_error('42P01', 'relation "fact_creative_daily" does not exist'),
+    api_error('PGRST204', "Could not find the 'revenue' column in the schema cache"),
+    api_error('23514', 'no partition of relation "fact_creative_daily" found for row'),
+    api_error('401', 'Unauthorized'),
+])
+def test_batch_wide_errors_are_raised_without_bisecting(error, dead_letter_dir):
+    client = StubSupabase(lambda batch: error)
+
+    with pytest.raises(APIError):
+        resilient_upsert(client, 'fact_creative_daily', [{'n': n} for n in range(100)], 'ad_id,date,user_id')
+
+    assert client.requests == [100]
+    assert not list(dead_letter_dir.iterdir())
+
+
+@pytest.mark.parametrize('error', [
+    TypeError('Object of type Decimal is not JSON serializable'),
+    httpx.HTTPStatusError('Conflict', request=httpx.Request('POST', 'http://db'), response=httpx.Response(409)),
+])
+def test_non_database_errors_are_raised_without_bisecting(error, dead_letter_dir):
+    client = StubSupabase(lambda batch: error)
+
+    with pytest.raises(type(error)):
+        resilient_upsert(client, 'fact_creative_daily', [{'n': n} for n in range(100)], 'ad_id,date,user_id')
+
+    assert client.requests == [100]
+    assert not list(dead_letter_dir.iterdir())
+
+
+def test_transient_errors_are_retried_then_raised():
+    attempts = []
+
+    def reject(batch):
+        attempts.append(len(batch))
+        return api_error('40P01', 'deadlock detected') if len(attempts) < 3 else None
+
+    client = StubSupabase(reject)
+    result = resilient_upsert(client, 't', [{'n': 1}, {'n': 2}], 'n')
+    assert len(result['committed']) == 2 and attempts == [2, 2, 2]
+
+    always = StubSupabase(lambda batch: api_error('503', 'Service Unavailable'))
+    with pytest.raises(APIError):
+        resilient_upsert(always, 't', [{'n': 1}], 'n')
+    assert len(always.requests) == upsert_module.MAX_RETRIES + 1
+
+
+def test_oversized_batch_is_raised_only_when_asked():
+    timeout = api_error('57014', 'canceling statement due to statement timeout')
+    client = StubSupabase(lambda batch: timeout if len(batch) > 2 else None)
+
+    with pytest.raises(APIError):
+        resilient_upsert(client, 't', [{'n': n} for n in range(4)], 'n', raise_oversized=True)
+    assert client.requests == [4]
+
+
+def test_error_classification():
+    assert is_fatal_error(api_error('42501'))
+    assert is_fatal_error(api_error('PGRST301', 'JWT expired'))
+    assert not is_fatal_error(api_error('23503', 'violates foreign key constraint'))
+    assert not is_fatal_error(api_error('22003', 'numeric field overflow'))
+    assert not is_fatal_error(ValueError('not an API error'))
+
+    assert is_transient_error(api_error('57014'))
+    assert is_transient_error(api_error('502'))
+    assert not is_transient_error(api_error('23505'))
+    assert not is_transient_error(api_error('42501'))
@@ -0,0 +1,46 @@
+import base64
+import json
+import time
+
+from lib.services.common import session_cache as session_cache_module
+from lib.services.common.session_cache import SessionCache
+
+
+def jwt(exp):
+    payload = base64.urlsafe_b64encode(json.dumps({'sub': 'u', 'exp': exp}).encode()).rstrip(b'=').decode()
+    return f'header.{payload}.signature'
+
+
+def test_entries_expire_after_the_ttl(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(session_cache_module.time, 'monotonic', lambda: now[0])
+    cache = SessionCache(ttl_seconds=60)
+
+    cache.put('opaque-token', 7)
+    assert cache.get('opaque-token') == 7
+    now[0] += 61
+    assert cache.get('opaque-token') is None
+
+
+def test_entries_never_outlive_the_token():
+    cache = SessionCache(ttl_seconds=60)
+
+    cache.put(jwt(time.time() - 1), 7)
+    assert cache.get(jwt(time.time() - 1)) is None
+
+    token = jwt(time.time() + 3600)
+    cache.put(token, 8)
+    assert cache.get(token) == 8
+
+
+def test_least_recently_used_tokens_are_evicted():
+    cache = SessionCache(max_entries=2)
+    cache.put('a', 1)
+    cache.put('b', 2)
+    assert cache.get('a') == 1
+    cache.put('c', 3)
+
+    assert cache.get('b') is None
+    assert (cache.get('a'), cache.get('c')) == (1, 3)
+    # Tokens are not kept in clear
+    assert 'a' not in cache._entries
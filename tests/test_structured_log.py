@@ -0,0 +1,99 @@
+import io
+import json
+import threading
+
+import pytest
+
+from lib.services.common import structured_log
+from lib.services.common.structured_log import configure_logging, flush_logging, get_logger, log_context
+
+
+@pytest.fixture
+def output(monkeypatch):
+    stream = io.StringIO()
+    monkeypatch.setattr(structured_log, '_dropped', 0)
+    configure_logging(level='DEBUG', fmt='json', sample_every=10, queue_size=100, stream=stream)
+
+    def records():
+        flush_logging()
+        return [json.loads(line) for line in stream.getvalue().splitlines()]
+
+    yield records
+    # Back to the environment's configuration for the other tests
+    configure_logging()
+
+
+def test_sampled_events_keep_one_in_n(output):
+    log = get_logger('test')
+    for n in range(25):
+        log.debug('batch_upserted', sample=True, n=n)
+        log.debug('sync_started', n=n)
+
+    records = output()
+    sampled = [r for r in records if r['message'] == 'batch_upserted']
+    assert [r['n'] for r in sampled] == [0, 10, 20]
+    assert all(r['sampled_1_in'] == 10 for r in sampled)
+    assert len([r for r in records if r['message'] == 'sync_started']) == 25
+
+
+def test_records_carry_the_context_of_their_own_thread(output):
+    log = get_logger('test')
+    start = threading.Barrier(2)
+
+    def sync(job_id):
+        with log_context(job_id=job_id, user_id=7):
+            start.wait()
+            for n in range(20):
+                log.info('batch_upserted', n=n)
+            with log_context(ad_account_id=f'act_{job_id}'):
+                log.info('sync_completed')
+
+    threads = [threading.Thread(target=sync, args=(job_id,)) for job_id in ('a', 'b')]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    log.info('outside')
+
+    records = output()
+    for job_id in ('a', 'b'):
+        own = [r for r in records if r.get('job_id') == job_id]
+        assert len(own) == 21 and all(r['user_id'] == 7 for r in own)
+        assert [r.get('ad_account_id') for r in own if r['message'] == 'sync_completed'] == [f'act_{job_id}']
+        # Nested blocks do not outlive their scope
+        assert not any('ad_account_id' in r for r in own if r['message'] == 'batch_upserted')
+    outside = next(r for r in records if r['message'] == 'outside')
+    assert 'job_id' not in outside
+
+
+def test_full_queue_drops_records_and_reports_them(output):
+    stream = io.StringIO()
+    configure_logging(level='DEBUG', fmt='json', queue_size=2, stream=stream)
+    log = get_logger('test')
+
+    # With the listener stopped nothing drains the queue
+    structured_log._listener.stop()
+    for n in range(5):
+        log.info('batch_upserted', n=n)
+    assert structured_log._dropped == 3
+
+    structured_log._listener.start()
+    flush_logging()
+    records = [json.loads(line) for line in stream.getvalue().splitlines()]
+    assert [r.get('n') for r in records if r['message'] == 'batch_upserted'] == [0, 1]
+    notice = next(r for r in records if r['message'] == 'log_records_dropped')
+    assert notice['dropped'] == 3 and notice['severity'] == 'WARNING'
+    assert structured_log._dropped == 0
+
+
+def test_exception_traceback_is_captured_in_the_logging_thread(output):
+    log = get_logger('test')
+    try:
+        raise ValueError('numeric field overflow')
+    except ValueError:
+        log.exception('facts_upsert_failed', rows=3)
+
+    record = next(r for r in output() if r['message'] == 'facts_upsert_failed')
+    assert record['severity'] == 'ERROR' and record['rows'] == 3
+    assert 'Traceback' in record['exception']
+    assert 'ValueError: numeric field overflow' in record['exception']
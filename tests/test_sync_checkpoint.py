@@ -0,0 +1,158 @@
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+
+from lib.services.sync.sync_checkpoint import SyncCheckpoint
+
+
+class StubTable:
+
+    def __init__(self, client, name):
+        self.client, self.name = client, name
+        self.filters, self.action, self.payload = [], 'select', None
+
+    def select(self, columns):
+        return self
+
+    def upsert(self, payload, on_conflict=None):
+        self.action, self.payload, self.on_conflict = 'upsert', payload, on_conflict
+        return self
+
+    def update(self, payload):
+        self.action, self.payload = 'update', payload
+        return self
+
+    def delete(self):
+        self.action = 'delete'
+        return self
+
+    def eq(self, column, value):
+        self.filters.append(lambda row: row.get(column) == value)
+        return self
+
+    def gte(self, column, value):
+        self.filters.append(lambda row: row.get(column) >= value)
+        return self
+
+    def lte(self, column, value):
+        self.filters.append(lambda row: row.get(column) <= value)
+        return self
+
+    def lt(self, column, value):
+        self.filters.append(lambda row: row.get(column) < value)
+        return self
+
+    def order(self, column):
+        self.order_by = column
+        return self
+
+    def execute(self):
+        if self.name in self.client.failing:
+            raise ConnectionError(f'{self.name} unavailable')
+        rows = self.client.tables.setdefault(self.name, [])
+        matching = [r for r in rows if all(f(r) for f in self.filters)]
+        if self.action == 'upsert':
+            keys = self.on_conflict.split(',')
+            rows[:] = [r for r in rows if any(r.get(k) != self.payload.get(k) for k in keys)]
+            rows.append(dict(self.payload))
+        elif self.action == 'update':
+            for row in matching:
+                row.update(self.payload)
+        elif self.action == 'delete':
+            rows[:] = [r for r in rows if r not in matching]
+        return SimpleNamespace(data=sorted(matching, key=lambda r: r.get('page', 0)))
+
+
+class StubSupabase:
+
+    def __init__(self):
+        self.tables, self.failing = {}, set()
+
+    def table(self, name):
+        return StubTable(self, name)
+
+
+def test_resume_reads_pages_back():
+    client = StubSupabase()
+    checkpoint = SyncCheckpoint(client, 'job-1', 7, 'act_1')
+    for page in range(45):
+        checkpoint.save_page(page, [{'ad_id': f'ad_{page}_{n}'} for n in range(2)])
+    checkpoint.save(stage='fetching', fetch={'insights_after': 'c45', 'insights_pages': 45})
+
+    state = SyncCheckpoint(client, 'job-1', 7, 'act_1').load()
+
+    rows = state['fetch']['insights_rows']
+    assert len(rows) == 90 and rows[0]['ad_id'] == 'ad_0_0' and rows[-1]['ad_id'] == 'ad_44_1'
+    # The checkpoint row itself never held the rows
+    assert 'insights_rows' not in client.tables['sync_checkpoints'][0]['state']['fetch']
+
+
+def test_missing_page_restarts_the_job():
+    client = StubSupabase()
+    checkpoint = SyncCheckpoint(client, 'job-1', 7, 'act_1')
+    checkpoint.save_page(0, [{'ad_id': 'a'}])
+    checkpoint.save(stage='facts', fetch={'insights_pages': 2, 'insights_complete': True})
+    checkpoint.save_progress(facts_committed=100)
+
+    resumed = SyncCheckpoint(client, 'job-1', 7, 'act_1')
+    assert resumed.load() == {}
+    assert resumed.progress == {}
+
+
+def test_failed_page_write_stops_checkpointing():
+    client = StubSupabase()
+    checkpoint = SyncCheckpoint(client, 'job-1', 7, 'act_1')
+    checkpoint.save(stage='fetching', fetch={'insights_pages': 0})
+
+    client.failing.add('sync_checkpoint_pages')
+    checkpoint.save_page(0, [{'ad_id': 'a'}])
+    client.failing.clear()
+    checkpoint.save(stage='fetching', fetch={'insights_pages': 1})
+
+    assert checkpoint.disabled
+    assert client.tables['sync_checkpoints'] == []
+
+
+def test_first_page_creates_the_checkpoint_it_belongs_to():
+    client = StubSupabase()
+    checkpoint = SyncCheckpoint(client, 'job-1', 7, 'act_1')
+    checkpoint.load()
+    checkpoint.save_page(0, [{'ad_id': 'a'}])
+
+    # Pages reference their checkpoint row, so it must exist first
+    assert [r['job_id'] for r in client.tables['sync_checkpoints']] == ['job-1']
+
+
+def test_job_of_another_user_or_account_starts_fresh():
+    client = StubSupabase()
+    owner = SyncCheckpoint(client, 'job-1', 7, 'act_1')
+    owner.save_page(0, [{'ad_id': 'a'}])
+    owner.save(stage='creatives_synced', fetch={'insights_pages': 1}, platform_id_to_uuid={'cr_1': 'uuid-1'})
+    stored = [dict(r) for r in client.tables['sync_checkpoints']]
+
+    for user_id, ad_account_id in ((8, 'act_1'), (7, 'act_2')):
+        other = SyncCheckpoint(client, 'job-1', user_id, ad_account_id)
+        assert other.load() == {}
+        other.save_page(0, [{'ad_id': 'b'}])
+        other.save(stage='facts', platform_id_to_uuid={})
+        other.clear()
+
+    # The owner's checkpoint and pages are untouched
+    assert client.tables['sync_checkpoints'] == stored
+    assert client.tables['sync_checkpoint_pages'][0]['rows'] == [{'ad_id': 'a'}]
+    # The same account written without the act_ prefix still resumes
+    assert SyncCheckpoint(client, 'job-1', 7, '1').load()['platform_id_to_uuid'] == {'cr_1': 'uuid-1'}
+
+
+def test_completed_job_purges_abandoned_checkpoints():
+    client = StubSupabase()
+    stale = (datetime.utcnow() - timedelta(days=3)).isoformat()
+    client.tables['sync_checkpoints'] = [
+        {'job_id': 'abandoned', 'user_id': 9, 'ad_account_id': 'act_9', 'updated_at': stale},
+        {'job_id': 'running', 'user_id': 8, 'ad_account_id': 'act_8', 'updated_at': datetime.utcnow().isoformat()},
+    ]
+    checkpoint = SyncCheckpoint(client, 'job-1', 7, 'act_1')
+    checkpoint.load()
+    checkpoint.save(stage='facts')
+    checkpoint.clear()
+
+    assert [r['job_id'] for r in client.tables['sync_checkpoints']] == ['running']